@@ -0,0 +1,145 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from . import build_pipeline, external_tools
+
+# Changed whenever what's stored in a cache entry changes
+CACHE_VERSION = 2
+
+# Name of the file in a cache entry holding the tool's output, replayed on a hit so warnings are still reported
+OUTPUT_LOG_NAME = "output.txt"
+
+# Hashes of tool binaries, so they're only read again when they change (see build_pipeline.hash_file_cached)
+tool_hashes = {}
+
+# Returns the default cache directory, used when no directory is set
+def get_default_cache_dir():
+    return os.path.join(tempfile.gettempdir(), "BlendToSMBStage2", "artifacts")
+
+# Outputs of a single run of an external tool, stored under a hash of everything the tool reads.
+# Only touches files, so it can be used from a worker thread.
+class ToolArtifacts:
+    # 'inputs' is a list of (name, path) of every file the tool reads, with names that don't depend on where the
+    # stage is, 'options' anything else that changes the output, and 'outputs' a list of (name, path) of the files
+    # the tool writes
+    def __init__(self, cache_dir, tool_path, options, inputs, outputs):
+        self.outputs = outputs
+
+        key_hash = hashlib.blake2b(digest_size=20)
+        key_hash.update(repr((CACHE_VERSION, build_pipeline.hash_file_cached(tool_path, tool_hashes), options)).encode())
+        for (name, path) in sorted(inputs):
+            key_hash.update(repr((name, build_pipeline.hash_file(path))).encode())
+        self.key = key_hash.hexdigest()
+        self.entry_dir = os.path.join(cache_dir, self.key[:2], self.key)
+
+    # Puts cached outputs in place, returning the tool's output lines, or None if they aren't cached
+    def restore(self):
+        if not all(os.path.isfile(os.path.join(self.entry_dir, name)) for (name, _) in self.outputs):
+            return None
+
+        for (name, path) in self.outputs:
+            _copy_into_place(os.path.join(self.entry_dir, name), path)
+
+        try:
+            with open(os.path.join(self.entry_dir, OUTPUT_LOG_NAME), "r", encoding="utf-8") as log_file:
+                return log_file.read().split("\n")
+        except OSError:
+            return []
+
+    # Called before running the tool. Old outputs are removed, so outputs left over from an earlier run are never
+    # stored if the tool fails.
+    def prepare_outputs(self):
+        for (_, path) in self.outputs:
+            if os.path.exists(path):
+                os.remove(path)
+
+    # Stores the outputs of a successful run of the tool
+    def store(self, output_lines):
+        if os.path.isdir(self.entry_dir) or not all(os.path.isfile(path) for (_, path) in self.outputs):
+            return
+
+        # Entries are written to a temporary directory first, so a partially written entry is never used
+        os.makedirs(os.path.dirname(self.entry_dir), exist_ok=True)
+        temp_dir = tempfile.mkdtemp(dir=os.path.dirname(self.entry_dir))
+        try:
+            for (name, path) in self.outputs:
+                shutil.copyfile(path, os.path.join(temp_dir, name))
+            with open(os.path.join(temp_dir, OUTPUT_LOG_NAME), "w", encoding="utf-8") as log_file:
+                log_file.write("\n".join(output_lines))
+            os.rename(temp_dir, self.entry_dir)
+        except OSError as e:
+            # Another export may have stored the same entry in the meantime
+            print(f"Failed to store tool outputs in cache: {e}")
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+# Copies a cached file into place. Outputs aren't hard linked to the cache, as the tools (and anything else writing to
+# the output paths, with or without the cache turned on) rewrite files in place, which would change the cache entry.
+def _copy_into_place(source_path, path):
+    temp_path = path + ".tmp"
+    shutil.copyfile(source_path, temp_path)
+    os.replace(temp_path, path)
+
+# Returns the name of an input file relative to the folder it's found from, so entries can be shared between stages
+# in different places
+def _get_input_name(prefix, path, base_dir):
+    try:
+        return prefix + os.path.relpath(path, base_dir)
+    except ValueError:
+        return prefix + path
+
+# Returns the artifacts of a GxModelViewer run with the given command line
+def get_gx_artifacts(cache_dir, gx_args):
+    obj_path = gx_args[gx_args.index("-importObjMtl") + 1]
+    obj_dir = os.path.dirname(obj_path)
+    inputs = [("obj", obj_path)]
+    for path in external_tools.get_obj_inputs(obj_path)[1:]:
+        inputs.append((_get_input_name("obj:", path, obj_dir), path))
+
+    preset_path = gx_args[gx_args.index("-setPresetFolder") + 1]
+    if os.path.isdir(preset_path):
+        for (dir_path, _, file_names) in os.walk(preset_path):
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name)
+                inputs.append((_get_input_name("preset:", path, preset_path), path))
+
+    options = ["-removeUnusedTextures" in gx_args]
+    if "-mergeGmaTpl" in gx_args:
+        merge_gma_path, merge_tpl_path = gx_args[gx_args.index("-mergeGmaTpl") + 1].split(",")
+        inputs.extend([("merge_gma", merge_gma_path), ("merge_tpl", merge_tpl_path)])
+        options.append("merge")
+
+    outputs = [("stage.gma", gx_args[gx_args.index("-exportGma") + 1]),
+               ("stage.tpl", gx_args[gx_args.index("-exportTpl") + 1])]
+    return ToolArtifacts(cache_dir, gx_args[0], options, inputs, outputs)
+
+# Returns the artifacts of a GxModelViewer run merging GMA/TPL pairs, with the given command line
+def get_gx_merge_artifacts(cache_dir, gx_args):
+    inputs = [("import_gma", gx_args[gx_args.index("-importGma") + 1]),
+              ("import_tpl", gx_args[gx_args.index("-importTpl") + 1])]
+    merge_index = 0
+    for (arg, value) in zip(gx_args, gx_args[1:]):
+        if arg == "-mergeGmaTpl":
+            merge_gma_path, merge_tpl_path = value.split(",")
+            inputs.extend([(f"merge_gma{merge_index}", merge_gma_path), (f"merge_tpl{merge_index}", merge_tpl_path)])
+            merge_index += 1
+
+    outputs = [("stage.gma", gx_args[gx_args.index("-exportGma") + 1]),
+               ("stage.tpl", gx_args[gx_args.index("-exportTpl") + 1])]
+    return ToolArtifacts(cache_dir, gx_args[0], ["merge_only", merge_index], inputs, outputs)
+
+# Returns the artifacts of a Workshop 2 run with the given command line. Workshop 2 also reads the OBJ the config
+# imports, for collision. If 'lz_path' is given, the LZ.RAW Workshop 2 writes is compressed into it afterwards (see
+# smb_lz.CompressingProcess), and the LZ is cached along with it.
+def get_ws_artifacts(cache_dir, ws_args, obj_path, lz_path=None):
+    config_path = next(arg[2:] for arg in ws_args[1:] if arg.startswith("-c"))
+    inputs = [("config", config_path), ("obj", obj_path)]
+
+    output_arg = next(arg for arg in ws_args[1:] if arg.startswith(("-s", "-o")))
+    options = [output_arg[:2]]
+    outputs = [("stage.lz" if output_arg.startswith("-s") else "stage.lz.raw", output_arg[2:])]
+    if lz_path is not None:
+        options.append("compressed")
+        outputs.append(("stage.lz", lz_path))
+    return ToolArtifacts(cache_dir, ws_args[0], options, inputs, outputs)
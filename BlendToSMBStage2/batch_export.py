@@ -0,0 +1,158 @@
+# Headless batch export of whole stage packs.
+#
+# Driver (plain Python, no Blender needed), exporting every .blend in a manifest with a pool of background Blender
+# processes and writing one JSON summary:
+#     python batch_export.py manifest.json --blender /path/to/blender --summary summary.json
+#
+# The manifest is either a JSON list of .blend paths, a JSON object with a "stages" list (and optionally "blender"),
+# or a text file with one .blend path per line. Relative paths are relative to the manifest.
+#
+# Single stage, from inside Blender with the add-on enabled:
+#     blender -b stage.blend --python-expr "from BlendToSMBStage2.BlendToSMBStage2 import batch_export; batch_export.export_open_file('result.json')"
+#
+# Each stage is exported with the same steps as the Build Stage operator, using the export paths saved in the .blend.
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of output lines kept from a Blender process that failed
+LOG_TAIL_LINES = 40
+
+# Returns a module of the add-on. When this file is run as a script by Blender, the add-on is imported by the name of
+# the folder it's installed in.
+def _get_addon_module(name):
+    if __package__:
+        return importlib.import_module("." + name, __package__)
+
+    import addon_utils
+
+    addon_name = os.path.basename(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    addon_utils.enable(addon_name, default_set=False)
+    return importlib.import_module(addon_name + ".BlendToSMBStage2." + name)
+
+# Exports the currently open .blend file. Returns a dict with the status, timing, warnings and errors of every step,
+# which is also written to 'result_path' as JSON if given.
+def export_open_file(result_path=None, compressed=True):
+    import bpy
+
+    stage_editor = _get_addon_module("stage_editor")
+    build_pipeline = _get_addon_module("build_pipeline")
+
+    start_time = time.perf_counter()
+    steps = stage_editor.get_build_steps(bpy.context.scene, compressed)
+    results = build_pipeline.run_build(steps)
+
+    result = {
+        "blend": bpy.data.filepath,
+        "status": "ok" if all(step_result.succeeded() for step_result in results.values()) else "failed",
+        "seconds": time.perf_counter() - start_time,
+        "steps": {name: {"status": step_result.status.lower(),
+                         "seconds": step_result.seconds,
+                         "warnings": step_result.warnings,
+                         "error": step_result.error} for (name, step_result) in results.items()},
+    }
+
+    if result_path is not None:
+        with open(result_path, "w") as result_file:
+            json.dump(result, result_file, indent=2)
+
+    return result
+
+# Reads the list of .blend files in a manifest, and the Blender executable it names if any
+def read_manifest(manifest_path):
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    blender_path = None
+
+    with open(manifest_path, "r") as manifest_file:
+        text = manifest_file.read()
+
+    try:
+        manifest = json.loads(text)
+    except json.JSONDecodeError:
+        manifest = [line.strip() for line in text.splitlines() if line.strip() != "" and not line.startswith("#")]
+
+    if isinstance(manifest, dict):
+        blender_path = manifest.get("blender")
+        manifest = manifest.get("stages", [])
+
+    return [os.path.join(manifest_dir, path) for path in manifest], blender_path
+
+# Exports a single .blend file in a background Blender process
+def export_blend(blender_path, blend_path, compressed, timeout):
+    start_time = time.perf_counter()
+    result_file, result_path = tempfile.mkstemp(suffix=".json")
+    os.close(result_file)
+
+    args = [blender_path, "-b", blend_path, "--python-exit-code", "1",
+            "--python-expr", f"import sys; sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r}); "
+                             f"import batch_export; batch_export.export_open_file({result_path!r}, {compressed!r})"]
+
+    print(f"Exporting {blend_path}...")
+    try:
+        # Python tracebacks of a failed export go to stderr, so it's kept in the log along with stdout
+        process = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
+        log = process.stdout.decode(errors="replace").splitlines()
+
+        try:
+            with open(result_path, "r") as result_json:
+                result = json.load(result_json)
+        except (OSError, json.JSONDecodeError):
+            result = {"status": "crashed", "returncode": process.returncode}
+
+        if result["status"] != "ok":
+            result["log"] = log[-LOG_TAIL_LINES:]
+    except subprocess.TimeoutExpired:
+        result = {"status": "timeout"}
+    finally:
+        os.remove(result_path)
+
+    result["blend"] = blend_path
+    result["total_seconds"] = time.perf_counter() - start_time
+    print(f"Finished {blend_path}: {result['status']} ({result['total_seconds']:.1f}s)")
+    return result
+
+# Exports every .blend file in a list with 'jobs' Blender processes at a time, returning the summary
+def run_batch(blend_paths, blender_path, jobs=None, compressed=True, timeout=None):
+    jobs = jobs or os.cpu_count() or 1
+    start_time = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        stages = list(executor.map(lambda blend_path: export_blend(blender_path, blend_path, compressed, timeout), blend_paths))
+
+    return {
+        "stages": stages,
+        "succeeded": sum(stage["status"] == "ok" for stage in stages),
+        "failed": sum(stage["status"] != "ok" for stage in stages),
+        "seconds": time.perf_counter() - start_time,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a pack of stages with background Blender processes")
+    parser.add_argument("manifest", help="JSON or text file listing the .blend files to export")
+    parser.add_argument("--blender", help="Blender executable (default: from the manifest, or 'blender')")
+    parser.add_argument("--jobs", type=int, default=None, help="Number of Blender processes to run at once (default: CPU count)")
+    parser.add_argument("--summary", default="export_summary.json", help="Path of the JSON summary to write")
+    parser.add_argument("--raw", action="store_true", help="Export LZ.RAW files instead of compressed LZ files")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds after which a single stage export is stopped")
+    args = parser.parse_args(argv)
+
+    blend_paths, manifest_blender_path = read_manifest(args.manifest)
+    blender_path = args.blender or manifest_blender_path or "blender"
+
+    summary = run_batch(blend_paths, blender_path, args.jobs, not args.raw, args.timeout)
+    with open(args.summary, "w") as summary_file:
+        json.dump(summary, summary_file, indent=2)
+
+    print(f"Exported {summary['succeeded']} of {len(blend_paths)} stages in {summary['seconds']:.1f}s, summary written to {args.summary}")
+    return 0 if summary["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
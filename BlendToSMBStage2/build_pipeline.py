@@ -0,0 +1,143 @@
+import hashlib
+import os
+import time
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Stamps of the inputs each step was last successfully run with, so steps whose inputs haven't changed can be skipped
+# step name -> stamp
+step_stamps = {}
+
+# Raised by a step that failed. The message is meant to be reported to the user.
+class BuildError(Exception):
+    pass
+
+# A single step of a build.
+# 'run' does the work, and returns a list of warnings to report. Steps with 'threaded' set must not touch any Blender
+# data, as they're run on a worker thread alongside other steps. Other steps are run one at a time on the main thread.
+# 'inputs' is a list of files the step reads, or a function returning one (called once the steps it depends on are
+# done). A step with inputs is skipped if its outputs exist and its inputs and 'key' are unchanged since it last ran.
+# Steps without inputs (ones that read the scene) always run.
+class BuildStep:
+    def __init__(self, name, run, *, depends=(), inputs=None, outputs=(), key=None, threaded=False):
+        self.name = name
+        self.run = run
+        self.depends = list(depends)
+        self.inputs = inputs
+        self.outputs = list(outputs)
+        self.key = key
+        self.threaded = threaded
+
+# Outcome of a step
+class StepResult:
+    def __init__(self, status, warnings=(), error=None, seconds=0.0):
+        # 'DONE', 'SKIPPED' (inputs unchanged), 'FAILED' or 'BLOCKED' (a step it depends on failed)
+        self.status = status
+        self.warnings = list(warnings)
+        self.error = error
+        self.seconds = seconds
+
+    def succeeded(self):
+        return self.status in ('DONE', 'SKIPPED')
+
+# Returns a hash of the contents of a file, or None if it doesn't exist
+def hash_file(path):
+    if not os.path.isfile(path):
+        return None
+
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        while chunk := file.read(1 << 20):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+# Returns a hash of the contents of a file like hash_file(), only reading the file again if its size or modification
+# time changed since it was last hashed. 'memo' maps paths to ((size, modification time), hash).
+def hash_file_cached(path, memo):
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        return None
+
+    stamp = (file_stat.st_size, file_stat.st_mtime_ns)
+    cached = memo.get(path)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, hash_file(path))
+        memo[path] = cached
+    return cached[1]
+
+# Returns a stamp of everything a step's output depends on, or None if the step always runs
+def _get_stamp(step):
+    if step.inputs is None:
+        return None
+
+    inputs = step.inputs() if callable(step.inputs) else step.inputs
+    return repr((step.key, [(path, hash_file(path)) for path in inputs]))
+
+def _run_step(step):
+    start_time = time.perf_counter()
+    try:
+        stamp = _get_stamp(step)
+        if stamp is not None and step_stamps.get(step.name) == stamp and all(os.path.exists(path) for path in step.outputs):
+            return StepResult('SKIPPED')
+
+        # Forget the old stamp first, so a step that fails halfway is run again next time
+        step_stamps.pop(step.name, None)
+        warnings = step.run()
+        if stamp is not None:
+            step_stamps[step.name] = stamp
+
+        return StepResult('DONE', warnings or [], seconds=time.perf_counter()-start_time)
+    except BuildError as e:
+        return StepResult('FAILED', error=str(e), seconds=time.perf_counter()-start_time)
+    except Exception as e:
+        traceback.print_exc()
+        return StepResult('FAILED', error=f"{step.name} failed: {e}", seconds=time.perf_counter()-start_time)
+
+# Runs a list of steps in dependency order, returning a dict of step name -> StepResult.
+# Threaded steps start as soon as the steps they depend on are done, so they run alongside each other and alongside
+# main thread steps. Steps depending on a step that failed aren't run.
+def run_build(steps, max_workers=2):
+    results = {}
+    pending = list(steps)
+    running = {}
+
+    def finish(step, result):
+        results[step.name] = result
+        if result.status == 'SKIPPED':
+            print(f"\t{step.name}: inputs unchanged, skipped")
+        elif result.status == 'DONE':
+            print(f"\t{step.name}: finished in {result.seconds:.2f}s")
+        else:
+            print(f"\t{step.name}: failed")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(pending) > 0 or len(running) > 0:
+            # Block steps depending on ones that failed
+            for step in [step for step in pending if any(dep in results and not results[dep].succeeded() for dep in step.depends)]:
+                pending.remove(step)
+                results[step.name] = StepResult('BLOCKED')
+                print(f"\t{step.name}: not run, a step it depends on failed")
+
+            ready = [step for step in pending if all(dep in results and results[dep].succeeded() for dep in step.depends)]
+
+            for step in [step for step in ready if step.threaded]:
+                pending.remove(step)
+                running[executor.submit(_run_step, step)] = step
+
+            main_thread_steps = [step for step in ready if not step.threaded]
+            if len(main_thread_steps) > 0:
+                step = main_thread_steps[0]
+                pending.remove(step)
+                finish(step, _run_step(step))
+                continue
+
+            if len(running) > 0:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(running.pop(future), future.result())
+            elif len(pending) > 0:
+                raise ValueError("Build steps have missing or circular dependencies: " + ", ".join(step.name for step in pending))
+
+    return results
@@ -0,0 +1,190 @@
+import bpy
+import hashlib
+import numpy as np
+
+from bpy.app.handlers import persistent
+from bpy_extras import anim_utils
+
+from . import generate_config
+
+# Cache of the serialized XML of objects from previous config exports, so objects that haven't changed since then
+# don't need to be resampled and regenerated.
+# object name -> (content hash, names of exported children, serialized XML fragment)
+fragment_cache = {}
+
+# Export settings the cached fragments were generated with. The whole cache is dropped when these change.
+cache_settings = None
+
+# IDs updated since the last export, as (id_type, name). Only cached objects affected by these are re-hashed,
+# everything else is reused as-is.
+dirty_ids = set()
+all_dirty = False
+
+# Keyframe properties that change how an F-curve evaluates
+KEYFRAME_FLOAT_PROPS = [("co", 2), ("handle_left", 2), ("handle_right", 2), ("back", 1), ("amplitude", 1), ("period", 1)]
+KEYFRAME_ENUM_PROPS = ["interpolation", "easing"]
+
+# Converts an ID property value into something with a stable repr
+def _get_prop_value(value):
+    if isinstance(value, bpy.types.ID):
+        return value.name
+    elif hasattr(value, "to_dict"):
+        return value.to_dict()
+    elif hasattr(value, "to_list"):
+        return value.to_list()
+    return value
+
+# Returns a list of the export settings serialized fragments depend on
+def _get_export_settings(context, indent):
+    scene = context.scene
+    return [scene.name, scene.frame_start, scene.frame_end, scene.render.fps, scene.export_timestep,
+            scene.export_value_round, scene.export_time_round, scene.optimize_keyframes,
+            scene.export_keyframe_tolerance, indent]
+
+# Adds everything about an object that the descriptors read to a hash.
+# Returns False if the object's exported data can't be derived from what's hashed.
+def _hash_object(content_hash, obj, animated):
+    content_hash.update(repr((obj.name, obj.type, obj.parent.name if obj.parent else None)).encode())
+    content_hash.update(repr([tuple(row) for row in obj.matrix_world]).encode())
+    content_hash.update(repr((tuple(obj.location), tuple(obj.rotation_euler), tuple(obj.scale))).encode())
+    content_hash.update(repr([(key, _get_prop_value(obj[key])) for key in obj.keys()]).encode())
+
+    # Some descriptors read properties of the parent item group
+    if obj.parent is not None:
+        content_hash.update(repr(obj.parent.get("collisionTriangleFlag", 0)).encode())
+
+    # Track paths are exported from their spline points
+    if obj.type == 'CURVE':
+        for spline in obj.data.splines:
+            points = np.empty(len(spline.points)*4, dtype=np.float32)
+            spline.points.foreach_get("co", points)
+            content_hash.update(points.tobytes())
+
+    if not animated or obj.animation_data is None or obj.animation_data.action is None:
+        return True
+
+    action = obj.animation_data.action
+    action_slot = obj.animation_data.action_slot
+    channelbag = anim_utils.action_get_channelbag_for_slot(action, action_slot)
+
+    # Animation that needs to be sampled frame by frame may depend on anything in the scene
+    if generate_config._requires_frame_set(obj, channelbag):
+        return False
+
+    for (data_path, index, _, _, _) in generate_config.SAMPLED_CHANNELS:
+        fcurve = channelbag.fcurves.find(data_path, index=index)
+        if fcurve is None:
+            content_hash.update(b"none")
+            continue
+        if len(fcurve.modifiers) > 0:
+            return False
+
+        keyframes = fcurve.keyframe_points
+        content_hash.update(repr((len(keyframes), fcurve.extrapolation)).encode())
+        for (prop, size) in KEYFRAME_FLOAT_PROPS:
+            values = np.empty(len(keyframes)*size, dtype=np.float32)
+            keyframes.foreach_get(prop, values)
+            content_hash.update(values.tobytes())
+        for prop in KEYFRAME_ENUM_PROPS:
+            content_hash.update(repr([getattr(keyframe, prop) for keyframe in keyframes]).encode())
+
+    return True
+
+# Returns whether an object may have changed since the last export
+def _is_dirty(obj):
+    if all_dirty or ('OBJECT', obj.name) in dirty_ids:
+        return True
+    if obj.data is not None and (obj.data.id_type, obj.data.name) in dirty_ids:
+        return True
+    if obj.animation_data is not None and obj.animation_data.action is not None:
+        return ('ACTION', obj.animation_data.action.name) in dirty_ids
+    return False
+
+# Starts a config export, dropping the cache if the export settings changed since the last one
+def begin_export(context, indent):
+    global cache_settings, all_dirty
+
+    settings = _get_export_settings(context, indent)
+    if settings != cache_settings:
+        fragment_cache.clear()
+        cache_settings = settings
+        all_dirty = True
+
+# Looks up the cached XML fragment of an exported object, with 'children' being any other objects exported as
+# part of it. Returns the content hash of the object and the fragment, or None if there's no up to date fragment.
+# The hash is None if the object can't be cached.
+def lookup_fragment(obj, children=(), animated=False):
+    child_names = [child.name for child in children]
+    entry = fragment_cache.get(obj.name)
+    if entry is not None and entry[1] == child_names and not any(_is_dirty(o) for o in (obj, *children)):
+        return entry[0], entry[2]
+
+    content_hash = hashlib.blake2b(digest_size=16)
+    if not _hash_object(content_hash, obj, animated):
+        return None, None
+    for child in children:
+        _hash_object(content_hash, child, False)
+    key = content_hash.digest()
+
+    if entry is not None and entry[0] == key:
+        fragment_cache[obj.name] = (key, child_names, entry[2])
+        return key, entry[2]
+    return key, None
+
+# Stores the XML fragment of an exported object
+def store_fragment(obj, key, fragment, children=()):
+    if key is not None:
+        fragment_cache[obj.name] = (key, [child.name for child in children], fragment)
+
+# Called once every exported object has been looked up. Changes made before this point are accounted for by the
+# hashes of the looked up objects, anything changed by the rest of the export is picked up again by the handler.
+def end_lookups():
+    global all_dirty
+
+    dirty_ids.clear()
+    all_dirty = False
+
+# Drops the whole cache
+def clear():
+    global cache_settings
+
+    fragment_cache.clear()
+    cache_settings = None
+
+@persistent
+def depsgraph_update_handler(scene, depsgraph):
+    if len(fragment_cache) == 0:
+        return
+
+    for update in depsgraph.updates:
+        updated_id = update.id.original
+        if updated_id.id_type == 'OBJECT':
+            # Item groups are cached together with their children
+            obj = updated_id
+            while obj is not None:
+                dirty_ids.add(('OBJECT', obj.name))
+                obj = obj.parent
+        elif updated_id.id_type != 'SCENE':
+            dirty_ids.add((updated_id.id_type, updated_id.name))
+
+@persistent
+def undo_handler(dummy):
+    global all_dirty
+    all_dirty = True
+
+@persistent
+def load_handler(dummy):
+    clear()
+
+def handle_register():
+    bpy.app.handlers.depsgraph_update_post.append(depsgraph_update_handler)
+    bpy.app.handlers.undo_post.append(undo_handler)
+    bpy.app.handlers.redo_post.append(undo_handler)
+    bpy.app.handlers.load_post.append(load_handler)
+
+def handle_unregister():
+    bpy.app.handlers.depsgraph_update_post.remove(depsgraph_update_handler)
+    bpy.app.handlers.undo_post.remove(undo_handler)
+    bpy.app.handlers.redo_post.remove(undo_handler)
+    bpy.app.handlers.load_post.remove(load_handler)
+    clear()
@@ -100,7 +100,7 @@ class DescriptorIG(DescriptorBase):
     def render(obj):
         draw_grids_global = bpy.context.scene.draw_collision_grid
         draw_only_active_grids = bpy.context.scene.draw_only_active_collision_grid
-        is_active = (bpy.context.active_object is not None) and (bpy.context.active_object == obj or bpy.context.active_object in obj.children)
+        is_active = (bpy.context.active_object is not None) and (bpy.context.active_object == obj or bpy.context.active_object.parent == obj)
 
         if draw_only_active_grids:
             draw_grid = (draw_grids_global and is_active)
@@ -108,7 +108,7 @@ class DescriptorIG(DescriptorBase):
         else:
             draw_grid = draw_grids_global
 
-        stage_object_drawing.draw_ig(obj, draw_grid) 
+        stage_object_drawing.draw_ig(obj, draw_grid, statics.hierarchy_index.get_children(obj))
         if obj.get("loopAnim") == 2:
             stage_object_drawing.draw_seesaw_axis(obj)
 
@@ -1,3 +1,7 @@
+import re
+
+from functools import lru_cache
+
 from .descriptor_banana import DescriptorBanana
 from .descriptor_base import DescriptorBase
 from .descriptor_booster import DescriptorBooster
@@ -18,8 +22,8 @@ from .descriptor_switch import DescriptorSwitch
 from .descriptor_wormhole import DescriptorWH
 from .descriptor_track_path import DescriptorTrackPath
 
-# List of all objects
-descriptors = {
+# List of all objects, in the order they take priority when an object has several tags
+descriptors = (
     DescriptorIG,
     DescriptorModel,
     DescriptorBumper,
@@ -38,15 +42,47 @@ descriptors = {
     DescriptorBooster,
     DescriptorGolfHole,
     DescriptorTrackPath,
-}
+)
 
 # List of objects that are not children of item groups
-descriptors_root = {
+descriptors_root = (
     DescriptorStart,
     DescriptorBG,
     DescriptorFG,
     DescriptorGolfHole,
     DescriptorBooster,
     DescriptorTrackPath,
-}
+)
+
+# Matches bracketed tags in object names, such as [IG], [BANANA_S] or [SW_FF]
+TAG_RE = re.compile(r"\[[^\[\]]*\]")
+
+# Returns the bracketed tags in an object name, in the order they appear
+@lru_cache(maxsize=4096)
+def get_tags(name):
+    return tuple(TAG_RE.findall(name))
+
+# Returns the descriptor a tag belongs to, or None. A tag matches a descriptor name as a whole, or up to its first
+# "_" or closing "]", so [BANANA_ matches [BANANA_S] and [WH matches [WH] and [WH_1], but [WH doesn't match [WHITE].
+@lru_cache(maxsize=None)
+def get_tag_descriptor(tag):
+    head = tag[:tag.index("_") + 1] if "_" in tag else tag
+    names = {tag, tag[:-1], head, head[:-1]}
+    for desc in descriptors:
+        if desc.get_object_name() in names:
+            return desc
+    return None
+
+# Returns the descriptors for all tags in an object name, in priority order
+@lru_cache(maxsize=4096)
+def get_descriptors(name):
+    matched = {get_tag_descriptor(tag) for tag in get_tags(name)}
+    return tuple(desc for desc in descriptors if desc in matched)
 
+# Returns the descriptor for the tag an object name starts with, or None
+@lru_cache(maxsize=4096)
+def get_leading_descriptor(name):
+    tags = get_tags(name)
+    if len(tags) > 0 and name.startswith(tags[0]):
+        return get_tag_descriptor(tags[0])
+    return None
@@ -0,0 +1,252 @@
+import bpy
+import datetime
+import importlib
+import json
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+
+# Profiles of the most recent export, shown in the export timings panel. Exports run by another export (such as the
+# OBJ export run by Export GMA/TPL) are nested under the phase they ran in.
+last_profile = None
+active_profiles = []
+
+# Timing, memory and counts of a single phase of an export
+class Phase:
+    def __init__(self, name, counts):
+        self.name = name
+        self.seconds = 0.0
+        self.memory_change = None
+        self.peak_memory_change = None
+        self.counts = dict(counts)
+        self.children = []
+
+    def count(self, name, value):
+        self.counts[name] = value
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "seconds": round(self.seconds, 4),
+            "memory_change_mb": to_mb(self.memory_change),
+            "peak_memory_change_mb": to_mb(self.peak_memory_change),
+            "counts": self.counts,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+# All phases of a single run of an export operator
+class Profile:
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.memory_change = None
+        self.process_peak_memory = None
+        self.phases = []
+        self.current_phase = None
+        self.phase_start_time = 0.0
+        self.phase_start_memory = None
+        self.phase_sampler = None
+        self.start_time = 0.0
+        self.start_memory = None
+        self.parent = None
+
+    # Starts timing a phase of the export, ending the previous one. Any keyword arguments are recorded as counts of
+    # things processed in the phase, more can be added with the returned phase's count() method.
+    def start_phase(self, name, **counts):
+        self.end_phase()
+        self.current_phase = Phase(name, counts)
+        self.phases.append(self.current_phase)
+        self.phase_start_time = time.perf_counter()
+        self.phase_start_memory = get_current_memory()
+        self.phase_sampler = MemorySampler(self.phase_start_memory)
+        return self.current_phase
+
+    # Ends the current phase, if there is one
+    def end_phase(self):
+        if self.current_phase is None:
+            return
+        self.current_phase.seconds = time.perf_counter() - self.phase_start_time
+        self.current_phase.memory_change = get_memory_change(self.phase_start_memory)
+        peak_memory = self.phase_sampler.stop()
+        if peak_memory is not None:
+            self.current_phase.peak_memory_change = peak_memory - self.phase_start_memory
+        self.current_phase = None
+        self.phase_sampler = None
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "seconds": round(self.seconds, 4),
+            "memory_change_mb": to_mb(self.memory_change),
+            "process_peak_memory_mb": to_mb(self.process_peak_memory),
+            "phases": [phase.to_dict() for phase in self.phases],
+        }
+
+def to_mb(size):
+    return None if size is None else round(size / (1024*1024), 1)
+
+# Returns the memory counters of the Blender process on Windows
+def _get_windows_memory_counters():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None
+    return counters
+
+# Returns the memory the Blender process currently uses (its resident set) in bytes, or None if it can't be found.
+# Only supported on Windows and Linux.
+def get_current_memory():
+    try:
+        if sys.platform == "win32":
+            counters = _get_windows_memory_counters()
+            return counters.WorkingSetSize if counters is not None else None
+        elif sys.platform.startswith("linux"):
+            import os
+
+            with open("/proc/self/statm", "r") as statm_file:
+                resident_pages = int(statm_file.read().split()[1])
+            return resident_pages * os.sysconf("SC_PAGE_SIZE")
+        return None
+    except Exception:
+        return None
+
+# Returns how much the memory used by the Blender process changed since it was 'start_memory', or None if it can't
+# be found
+def get_memory_change(start_memory):
+    end_memory = get_current_memory()
+    if start_memory is None or end_memory is None:
+        return None
+    return end_memory - start_memory
+
+# How often the memory used during a phase is sampled, in seconds
+MEMORY_SAMPLE_INTERVAL = 0.01
+
+# Samples the memory used by the Blender process on a background thread, keeping the highest value seen since
+# 'start_memory'. Memory only used for part of a phase doesn't show in the change between its start and end.
+class MemorySampler:
+    def __init__(self, start_memory):
+        self.peak_memory = start_memory
+        self.stopped = threading.Event()
+        self.thread = None
+        if start_memory is not None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(MEMORY_SAMPLE_INTERVAL):
+            self.sample()
+
+    def sample(self):
+        memory = get_current_memory()
+        if memory is not None and memory > self.peak_memory:
+            self.peak_memory = memory
+
+    # Stops sampling, returning the highest memory use seen, or None if it can't be found
+    def stop(self):
+        if self.thread is None:
+            return None
+        self.stopped.set()
+        self.thread.join()
+        self.sample()
+        return self.peak_memory
+
+# Returns the peak memory usage of the Blender process over its whole lifetime in bytes (not just the export's), or
+# None if it can't be found
+def get_process_peak_memory():
+    try:
+        if sys.platform == "win32":
+            counters = _get_windows_memory_counters()
+            return counters.PeakWorkingSetSize if counters is not None else None
+        else:
+            import resource
+
+            # Linux reports this in kilobytes, macOS in bytes
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return max_rss if sys.platform == "darwin" else max_rss * 1024
+    except Exception:
+        return None
+
+# Starts profiling a run of an export operator. If another export is being profiled, the new profile is nested under
+# its current phase. Must be finished with finish_profile().
+def start_profile(name):
+    export_profile = Profile(name)
+    export_profile.parent = active_profiles[-1] if len(active_profiles) > 0 else None
+    if export_profile.parent is not None and export_profile.parent.current_phase is not None:
+        export_profile.parent.current_phase.children.append(export_profile)
+
+    export_profile.start_time = time.perf_counter()
+    export_profile.start_memory = get_current_memory()
+    return export_profile
+
+# Finishes a profile. Top level profiles become the last profile and are written to the timing log.
+def finish_profile(export_profile):
+    global last_profile
+
+    export_profile.end_phase()
+    export_profile.seconds = time.perf_counter() - export_profile.start_time
+    export_profile.memory_change = get_memory_change(export_profile.start_memory)
+    export_profile.process_peak_memory = get_process_peak_memory()
+
+    if export_profile.parent is None:
+        last_profile = export_profile
+        print(f"{export_profile.name} finished in {export_profile.seconds:.2f}s")
+        _write_log(export_profile)
+
+# Makes exports run inside the block nest under the profile's current phase
+@contextmanager
+def activate(export_profile):
+    active_profiles.append(export_profile)
+    try:
+        yield export_profile
+    finally:
+        active_profiles.pop()
+
+# Profiles a run of an export operator. Phases are timed with the profile's start_phase() method.
+@contextmanager
+def profile(name):
+    export_profile = start_profile(name)
+    try:
+        with activate(export_profile):
+            yield export_profile
+    finally:
+        finish_profile(export_profile)
+
+# Appends a profile to the timing log as a single line of JSON, if a log path is set
+def _write_log(export_profile):
+    log_path = bpy.context.scene.export_profile_log_path
+    if log_path == "":
+        return
+
+    entry = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "addon_version": _get_addon_version(),
+        "blender_version": bpy.app.version_string,
+        "blend": bpy.data.filepath,
+        **export_profile.to_dict(),
+    }
+
+    try:
+        with open(bpy.path.abspath(log_path), "a") as log_file:
+            log_file.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        print(f"Failed to write export timing log: {e}")
+
+def _get_addon_version():
+    try:
+        addon_module = importlib.import_module(__package__.rpartition(".")[0])
+        return ".".join(str(part) for part in addon_module.bl_info["version"])
+    except Exception:
+        return None
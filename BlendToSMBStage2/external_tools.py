@@ -0,0 +1,235 @@
+import bpy
+import os
+import stat
+import subprocess
+import sys
+import locale
+import threading
+import time
+
+from sys import platform
+
+# To handle encoding shenanigans when we run GX/WS as subprocesses
+if platform == "win32":
+    from ctypes import windll
+
+# Raised when an external tool can't be run at all. The message is meant to be reported to the user.
+class ExternalToolError(Exception):
+    pass
+
+# Returns the path of the bundled GxModelViewer executable
+def get_gx_path():
+    if platform == "linux" or platform == "linux2":
+        return bpy.utils.script_path_user() + "/addons/BlendToSMBStage2/GxUtils/GxModelViewer"
+    else:
+        return bpy.utils.script_path_user() + "/addons/BlendToSMBStage2/GxUtils/GxModelViewer.exe"
+
+# Returns the path of the bundled ws2lzfrontend executable
+def get_ws_path():
+    if platform == "linux" or platform == "linux2":
+        return bpy.utils.script_path_user() + "/addons/BlendToSMBStage2/ws2lzfrontend/bin/ws2lzfrontend"
+    else:
+        return bpy.utils.script_path_user() + "/addons/BlendToSMBStage2/ws2lzfrontend/ws2lzfrontend.exe"
+
+# Returns the paths of the GMA and TPL to merge into exported ones, or None if they aren't both set
+def get_merge_gmatpl_paths(scene):
+    import_gma_path = bpy.path.abspath(scene.import_gma_path)
+    import_tpl_path = bpy.path.abspath(scene.import_tpl_path)
+    if os.path.exists(import_gma_path) and os.path.exists(import_tpl_path):
+        return import_gma_path, import_tpl_path
+    return None
+
+# Returns the command line for converting the exported OBJ into a GMA/TPL with GxModelViewer
+def get_gx_args(scene):
+    args = []
+    args.append(get_gx_path())
+    args.append("-setPresetFolder")
+    args.append(bpy.path.abspath(scene.gx_preset_path))
+    args.append("-importObjMtl")
+    args.append(bpy.path.abspath(scene.export_model_path))
+    args.append("-removeUnusedTextures")
+
+    merge_paths = get_merge_gmatpl_paths(scene)
+    if merge_paths is not None:
+        args.append("-mergeGmaTpl")
+        args.append(merge_paths[0] + "," + merge_paths[1])
+
+    args.append("-exportGma")
+    args.append(bpy.path.abspath(scene.export_gma_path))
+    args.append("-exportTpl")
+    args.append(bpy.path.abspath(scene.export_tpl_path))
+    return args
+
+# Returns the command line for merging GMA/TPL pairs into one with the GxModelViewer at 'gx_path'. The first pair is
+# imported, then each of the others is merged into it in order (see gma_chunks for what this relies on).
+def get_gx_merge_args(gx_path, gmatpl_paths, gma_path, tpl_path):
+    args = [gx_path,
+            "-importGma", gmatpl_paths[0][0],
+            "-importTpl", gmatpl_paths[0][1]]
+
+    for (merge_gma_path, merge_tpl_path) in gmatpl_paths[1:]:
+        args.append("-mergeGmaTpl")
+        args.append(merge_gma_path + "," + merge_tpl_path)
+
+    args.append("-exportGma")
+    args.append(gma_path)
+    args.append("-exportTpl")
+    args.append(tpl_path)
+    return args
+
+# Returns the command line for compiling the exported config into a LZ (or LZ.RAW) with Workshop 2
+def get_ws_args(scene, compressed):
+    args = [get_ws_path(),
+            "-c" + bpy.path.abspath(scene.export_config_path)]
+
+    if compressed:
+        args.append("-s" + bpy.path.abspath(scene.export_stagedef_path))
+    else:
+        args.append("-o" + bpy.path.abspath(scene.export_raw_stagedef_path))
+    return args
+
+# Decodes the output of an external tool into a list of lines
+def decode_output(stdout_bytes):
+    try:
+        return stdout_bytes.decode().split('\r\n')
+    except UnicodeDecodeError:
+        try:
+            if sys.platform == 'win32':
+                codepage = f"cp{windll.kernel32.GetConsoleOutputCP()}"
+                return stdout_bytes.decode(encoding=codepage).split('\r\n')
+            else:
+                return stdout_bytes.decode(encoding=locale.getpreferredencoding(False)).split('\r\n')
+        except:
+            return stdout_bytes.decode(errors="replace").split('\r\n')
+
+# Decodes a single line of output of an external tool
+def decode_line(line_bytes):
+    return decode_output(line_bytes.rstrip(b"\r\n"))[0]
+
+# Starts an external tool, returning its Popen object
+def _start_process(args, tool_name):
+    tool_path = args[0]
+    if not os.path.exists(tool_path):
+        raise ExternalToolError(f"{tool_name} not found. Ensure you have downloaded BlendToSMBStage2 from the 'Releases' section on GitHub, not from the 'Code' dropdown.")
+
+    popen_args = {"stdout": subprocess.PIPE, "stderr": subprocess.STDOUT, "stdin": subprocess.DEVNULL}
+    try:
+        return subprocess.Popen(args, **popen_args)
+    except PermissionError:
+        try:
+            os.chmod(tool_path, stat.S_IRWXU | stat.S_IROTH | stat.S_IRGRP)  # attempt to set execute permissions for the owner
+            return subprocess.Popen(args, **popen_args)
+        except:
+            raise ExternalToolError(f"{tool_name} does not have the correct permissions to run. \nPlease set executable permissions on:\n{tool_path}")
+    except:
+        raise ExternalToolError(f"{tool_name} failed to run. See the console for more details.")
+
+# A running external tool. Its output is read line by line on a worker thread as it's printed, so it can be checked
+# on while the tool runs without blocking. Doesn't touch any Blender data.
+class ToolProcess:
+    def __init__(self, args, tool_name):
+        self.tool_name = tool_name
+        self.lines = []
+        self.read_count = 0
+        self.cancelled = False
+        self.start_time = time.perf_counter()
+        self.process = _start_process(args, tool_name)
+        self.reader = threading.Thread(target=self._read_output, daemon=True)
+        self.reader.start()
+
+    def _read_output(self):
+        for line_bytes in iter(self.process.stdout.readline, b""):
+            self.lines.append(decode_line(line_bytes))
+        self.process.stdout.close()
+
+        # A tool can fail without printing an error, so the exit code is reported as one
+        self.process.wait()
+        if not self.cancelled and self.process.returncode != 0:
+            self.lines.append(f"Error: {self.tool_name} failed (exit code {self.process.returncode})")
+
+    # Returns the lines printed since this was last called
+    def get_new_lines(self):
+        count = len(self.lines)
+        new_lines = self.lines[self.read_count:count]
+        self.read_count = count
+        return new_lines
+
+    # Returns whether the tool has exited and all of its output has been read
+    def is_finished(self):
+        return self.process.poll() is not None and not self.reader.is_alive()
+
+    def get_elapsed_seconds(self):
+        return time.perf_counter() - self.start_time
+
+    # Returns whether the tool ran to the end without failing
+    def succeeded(self):
+        return not self.cancelled and self.process.returncode == 0
+
+    # Stops the tool
+    def cancel(self):
+        self.cancelled = True
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.reader.join()
+
+    # Waits for the tool to exit, returning all of its output
+    def wait(self):
+        self.process.wait()
+        self.reader.join()
+        return self.lines
+
+# Runs an external tool, returning its output as a list of lines.
+# Doesn't touch any Blender data, so it can be called from a worker thread.
+def run_tool(args, tool_name):
+    return ToolProcess(args, tool_name).wait()
+
+# Returns the warning and error lines of GxModelViewer output
+def get_gx_errors(output_lines):
+    return [line for line in output_lines if ("Import Warning" in line) or ("Error" in line)]
+
+# Returns the warning and error lines of Workshop 2 output
+def get_ws_errors(output_lines):
+    return [line for line in output_lines if ("Critical" in line) or ("Error" in line) or ("Warning" in line)]
+
+# Returns the files GxModelViewer reads when importing an exported OBJ: the OBJ itself, its MTL and every texture
+# the MTL references
+def get_obj_inputs(obj_path):
+    mtl_path = os.path.splitext(obj_path)[0] + ".mtl"
+    inputs = [obj_path, mtl_path]
+    if not os.path.exists(mtl_path):
+        return inputs
+
+    mtl_dir = os.path.dirname(mtl_path)
+    with open(mtl_path, "r", errors="replace") as mtl_file:
+        for line in mtl_file:
+            parts = line.strip().split(None, 1)
+            if len(parts) < 2 or not parts[0].startswith(("map_", "bump", "disp", "refl")):
+                continue
+
+            # Texture paths can have spaces in them, but may also be preceded by options
+            texture_path = os.path.join(mtl_dir, parts[1])
+            if not os.path.exists(texture_path):
+                texture_path = os.path.join(mtl_dir, parts[1].split()[-1])
+            inputs.append(texture_path)
+
+    return inputs
+
+# Returns every file GxModelViewer reads for the given command line: the OBJ and its textures, the preset folder and
+# any GMA/TPL being merged in
+def get_gx_inputs(gx_args):
+    inputs = get_obj_inputs(gx_args[gx_args.index("-importObjMtl") + 1])
+
+    preset_path = gx_args[gx_args.index("-setPresetFolder") + 1]
+    if os.path.isdir(preset_path):
+        for (dir_path, dir_names, file_names) in os.walk(preset_path):
+            dir_names.sort()
+            inputs.extend(os.path.join(dir_path, file_name) for file_name in sorted(file_names))
+
+    if "-mergeGmaTpl" in gx_args:
+        inputs.extend(gx_args[gx_args.index("-mergeGmaTpl") + 1].split(","))
+
+    return inputs
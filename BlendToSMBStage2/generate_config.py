@@ -1,5 +1,6 @@
 import bpy
 import math
+import numpy as np
 from sys import platform
 
 from mathutils import Vector
@@ -79,11 +80,11 @@ def _write_fcurve_keyframe_values(obj, anim_channel: AnimData.Channel, fcurve):
             
             anim_channel.time_val_map[seconds] = value
 
-def _write_obj_prop_at_current_frame(obj, anim_channel: AnimData.Channel, obj_prop):
+# Returns the first frame, last frame and timestep an object's animation is sampled with
+def _get_sample_range(obj):
     start_frame = bpy.context.scene.frame_start
     end_frame = bpy.context.scene.frame_end
     timestep = bpy.context.scene.export_timestep
-    optimize = bpy.context.scene.optimize_keyframes
 
     # Sets up a custom animation loop time if one is specified 
     if "animLoopTime" in obj:
@@ -95,6 +96,12 @@ def _write_obj_prop_at_current_frame(obj, anim_channel: AnimData.Channel, obj_pr
         if obj["exportTimestep"] != -1:
             timestep = obj["exportTimestep"]
 
+    return start_frame, end_frame, timestep
+
+def _write_obj_prop_at_current_frame(obj, anim_channel: AnimData.Channel, obj_prop):
+    start_frame, end_frame, timestep = _get_sample_range(obj)
+    optimize = bpy.context.scene.optimize_keyframes
+
     curr_frame = bpy.context.scene.frame_current
     # Ignore out-of-range frames
     if not (start_frame <= curr_frame <= end_frame and (curr_frame - start_frame) % timestep == 0):
@@ -136,7 +143,11 @@ def generate_keyframe_anim_data(obj, anim_data: AnimData):
     if (fcurve := channelbag.fcurves.find("scale", index=2)) is not None:
         _write_fcurve_keyframe_values(obj, anim_data.scale_z_channel, fcurve)
 
-def generate_per_frame_anim_data(obj, anim_data: AnimData):
+# Adds a value on the first frame to every transform channel of an animated object's AnimData that has no keyframe
+# there, using the channel's current value. The object's F-curves aren't changed. The scene must be on the first frame.
+# Without these the object's center of rotation doesn't work properly in game (B2SMB1 inadvertently fixed this by
+# baking *all* keyframes), and background and foreground objects behave oddly.
+def generate_first_frame_anim_data(obj, anim_data: AnimData):
     if obj.animation_data is None or obj.animation_data.action is None:
         return
 
@@ -144,24 +155,199 @@ def generate_per_frame_anim_data(obj, anim_data: AnimData):
     action_slot = obj.animation_data.action_slot
     channelbag = anim_utils.action_get_channelbag_for_slot(action, action_slot)
 
-    if channelbag.fcurves.find("location", index=0) is not None:
-        _write_obj_prop_at_current_frame(obj, anim_data.pos_x_channel, obj.location.x)
-    if channelbag.fcurves.find("location", index=1) is not None:
-        _write_obj_prop_at_current_frame(obj, anim_data.pos_y_channel, -obj.location.y)
-    if channelbag.fcurves.find("location", index=2) is not None:
-        _write_obj_prop_at_current_frame(obj, anim_data.pos_z_channel, obj.location.z)
-    if channelbag.fcurves.find("rotation_euler", index=0) is not None:
-        _write_obj_prop_at_current_frame(obj, anim_data.rot_x_channel, math.degrees(obj.rotation_euler.x))
-    if channelbag.fcurves.find("rotation_euler", index=1) is not None:
-        _write_obj_prop_at_current_frame(obj, anim_data.rot_y_channel, -math.degrees(obj.rotation_euler.y))
-    if channelbag.fcurves.find("rotation_euler", index=2) is not None:
-        _write_obj_prop_at_current_frame(obj, anim_data.rot_z_channel, math.degrees(obj.rotation_euler.z))
-    if channelbag.fcurves.find("scale", index=0) is not None:
-        _write_obj_prop_at_current_frame(obj, anim_data.scale_x_channel, obj.scale.x)
-    if channelbag.fcurves.find("scale", index=1) is not None:
-        _write_obj_prop_at_current_frame(obj, anim_data.scale_y_channel, obj.scale.y)
-    if channelbag.fcurves.find("scale", index=2) is not None:
-        _write_obj_prop_at_current_frame(obj, anim_data.scale_z_channel, obj.scale.z)
+    begin_frame = bpy.context.scene.frame_start
+    seconds = round(begin_frame/bpy.context.scene.render.fps, bpy.context.scene.export_time_round)
+
+    for (data_path, index, channel_name, sign, degrees) in SAMPLED_CHANNELS:
+        fcurve = channelbag.fcurves.find(data_path, index=index)
+        if fcurve is not None and any(keyframe_point.co[0] == float(begin_frame) for keyframe_point in fcurve.keyframe_points):
+            continue
+
+        value = getattr(obj, data_path)[index]
+        if degrees:
+            value = math.degrees(value)
+        value = round(sign*value, bpy.context.scene.export_value_round)
+
+        # Explicit keyframes that round to the same time take priority
+        anim_channel = getattr(anim_data, channel_name)
+        if seconds not in anim_channel.time_val_map:
+            anim_channel.time_val_map[seconds] = value
+
+# Every transform channel of an animated object is sampled, including ones without an F-curve, as all of them are
+# given a value on the first frame
+def generate_per_frame_anim_data(obj, anim_data: AnimData):
+    if obj.animation_data is None or obj.animation_data.action is None:
+        return
+
+    for (data_path, index, channel_name, sign, degrees) in SAMPLED_CHANNELS:
+        value = getattr(obj, data_path)[index]
+        if degrees:
+            value = math.degrees(value)
+        _write_obj_prop_at_current_frame(obj, getattr(anim_data, channel_name), sign*value)
+
+# Transform channels sampled for animated objects
+# (data path, array index, AnimData channel attribute, sign, whether the value is converted to degrees)
+SAMPLED_CHANNELS = [
+    ("location", 0, "pos_x_channel", 1.0, False),
+    ("location", 1, "pos_y_channel", -1.0, False),
+    ("location", 2, "pos_z_channel", 1.0, False),
+    ("rotation_euler", 0, "rot_x_channel", 1.0, True),
+    ("rotation_euler", 1, "rot_y_channel", -1.0, True),
+    ("rotation_euler", 2, "rot_z_channel", 1.0, True),
+    ("scale", 0, "scale_x_channel", 1.0, False),
+    ("scale", 1, "scale_y_channel", 1.0, False),
+    ("scale", 2, "scale_z_channel", 1.0, False),
+]
+
+# Returns whether the transform channels of an object can't be read straight from its action's F-curves.
+# Only the local location/rotation/scale properties are exported, so constraints and parenting don't matter here,
+# but drivers, the NLA, action blending and muted curves all change what those properties evaluate to.
+def _requires_frame_set(obj, channelbag):
+    anim = obj.animation_data
+
+    for driver in anim.drivers:
+        if driver.data_path in ("location", "rotation_euler", "scale"):
+            return True
+
+    if anim.use_tweak_mode or anim.action_influence != 1.0 or anim.action_blend_type != 'REPLACE':
+        return True
+
+    if anim.use_nla:
+        for track in anim.nla_tracks:
+            if not track.mute and len(track.strips) > 0:
+                return True
+
+    for (data_path, index, _, _, _) in SAMPLED_CHANNELS:
+        fcurve = channelbag.fcurves.find(data_path, index=index)
+        if fcurve is not None and fcurve.mute:
+            return True
+
+    return False
+
+# Writes samples of a channel to an animation channel, evaluating 'evaluate' (a function of the frame, such as
+# FCurve.evaluate) directly over the whole frame range.
+# This produces the same keyframes as calling _write_obj_prop_at_current_frame on every frame.
+def _write_samples(obj, anim_channel: AnimData.Channel, evaluate, sign, degrees):
+    start_frame, end_frame, timestep = _get_sample_range(obj)
+    end_frame = min(end_frame, bpy.context.scene.frame_end)
+    fps = bpy.context.scene.render.fps
+    time_round = bpy.context.scene.export_time_round
+    value_round = bpy.context.scene.export_value_round
+    optimize = bpy.context.scene.optimize_keyframes
+
+    frames = [frame for frame in range(start_frame, end_frame + 1) if (frame - start_frame) % timestep == 0]
+    if len(frames) == 0:
+        return
+
+    samples = np.fromiter((evaluate(frame) for frame in frames), dtype=np.float64, count=len(frames))
+    if degrees:
+        samples = np.degrees(samples)
+    samples = samples * sign
+
+    # Python's round() is used rather than np.round() so values match the per-frame path exactly
+    values = [round(sample, value_round) for sample in samples.tolist()]
+
+    # A sample is only dropped when it's equal to the one before it
+    if optimize:
+        keep = np.empty(len(values), dtype=bool)
+        keep[0] = values[0] != anim_channel.prev_val
+        keep[1:] = np.not_equal(values[1:], values[:-1])
+        kept_indices = np.flatnonzero(keep).tolist()
+    else:
+        kept_indices = range(len(values))
+    anim_channel.prev_val = values[-1]
+
+    for i in kept_indices:
+        seconds = round((frames[i]-start_frame)/fps, time_round)
+        if seconds not in anim_channel.time_val_map:
+            anim_channel.time_val_map[seconds] = values[i]
+
+# Samples the per-frame animation data of a list of (object, AnimData) pairs over the scene's frame range.
+# Objects animated only by their action's F-curves are sampled straight from the curves. The rest fall back
+# to stepping through every frame with scene.frame_set, which re-evaluates the whole depsgraph each time.
+def sample_per_frame_anim_data(exports):
+    frame_set_exports = []
+
+    for (obj, anim_data) in exports:
+        if obj.animation_data is None or obj.animation_data.action is None:
+            continue
+
+        action = obj.animation_data.action
+        action_slot = obj.animation_data.action_slot
+        channelbag = anim_utils.action_get_channelbag_for_slot(action, action_slot)
+
+        if _requires_frame_set(obj, channelbag):
+            frame_set_exports.append((obj, anim_data))
+            continue
+
+        for (data_path, index, channel_name, sign, degrees) in SAMPLED_CHANNELS:
+            fcurve = channelbag.fcurves.find(data_path, index=index)
+            if fcurve is not None:
+                _write_samples(obj, getattr(anim_data, channel_name), fcurve.evaluate, sign, degrees)
+            else:
+                # Channels without an F-curve keep their value over the whole animation
+                value = getattr(obj, data_path)[index]
+                _write_samples(obj, getattr(anim_data, channel_name), lambda frame: value, sign, degrees)
+
+    if len(frame_set_exports) > 0:
+        print(f"\tSampling {len(frame_set_exports)} object(s) with drivers or NLA animation frame by frame")
+        for frame in range(bpy.context.scene.frame_start, bpy.context.scene.frame_end + 1):
+            bpy.context.scene.frame_set(frame)
+            for (obj, anim_data) in frame_set_exports:
+                generate_per_frame_anim_data(obj, anim_data)
+
+# Removes keyframes from an animation channel that can be reproduced within 'tolerance' by linearly interpolating
+# between the remaining ones (Douglas-Peucker, measured along the value axis). The first and last keyframes are
+# always kept. Returns the keyframe count before and after the reduction.
+def reduce_anim_channel(anim_channel: AnimData.Channel, tolerance):
+    count = len(anim_channel.time_val_map)
+    if count <= 2:
+        return count, count
+
+    times = np.array(sorted(anim_channel.time_val_map.keys()), dtype=np.float64)
+    values = np.array([anim_channel.time_val_map[time] for time in times.tolist()], dtype=np.float64)
+
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = True
+    keep[-1] = True
+
+    segments = [(0, count-1)]
+    while len(segments) > 0:
+        first, last = segments.pop()
+        if last - first < 2:
+            continue
+
+        inner_times = times[first+1:last]
+        slope = (values[last] - values[first]) / (times[last] - times[first])
+        error = np.abs(values[first+1:last] - (values[first] + slope*(inner_times - times[first])))
+
+        worst = int(np.argmax(error))
+        if error[worst] > tolerance:
+            split = first + 1 + worst
+            keep[split] = True
+            segments.append((first, split))
+            segments.append((split, last))
+
+    kept_times = times[keep].tolist()
+    anim_channel.time_val_map = {time: anim_channel.time_val_map[time] for time in kept_times}
+
+    return count, len(kept_times)
+
+# Runs reduce_anim_channel on every channel of an object's animation data, returning the total keyframe counts
+def reduce_anim_data(anim_data: AnimData, tolerance):
+    total_before = 0
+    total_after = 0
+
+    for (_, _, channel_name, _, _) in SAMPLED_CHANNELS:
+        before, after = reduce_anim_channel(getattr(anim_data, channel_name), tolerance)
+        total_before += before
+        total_after += after
+
+    return total_before, total_after
+
+# Returns the total number of keyframes in an object's animation data
+def count_keyframes(anim_data: AnimData):
+    return sum(len(getattr(anim_data, channel_name).time_val_map) for (_, _, channel_name, _, _) in SAMPLED_CHANNELS)
 
 def _generate_anim_channel_xml(parent_xml, anim_channel: AnimData.Channel, name):
     if len(anim_channel.time_val_map) == 0:
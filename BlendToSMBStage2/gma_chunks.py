@@ -0,0 +1,280 @@
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from . import obj_writer, external_tools, artifact_cache, material_cache
+
+# Splitting the stage model into chunks, converted to GMA/TPL by several GxModelViewer processes at once and merged
+# into the final GMA/TPL. With the artifact cache on, chunks whose OBJ hasn't changed aren't converted again.
+#
+# The merge relies on GxModelViewer's command line handling options in the order given, each acting on the model
+# loaded so far: -importGma/-importTpl load a GMA/TPL pair in place of an OBJ, and every -mergeGmaTpl appends another
+# pair to it, so the option can be repeated. Only -mergeGmaTpl after -importObjMtl (as for import_gma_path) is used
+# outside of chunked exports; the rest hasn't been checked against a released GxModelViewer build, so chunked exports
+# are only used when turned on as experimental (see get_chunk_count).
+
+# Returns how many chunks the stage model is converted in, 1 meaning it's converted whole
+def get_chunk_count(scene):
+    if not scene.export_experimental_gma_chunks:
+        return 1
+    return scene.export_gma_chunks
+
+# Returns the name of the item group an object is in, or an empty string if it isn't in one
+def _get_item_group_name(obj):
+    item_group = obj
+    while item_group is not None and "[IG]" not in item_group.name:
+        item_group = item_group.parent
+    return item_group.name if item_group is not None else ""
+
+# Returns the names of the images used as textures by an object's materials
+def _get_texture_names(obj):
+    names = set()
+    for slot in obj.material_slots:
+        if slot.material is not None:
+            image = material_cache.get_material_info(slot.material).get_image()
+            if image is not None:
+                names.add(image.name)
+    return names
+
+# Groups objects by the textures they use. Objects sharing a texture, directly or through other objects, are put in
+# the same group, so every texture is converted and stored in only one chunk. Objects without textures are grouped on
+# their own.
+def _group_by_texture(objects):
+    # Each texture points towards the texture its group is known by
+    parents = {}
+
+    def find(name):
+        while parents[name] != name:
+            parents[name] = parents[parents[name]]
+            name = parents[name]
+        return name
+
+    object_textures = []
+    for obj in objects:
+        names = sorted(_get_texture_names(obj))
+        for name in names:
+            parents.setdefault(name, name)
+        for name in names[1:]:
+            parents[find(name)] = find(names[0])
+        object_textures.append((obj, names))
+
+    groups = {}
+    for (obj, names) in object_textures:
+        key = "texture:" + find(names[0]) if len(names) > 0 else "object:" + obj.name
+        groups.setdefault(key, []).append(obj)
+    return groups
+
+# Returns a rough measure of how long an object takes to convert
+def _get_weight(obj):
+    if obj.type == 'MESH':
+        return max(len(obj.data.polygons), 1)
+    return 1
+
+# Splits the exported objects of a scene into at most 'chunk_count' lists of similar size, grouping objects by item
+# group ('ITEM_GROUP') or by the textures they use ('TEXTURE'). Groups are handed out largest first, each to the
+# smallest chunk so far.
+def split_objects(scene, chunk_count, mode):
+    objects = [obj for obj in scene.objects if obj_writer.is_exported(obj)]
+    if mode == 'TEXTURE':
+        groups = _group_by_texture(objects)
+    else:
+        groups = {}
+        for obj in objects:
+            groups.setdefault(_get_item_group_name(obj), []).append(obj)
+
+    group_weights = {key: sum(_get_weight(obj) for obj in objects) for (key, objects) in groups.items()}
+    chunks = [[] for _ in range(chunk_count)]
+    chunk_weights = [0] * chunk_count
+    for key in sorted(groups, key=lambda key: (-group_weights[key], key)):
+        index = chunk_weights.index(min(chunk_weights))
+        chunks[index].extend(groups[key])
+        chunk_weights[index] += group_weights[key]
+
+    return [chunk for chunk in chunks if len(chunk) > 0]
+
+# Returns the OBJ, GMA and TPL paths of a chunk, next to the stage's OBJ and GMA/TPL
+def get_chunk_paths(obj_path, gma_path, tpl_path, index):
+    return (f"{os.path.splitext(obj_path)[0]}_chunk{index}.obj",
+            f"{os.path.splitext(gma_path)[0]}_chunk{index}.gma",
+            f"{os.path.splitext(tpl_path)[0]}_chunk{index}.tpl")
+
+# Writes the OBJ of every chunk, returning a list of (OBJ, GMA, TPL) paths of the chunks and the ObjStats of each.
+# OBJs of chunks left over from an export with more chunks are removed.
+def write_chunks(context, obj_path, gma_path, tpl_path, chunk_count, mode, skip_unchanged=False, texture_settings=None):
+    chunks = split_objects(context.scene, chunk_count, mode)
+    chunk_paths = []
+    chunk_stats = []
+    for (index, objects) in enumerate(chunks):
+        paths = get_chunk_paths(obj_path, gma_path, tpl_path, index)
+        chunk_stats.append(obj_writer.write_obj(context, paths[0], skip_unchanged, texture_settings, objects))
+        chunk_paths.append(paths)
+
+    for index in range(len(chunks), chunk_count):
+        stale_obj_path = get_chunk_paths(obj_path, gma_path, tpl_path, index)[0]
+        if os.path.exists(stale_obj_path):
+            os.remove(stale_obj_path)
+
+    return chunk_paths, chunk_stats
+
+# Returns the command lines of a chunked conversion, from the command line converting the whole stage: one converting
+# each chunk last written (up to 'chunk_count'), and one merging their outputs, along with any GMA/TPL the stage
+# merges in, into the stage's GMA/TPL. Only touches files, so it can be used from a worker thread.
+def get_gx_args(gx_args, chunk_count):
+    obj_path = gx_args[gx_args.index("-importObjMtl") + 1]
+    gma_path = gx_args[gx_args.index("-exportGma") + 1]
+    tpl_path = gx_args[gx_args.index("-exportTpl") + 1]
+
+    chunk_args = []
+    gmatpl_paths = []
+    for index in range(chunk_count):
+        (chunk_obj_path, chunk_gma_path, chunk_tpl_path) = get_chunk_paths(obj_path, gma_path, tpl_path, index)
+        if not os.path.exists(chunk_obj_path):
+            continue
+
+        args = list(gx_args)
+        args[args.index("-importObjMtl") + 1] = chunk_obj_path
+        args[args.index("-exportGma") + 1] = chunk_gma_path
+        args[args.index("-exportTpl") + 1] = chunk_tpl_path
+        if "-mergeGmaTpl" in args:
+            merge_index = args.index("-mergeGmaTpl")
+            del args[merge_index:merge_index+2]
+        chunk_args.append(args)
+        gmatpl_paths.append((chunk_gma_path, chunk_tpl_path))
+
+    if "-mergeGmaTpl" in gx_args:
+        gmatpl_paths.append(tuple(gx_args[gx_args.index("-mergeGmaTpl") + 1].split(",")))
+
+    merge_args = external_tools.get_gx_merge_args(gx_args[0], gmatpl_paths, gma_path, tpl_path) if len(gmatpl_paths) > 0 else None
+    return chunk_args, merge_args
+
+# Returns every file a chunked conversion reads (see get_gx_args): the chunks' OBJs and textures, the preset folder
+# and any GMA/TPL the stage merges in
+def get_gx_inputs(gx_args, chunk_args):
+    inputs = []
+    for args in chunk_args:
+        inputs.extend(external_tools.get_gx_inputs(args))
+    if "-mergeGmaTpl" in gx_args:
+        inputs.extend(gx_args[gx_args.index("-mergeGmaTpl") + 1].split(","))
+    return list(dict.fromkeys(inputs))
+
+# GxModelViewer converting every chunk of the stage at once, then merging them into the final GMA/TPL. Has the same
+# interface as external_tools.ToolProcess, so it can be used in its place, and likewise doesn't touch any Blender data.
+# 'chunk_args' are the command lines converting each chunk, 'merge_args' the one merging their outputs, and
+# 'cache_dir' the artifact cache folder, or None if outputs aren't cached.
+class ChunkedGxProcess:
+    def __init__(self, chunk_args, merge_args, cache_dir=None, max_workers=None):
+        self.tool_name = "GxModelViewer"
+        self.chunk_args = chunk_args
+        self.merge_args = merge_args
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers or max(min(len(chunk_args), os.cpu_count() or 1), 1)
+        self.lines = []
+        self.read_count = 0
+        self.cancelled = False
+        self.result = False
+        self.reused = 0
+        self.tools = []
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        if self.merge_args is None:
+            self.lines.append("Error: No chunks of the stage model to convert")
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            chunk_results = list(executor.map(self._run_chunk, range(len(self.chunk_args))))
+
+        if all(chunk_results) and not self.cancelled:
+            self.result = self._run_tool("merge", self.merge_args,
+                                         lambda: artifact_cache.get_gx_merge_artifacts(self.cache_dir, self.merge_args))
+
+        if not self.result and not self.cancelled:
+            failed_count = chunk_results.count(False)
+            if failed_count > 0:
+                self.lines.append(f"Error: {failed_count} of {len(chunk_results)} chunks failed to convert, the GMA/TPL wasn't written")
+            else:
+                self.lines.append("Error: Merging the chunks failed, the GMA/TPL wasn't written")
+
+    def _run_chunk(self, index):
+        args = self.chunk_args[index]
+        return self._run_tool(f"chunk {index}", args, lambda: artifact_cache.get_gx_artifacts(self.cache_dir, args))
+
+    # Runs a single GxModelViewer process, or restores its outputs from the cache, returning whether it succeeded
+    def _run_tool(self, name, args, get_artifacts):
+        if self.cancelled:
+            return False
+
+        artifacts = get_artifacts() if self.cache_dir is not None else None
+        output_lines = artifacts.restore() if artifacts is not None else None
+        if output_lines is not None:
+            self.reused += 1
+            self.lines.append(f"[{name}] Inputs unchanged, outputs restored from cache")
+            self.lines.extend(f"[{name}] {line}" for line in output_lines)
+            return True
+
+        if artifacts is not None:
+            artifacts.prepare_outputs()
+        try:
+            with self.lock:
+                if self.cancelled:
+                    return False
+                tool = external_tools.ToolProcess(args, self.tool_name)
+                self.tools.append(tool)
+        except external_tools.ExternalToolError as e:
+            self.lines.append(f"[{name}] Error: {e}")
+            return False
+
+        # Output is passed on as the tool prints it, marked with the chunk it's from
+        read_count = 0
+        while not tool.is_finished():
+            time.sleep(0.05)
+            read_count = self._pass_on_lines(name, tool, read_count)
+        self._pass_on_lines(name, tool, read_count)
+
+        if not tool.succeeded():
+            return False
+        if artifacts is not None:
+            artifacts.store(tool.lines)
+        return True
+
+    def _pass_on_lines(self, name, tool, read_count):
+        count = len(tool.lines)
+        self.lines.extend(f"[{name}] {line}" for line in tool.lines[read_count:count])
+        return count
+
+    # Returns the lines printed since this was last called
+    def get_new_lines(self):
+        count = len(self.lines)
+        new_lines = self.lines[self.read_count:count]
+        self.read_count = count
+        return new_lines
+
+    # Returns whether every chunk has been converted and merged, or the run has stopped
+    def is_finished(self):
+        return not self.thread.is_alive()
+
+    def get_elapsed_seconds(self):
+        return time.perf_counter() - self.start_time
+
+    # Returns whether every chunk was converted and merged
+    def succeeded(self):
+        return not self.cancelled and self.result
+
+    # Stops every running tool
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            tools = list(self.tools)
+        for tool in tools:
+            tool.cancel()
+        self.thread.join()
+
+    # Waits for every chunk to be converted and merged, returning all of the output
+    def wait(self):
+        self.thread.join()
+        return self.lines
@@ -0,0 +1,13 @@
+# Index of the direct children of every object, built with a single pass over a list of objects.
+# Object.children scans every object in the file each time it's accessed, so this is used wherever the children of
+# many objects are needed at once.
+class HierarchyIndex:
+    def __init__(self, objects):
+        self.children_map = {}
+        for obj in objects:
+            if obj.parent is not None:
+                self.children_map.setdefault(obj.parent, []).append(obj)
+
+    # Returns the children of an object, in the same order as in the list the index was built from
+    def get_children(self, obj):
+        return self.children_map.get(obj, [])
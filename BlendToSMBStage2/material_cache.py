@@ -0,0 +1,143 @@
+import bpy
+import re
+
+from bpy.app.handlers import persistent
+
+# What exporters need to know about each material, so node trees are only walked once per material and never edited.
+# material name -> MaterialInfo
+material_infos = {}
+
+# Materials updated since they were last analyzed
+dirty_materials = set()
+
+# Flags in material names, like [UNSHADED], [TEX_CMPR] or [MATFLAG_SCROLL]
+FLAG_RE = re.compile(r"\[([A-Z0-9]+(?:_[^\]]*)?)\]")
+
+# Base color of the Principled BSDF [UNSHADED] materials used to be converted to for export
+UNSHADED_COLOR = (0.8, 0.8, 0.8, 1.0)
+
+# Roughness, metallic, specular and IOR of a new Principled BSDF, which [UNSHADED] materials were exported with
+PRINCIPLED_DEFAULTS = (0.5, 0.0, 0.5, 1.5)
+
+# Export data of a single material
+class MaterialInfo:
+    def __init__(self, mat):
+        self.flags = FLAG_RE.findall(mat.name)
+        self.unshaded = "UNSHADED" in self.flags
+
+        # The shader node the material's color and texture come from ('BSDF_PRINCIPLED', 'EMISSION' or
+        # 'BSDF_DIFFUSE'), or None if it doesn't use nodes
+        self.surface = None
+        self.image_name = None
+        self.color = tuple(mat.diffuse_color)
+
+        # Surface settings written to the MTL. Taken from the Principled BSDF like Blender's OBJ exporter does, or from
+        # the material's viewport display settings if it doesn't have one.
+        (self.roughness, self.metallic, self.specular, self.ior) = (mat.roughness, mat.metallic, mat.specular_intensity, 1.5)
+        self.emission = (0.0, 0.0, 0.0)
+        if self.unshaded:
+            (self.roughness, self.metallic, self.specular, self.ior) = PRINCIPLED_DEFAULTS
+
+        if mat.use_nodes and mat.node_tree is not None:
+            self._analyze_nodes(mat.node_tree.nodes)
+
+    def _analyze_nodes(self, nodes):
+        surface_node = None
+        for node_type in ['BSDF_PRINCIPLED', 'EMISSION', 'BSDF_DIFFUSE']:
+            surface_node = next((node for node in nodes if node.type == node_type), None)
+            if surface_node is not None:
+                break
+
+        if surface_node is not None:
+            self.surface = surface_node.type
+            color_socket = surface_node.inputs.get("Base Color") or surface_node.inputs.get("Color")
+            if surface_node.type == 'BSDF_PRINCIPLED':
+                base_color = color_socket.default_value
+                self.color = (base_color[0], base_color[1], base_color[2], surface_node.inputs["Alpha"].default_value)
+                self._read_principled_settings(surface_node.inputs)
+            elif surface_node.type == 'EMISSION' and self.unshaded:
+                self.color = UNSHADED_COLOR
+            else:
+                self.color = tuple(color_socket.default_value)
+
+            if color_socket is not None and color_socket.is_linked:
+                linked_node = color_socket.links[0].from_node
+                if linked_node.type == 'TEX_IMAGE' and linked_node.image is not None:
+                    self.image_name = linked_node.image.name
+                    return
+
+        # Otherwise use the first image texture in the material
+        image_node = next((node for node in nodes if node.type == 'TEX_IMAGE' and node.image is not None), None)
+        if image_node is not None:
+            self.image_name = image_node.image.name
+
+    def _read_principled_settings(self, inputs):
+        self.roughness = inputs["Roughness"].default_value
+        self.metallic = inputs["Metallic"].default_value
+        self.ior = inputs["IOR"].default_value
+
+        # Named "Specular" and "Emission" before Blender 4.0
+        specular_socket = inputs.get("Specular IOR Level") or inputs.get("Specular")
+        if specular_socket is not None:
+            self.specular = specular_socket.default_value
+
+        emission_socket = inputs.get("Emission Color") or inputs.get("Emission")
+        strength_socket = inputs.get("Emission Strength")
+        if emission_socket is not None:
+            strength = strength_socket.default_value if strength_socket is not None else 1.0
+            self.emission = tuple(component * strength for component in emission_socket.default_value[:3])
+
+    # Returns the image used as the material's texture, or None if it doesn't have one
+    def get_image(self):
+        if self.image_name is None:
+            return None
+        return bpy.data.images.get(self.image_name)
+
+# Returns the export data of a material, analyzing it if it's new or has changed
+def get_material_info(mat):
+    info = material_infos.get(mat.name)
+    if info is None or mat.name in dirty_materials:
+        info = MaterialInfo(mat)
+        material_infos[mat.name] = info
+        dirty_materials.discard(mat.name)
+    return info
+
+# Drops the whole cache
+def clear():
+    material_infos.clear()
+    dirty_materials.clear()
+
+@persistent
+def depsgraph_update_handler(scene, depsgraph):
+    if len(material_infos) == 0:
+        return
+
+    for update in depsgraph.updates:
+        updated_id = update.id.original
+        # Edits to a material's node tree are reported as updates of the material
+        if updated_id.id_type == 'MATERIAL':
+            dirty_materials.add(updated_id.name)
+        elif updated_id.id_type == 'IMAGE':
+            clear()
+            return
+
+@persistent
+def undo_handler(dummy):
+    clear()
+
+@persistent
+def load_handler(dummy):
+    clear()
+
+def handle_register():
+    bpy.app.handlers.depsgraph_update_post.append(depsgraph_update_handler)
+    bpy.app.handlers.undo_post.append(undo_handler)
+    bpy.app.handlers.redo_post.append(undo_handler)
+    bpy.app.handlers.load_post.append(load_handler)
+
+def handle_unregister():
+    bpy.app.handlers.depsgraph_update_post.remove(depsgraph_update_handler)
+    bpy.app.handlers.undo_post.remove(undo_handler)
+    bpy.app.handlers.redo_post.remove(undo_handler)
+    bpy.app.handlers.load_post.remove(load_handler)
+    clear()
@@ -0,0 +1,88 @@
+import bmesh
+import hashlib
+import numpy as np
+
+# Merge distance used when dissolving degenerate geometry, the same as the Degenerate Dissolve operator's default
+DEGENERATE_DISTANCE = 0.0001
+
+# Geometry hashes of meshes as they were after they were last cleaned up, so meshes that haven't changed since then
+# can be skipped. A mesh matching its hash was already left clean, so this never needs to be invalidated.
+# mesh name -> geometry hash
+cleaned_hashes = {}
+
+# Counts of what a cleanup did
+class CleanupStats:
+    def __init__(self):
+        self.meshes = 0
+        self.skipped = 0
+        self.degenerate = 0
+        self.loose = 0
+
+# Returns a hash of the geometry of a mesh
+def _hash_mesh(mesh):
+    geometry_hash = hashlib.blake2b(digest_size=16)
+    geometry_hash.update(repr((len(mesh.vertices), len(mesh.edges), len(mesh.loops), len(mesh.polygons))).encode())
+
+    for (collection, prop, dtype, size) in [(mesh.vertices, "co", np.float32, 3),
+                                            (mesh.edges, "vertices", np.int32, 2),
+                                            (mesh.loops, "vertex_index", np.int32, 1),
+                                            (mesh.polygons, "loop_total", np.int32, 1)]:
+        values = np.empty(len(collection)*size, dtype=dtype)
+        collection.foreach_get(prop, values)
+        geometry_hash.update(values.tobytes())
+
+    return geometry_hash.digest()
+
+# Returns the number of vertices, edges and faces in a BMesh
+def _count_elements(bm):
+    return len(bm.verts) + len(bm.edges) + len(bm.faces)
+
+# Dissolves degenerate geometry and deletes loose vertices and edges of a mesh, returning the number of degenerate
+# and loose elements removed
+def cleanup_mesh(mesh):
+    bm = bmesh.new()
+    try:
+        bm.from_mesh(mesh)
+        count = _count_elements(bm)
+
+        bmesh.ops.dissolve_degenerate(bm, dist=DEGENERATE_DISTANCE, edges=bm.edges[:])
+        degenerate = count - _count_elements(bm)
+        count = _count_elements(bm)
+
+        loose_edges = [edge for edge in bm.edges if len(edge.link_faces) == 0]
+        if len(loose_edges) > 0:
+            bmesh.ops.delete(bm, geom=loose_edges, context='EDGES')
+        loose_verts = [vert for vert in bm.verts if len(vert.link_edges) == 0]
+        if len(loose_verts) > 0:
+            bmesh.ops.delete(bm, geom=loose_verts, context='VERTS')
+        loose = count - _count_elements(bm)
+
+        if degenerate > 0 or loose > 0:
+            bm.to_mesh(mesh)
+            mesh.update()
+    finally:
+        bm.free()
+
+    return degenerate, loose
+
+# Cleans up the meshes of a list of objects. Meshes shared by several objects are only cleaned up once, and meshes
+# whose geometry hasn't changed since they were last cleaned up are skipped.
+def cleanup_objects(objects):
+    stats = CleanupStats()
+    meshes = {obj.data.name: obj.data for obj in objects if obj.type == 'MESH' and obj.data.library is None}
+
+    for (name, mesh) in meshes.items():
+        stats.meshes += 1
+        if cleaned_hashes.get(name) == _hash_mesh(mesh):
+            stats.skipped += 1
+            continue
+
+        degenerate, loose = cleanup_mesh(mesh)
+        stats.degenerate += degenerate
+        stats.loose += loose
+        if degenerate > 0 or loose > 0:
+            print(f"\t{name}: removed {degenerate} degenerate and {loose} loose element(s)")
+
+        cleaned_hashes[name] = _hash_mesh(mesh)
+
+    return stats
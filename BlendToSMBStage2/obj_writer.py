@@ -0,0 +1,385 @@
+import bpy
+import hashlib
+import os
+import numpy as np
+
+from mathutils import Matrix
+from bpy_extras import anim_utils
+
+from . import external_tools, material_cache, texture_preprocess
+
+# Object types that can be converted to a mesh for export
+MESH_TYPES = {'MESH', 'CURVE', 'SURFACE', 'FONT', 'META'}
+
+# Changed whenever the writer's output changes, so OBJs written by an older version aren't mistaken for up to date
+WRITER_VERSION = 2
+
+# Most rows of an OBJ formatted at once, and the size of the buffer OBJ text is written through. These bound the
+# memory used by formatting, independently of the size of the stage.
+CHUNK_ROWS = 1 << 16
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Mesh buffers that determine the written geometry, as (collection, property, dtype, values per element)
+HASHED_BUFFERS = [("vertices", "co", np.float32, 3),
+                  ("loops", "vertex_index", np.int32, 1),
+                  ("polygons", "loop_total", np.int32, 1),
+                  ("polygons", "material_index", np.int32, 1),
+                  ("corner_normals", "vector", np.float32, 3)]
+
+# Counts of what was written to an OBJ
+class ObjStats:
+    def __init__(self):
+        self.objects = 0
+        self.vertices = 0
+        self.triangles = 0
+        self.materials = 0
+        self.skipped = False
+        self.textures_processed = 0
+        self.textures_reused = 0
+
+# Names in OBJ/MTL files can't contain spaces. Replaced the same way as Blender's OBJ exporter, so GxModelViewer
+# presets keep matching material names.
+def get_obj_name(name):
+    return name.replace(" ", "_")
+
+# Returns whether an object is exported to the OBJ
+def is_exported(obj):
+    return obj.type in MESH_TYPES and '[PATH]' not in obj.name and obj.visible_get()
+
+# Returns the matrix an object is exported with. Animated BG/FG models are exported at the origin, as their
+# animation is applied on top of the model in game. Like the exporter used to, this leaves out their location, scale
+# and animated rotation channels, but keeps any rotation that isn't animated.
+def get_export_matrix(obj):
+    if not (obj.name.startswith(("[BG]", "[FG]")) and obj.animation_data is not None and obj.animation_data.action is not None):
+        return obj.matrix_world
+
+    if obj.rotation_mode == 'QUATERNION':
+        rotation = Matrix.Identity(4)
+    elif obj.rotation_mode == 'AXIS_ANGLE':
+        rotation = Matrix.Rotation(obj.rotation_axis_angle[0], 4, obj.rotation_axis_angle[1:])
+    else:
+        euler = obj.rotation_euler.copy()
+        channelbag = anim_utils.action_get_channelbag_for_slot(obj.animation_data.action, obj.animation_data.action_slot)
+        for index in range(3):
+            if channelbag is not None and channelbag.fcurves.find("rotation_euler", index=index) is not None:
+                euler[index] = 0
+        rotation = euler.to_matrix().to_4x4()
+
+    return obj.matrix_world @ obj.matrix_basis.inverted_safe() @ rotation
+
+# Returns the path of a texture relative to the folder the MTL is in, or an absolute path if it's on another drive.
+# 'texture_paths' maps image names to preprocessed textures used instead of the image's own file.
+def get_texture_path(image, mtl_dir, texture_paths=None):
+    if texture_paths is not None and image.name in texture_paths:
+        image_path = texture_paths[image.name]
+    else:
+        image_path = os.path.normpath(bpy.path.abspath(image.filepath_raw, library=image.library))
+    try:
+        return os.path.relpath(image_path, mtl_dir)
+    except ValueError:
+        return image_path
+
+# Returns the illumination model of a material's MTL entry, picked the same way as Blender's OBJ exporter
+def get_illum(info):
+    transparent = info.color[3] != 1.0
+    if info.specular == 0.0:
+        return 1
+    elif info.metallic > 0.0:
+        return 6 if transparent else 3
+    elif transparent:
+        return 9
+    return 2
+
+# Returns the MTL entry of a material. Values are derived from the material the same way as Blender's OBJ exporter.
+def get_mtl_entry(mat, mtl_dir, texture_paths=None):
+    info = material_cache.get_material_info(mat)
+    color = info.color
+    specular_exponent = (1.0 - info.roughness)**2 * 1000.0
+    ambient = info.metallic if info.metallic != 0.0 else 1.0
+    emission = info.emission
+
+    lines = [f"newmtl {get_obj_name(mat.name)}",
+             f"Ns {specular_exponent:.6f}",
+             f"Ka {ambient:.6f} {ambient:.6f} {ambient:.6f}",
+             f"Kd {color[0]:.6f} {color[1]:.6f} {color[2]:.6f}",
+             f"Ks {info.specular:.6f} {info.specular:.6f} {info.specular:.6f}",
+             f"Ke {emission[0]:.6f} {emission[1]:.6f} {emission[2]:.6f}",
+             f"Ni {info.ior:.6f}",
+             f"d {color[3]:.6f}",
+             f"illum {get_illum(info)}"]
+
+    image = info.get_image()
+    if image is not None and image.filepath_raw != "":
+        lines.append(f"map_Kd {get_texture_path(image, mtl_dir, texture_paths)}")
+
+    return "\n".join(lines) + "\n\n"
+
+# Returns the path of the file recording the hash of the scene an OBJ was last written from
+def get_hash_path(obj_path):
+    return obj_path + ".hash"
+
+# Returns the size and modification time of an image's file, or None if it doesn't have one
+def _get_image_stat(image):
+    try:
+        image_stat = os.stat(bpy.path.abspath(image.filepath_raw, library=image.library))
+        return (image_stat.st_size, image_stat.st_mtime_ns)
+    except OSError:
+        return None
+
+# Adds the geometry of an evaluated mesh to a hash
+def _hash_mesh(content_hash, mesh):
+    content_hash.update(repr((len(mesh.vertices), len(mesh.loops), len(mesh.polygons))).encode())
+    for (collection_name, prop, dtype, size) in HASHED_BUFFERS:
+        collection = getattr(mesh, collection_name)
+        values = np.empty(len(collection)*size, dtype=dtype)
+        collection.foreach_get(prop, values)
+        content_hash.update(values.tobytes())
+
+    uv_layer = mesh.uv_layers.active
+    if uv_layer is not None:
+        uvs = np.empty(len(mesh.loops)*2, dtype=np.float32)
+        uv_layer.data.foreach_get("uv", uvs)
+        content_hash.update(uvs.tobytes())
+
+# Returns a hash of everything written to the OBJ and MTL: the names, transforms and geometry of the exported objects,
+# their materials and the files of their textures. Much cheaper than writing the OBJ, as nothing is formatted.
+def get_export_hash(context, mtl_dir, texture_settings=None, objects=None):
+    content_hash = hashlib.blake2b(digest_size=16)
+    content_hash.update(repr((WRITER_VERSION, bpy.app.version_string, texture_settings)).encode())
+    depsgraph = context.evaluated_depsgraph_get()
+    used_materials = {}
+
+    for obj in (objects if objects is not None else context.scene.objects):
+        if not is_exported(obj):
+            continue
+
+        obj_eval = obj.evaluated_get(depsgraph)
+        # The evaluated data of a mesh object can be read directly, other types need converting
+        mesh = obj_eval.data if obj.type == 'MESH' else obj_eval.to_mesh()
+        try:
+            if mesh is None:
+                continue
+
+            materials = [slot.material for slot in obj_eval.material_slots] or list(mesh.materials)
+            content_hash.update(repr((obj.name, [tuple(row) for row in get_export_matrix(obj)],
+                                      [mat.name if mat is not None else None for mat in materials])).encode())
+            _hash_mesh(content_hash, mesh)
+        finally:
+            if obj.type != 'MESH':
+                obj_eval.to_mesh_clear()
+
+        for mat in materials:
+            if mat is not None:
+                used_materials[mat.name] = mat
+
+    for mat in used_materials.values():
+        content_hash.update(get_mtl_entry(mat, mtl_dir).encode())
+        image = material_cache.get_material_info(mat).get_image()
+        if image is not None:
+            content_hash.update(repr(_get_image_stat(image)).encode())
+
+    return content_hash.hexdigest()
+
+# Formats the rows of an array with a printf style format for a single row, at most CHUNK_ROWS rows at a time, so
+# the formatted text of a huge mesh never has to be held in memory all at once
+def _iter_rows(row_format, values, offset=None):
+    for start in range(0, len(values), CHUNK_ROWS):
+        chunk = values[start:start+CHUNK_ROWS]
+        if offset is not None:
+            chunk = chunk + offset
+        yield (row_format * len(chunk)) % tuple(chunk.ravel().tolist())
+
+# Converts Blender coordinates (Z up) to OBJ coordinates (Y up, -Z forward)
+def _to_obj_axes(vectors):
+    return np.stack((vectors[:, 0], vectors[:, 2], -vectors[:, 1]), axis=1)
+
+# World space geometry of a mesh, ready to be written. Kept as NumPy buffers so the evaluated mesh can be freed
+# before anything is formatted.
+class MeshBuffers:
+    def __init__(self, mesh, matrix):
+        mesh.calc_loop_triangles()
+        vertex_count = len(mesh.vertices)
+        loop_count = len(mesh.loops)
+        triangle_count = len(mesh.loop_triangles)
+
+        positions = np.empty(vertex_count*3, dtype=np.float64)
+        mesh.vertices.foreach_get("co", positions)
+        positions = positions.reshape(-1, 3)
+
+        loop_vertices = np.empty(loop_count, dtype=np.int32)
+        mesh.loops.foreach_get("vertex_index", loop_vertices)
+
+        triangle_loops = np.empty(triangle_count*3, dtype=np.int32)
+        mesh.loop_triangles.foreach_get("loops", triangle_loops)
+        triangle_loops = triangle_loops.reshape(-1, 3)
+
+        triangle_materials = np.empty(triangle_count, dtype=np.int32)
+        mesh.loop_triangles.foreach_get("material_index", triangle_materials)
+
+        normals = np.empty(loop_count*3, dtype=np.float64)
+        mesh.corner_normals.foreach_get("vector", normals)
+        normals = normals.reshape(-1, 3)
+
+        # Transform into world space. Normals are transformed by the inverse transpose, and faces are flipped if the
+        # matrix mirrors them.
+        matrix_3x3 = np.array(matrix.to_3x3())
+        positions = positions @ matrix_3x3.T + np.array(matrix.translation)
+        normal_matrix = np.array(matrix.to_3x3().inverted_safe().transposed())
+        normals = normals @ normal_matrix.T
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+        if np.linalg.det(matrix_3x3) < 0:
+            triangle_loops = triangle_loops[:, ::-1]
+
+        # UVs and normals are shared between corners with the same value
+        self.positions = _to_obj_axes(positions) + 0.0
+        self.normals, normal_indices = np.unique(np.round(_to_obj_axes(normals), 4) + 0.0, axis=0, return_inverse=True)
+        uv_layer = mesh.uv_layers.active
+        if uv_layer is not None:
+            uvs = np.empty(loop_count*2, dtype=np.float32)
+            uv_layer.data.foreach_get("uv", uvs)
+            self.uvs, uv_indices = np.unique(uvs.reshape(-1, 2), axis=0, return_inverse=True)
+        else:
+            self.uvs = np.empty((0, 2))
+
+        # Faces are grouped by material, keeping their order within a material. Indices are 1 based, but relative
+        # to the start of this mesh.
+        order = np.argsort(triangle_materials, kind="stable")
+        triangle_loops = triangle_loops[order]
+        self.triangle_materials = triangle_materials[order]
+
+        face_indices = [loop_vertices[triangle_loops]]
+        if uv_layer is not None:
+            face_indices.append(uv_indices.reshape(-1).astype(np.int32)[triangle_loops])
+        face_indices.append(normal_indices.reshape(-1).astype(np.int32)[triangle_loops])
+        self.faces = np.stack(face_indices, axis=2) + 1
+
+    def get_counts(self):
+        return (len(self.positions), len(self.uvs), len(self.normals))
+
+# Yields the OBJ text of a mesh in chunks, with its indices starting after 'offsets' (the vertex, UV and normal
+# counts written so far)
+def iter_mesh_text(name, buffers, materials, offsets):
+    yield f"o {get_obj_name(name)}\n"
+    yield from _iter_rows("v %.6f %.6f %.6f\n", buffers.positions)
+    yield from _iter_rows("vt %.6f %.6f\n", buffers.uvs)
+    yield from _iter_rows("vn %.4f %.4f %.4f\n", buffers.normals)
+
+    if len(buffers.uvs) > 0:
+        face_format = "f %d/%d/%d %d/%d/%d %d/%d/%d\n"
+        face_offset = np.array(offsets, dtype=np.int64)
+    else:
+        face_format = "f %d//%d %d//%d %d//%d\n"
+        face_offset = np.array((offsets[0], offsets[2]), dtype=np.int64)
+
+    triangle_materials = buffers.triangle_materials
+    material_starts = np.flatnonzero(np.diff(triangle_materials)) + 1
+    for (start, end) in zip([0, *material_starts], [*material_starts, len(triangle_materials)]):
+        if start == end:
+            continue
+        material_index = triangle_materials[start]
+        mat = materials[material_index] if material_index < len(materials) else None
+        if mat is not None:
+            yield f"usemtl {get_obj_name(mat.name)}\n"
+        yield from _iter_rows(face_format, buffers.faces[start:end], face_offset)
+
+# Writes every exported object in the scene to an OBJ, with the materials they use in an MTL next to it.
+# The OBJ is streamed: each object is evaluated with its modifiers, read into buffers, freed and written before the
+# next one, so memory use depends on the largest mesh rather than the whole stage. The scene isn't changed.
+# With 'skip_unchanged' set, nothing is written if the OBJ and MTL were last written from an identical scene, which
+# leaves them untouched so tools reading them can skip their work too.
+# With 'texture_settings' set to (cache directory, maximum size), textures are preprocessed to power-of-two sizes and
+# the MTL points at the processed copies.
+# 'objects' limits the export to some of the scene's objects, in the order given.
+def write_obj(context, obj_path, skip_unchanged=False, texture_settings=None, objects=None):
+    stats = ObjStats()
+    depsgraph = context.evaluated_depsgraph_get()
+    mtl_path = os.path.splitext(obj_path)[0] + ".mtl"
+    mtl_dir = os.path.dirname(mtl_path)
+    hash_path = get_hash_path(obj_path)
+    used_materials = {}
+    offsets = (0, 0, 0)
+
+    if skip_unchanged:
+        export_hash = get_export_hash(context, mtl_dir, texture_settings, objects)
+        # Processed textures live in a cache folder that may have been cleared since, so the MTL's textures must
+        # still be there too
+        if (_read_hash(hash_path) == export_hash
+                and all(os.path.exists(path) for path in external_tools.get_obj_inputs(obj_path))):
+            stats.skipped = True
+            return stats
+
+    # Forget the old hash first, so an OBJ that fails to write is written again next time
+    if os.path.exists(hash_path):
+        os.remove(hash_path)
+
+    obj_temp_path = obj_path + ".tmp"
+    try:
+        with open(obj_temp_path, "w", buffering=WRITE_BUFFER_SIZE) as obj_file:
+            obj_file.write(f"# Blender {bpy.app.version_string}, BlendToSMBStage2\n")
+            obj_file.write(f"mtllib {os.path.basename(mtl_path)}\n")
+
+            for obj in (objects if objects is not None else context.scene.objects):
+                if not is_exported(obj):
+                    continue
+
+                obj_eval = obj.evaluated_get(depsgraph)
+                mesh = obj_eval.to_mesh()
+                try:
+                    if mesh is None or len(mesh.polygons) == 0:
+                        continue
+
+                    materials = [slot.material for slot in obj_eval.material_slots] or list(mesh.materials)
+                    buffers = MeshBuffers(mesh, get_export_matrix(obj))
+                finally:
+                    obj_eval.to_mesh_clear()
+
+                for text in iter_mesh_text(obj.name, buffers, materials, offsets):
+                    obj_file.write(text)
+                offsets = tuple(offset + count for (offset, count) in zip(offsets, buffers.get_counts()))
+                for mat in materials:
+                    if mat is not None:
+                        used_materials[mat.name] = mat
+
+                stats.objects += 1
+                stats.triangles += len(buffers.faces)
+                del buffers
+
+        texture_paths = None
+        if texture_settings is not None:
+            images = {}
+            for mat in used_materials.values():
+                image = material_cache.get_material_info(mat).get_image()
+                if image is not None:
+                    images[image.name] = image
+
+            preprocess_result = texture_preprocess.preprocess_images(images.values(), *texture_settings)
+            texture_paths = preprocess_result.paths
+            stats.textures_processed = preprocess_result.processed
+            stats.textures_reused = preprocess_result.reused
+
+        with open(mtl_path, "w") as mtl_file:
+            mtl_file.write(f"# Blender {bpy.app.version_string}, BlendToSMBStage2\n\n")
+            for mat in used_materials.values():
+                mtl_file.write(get_mtl_entry(mat, mtl_dir, texture_paths))
+    except BaseException:
+        if os.path.exists(obj_temp_path):
+            os.remove(obj_temp_path)
+        raise
+
+    os.replace(obj_temp_path, obj_path)
+    if skip_unchanged:
+        with open(hash_path, "w") as hash_file:
+            hash_file.write(export_hash)
+
+    stats.vertices = offsets[0]
+    stats.materials = len(used_materials)
+    return stats
+
+# Reads the hash recorded next to an OBJ, or None if there isn't one
+def _read_hash(hash_path):
+    try:
+        with open(hash_path, "r") as hash_file:
+            return hash_file.read().strip()
+    except OSError:
+        return None
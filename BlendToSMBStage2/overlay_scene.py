@@ -0,0 +1,277 @@
+import bpy
+import numpy as np
+
+from bpy.app.handlers import persistent
+
+from . import stage_object_drawing, primitives, hierarchy, statics
+from .descriptors import descriptors
+
+# The stage object overlay, kept between redraws. An object's shapes are only rendered again when the depsgraph
+# reports it changed, or the frame changes and it's animated.
+#
+# Each 3D view only draws the shapes whose bounding sphere is inside its frustum, and draws shapes made of circles
+# with fewer segments the smaller they are on screen. A view's batches of a shape group include shapes a little past
+# the edges of the view, and are only rebuilt when a shape comes into view that they leave out, a shape gets well past
+# the size its level of detail is drawn at, or the group is rendered again. Otherwise the batches of the last redraw
+# are drawn as they are, so orbiting and panning don't rebuild them on every redraw.
+
+# Name the fallout plane grid is kept under, as it doesn't belong to an object
+FALLOUT_GRID = ""
+
+FALLOUT_COLOR = (0.96, 0.26, 0.21, 0.3)
+
+# Radii in pixels on screen below which shapes in stage_object_drawing.LOD_SHAPES are drawn at each coarser level of
+# detail
+LOD_SCREEN_RADII = (48, 16)
+
+# How far past the edges of a view shapes are still put in its batches, as a fraction of the view's width and height
+CULL_MARGIN = 0.25
+
+# How far a shape's radius on screen has to get past a level of detail's radius before it's drawn at another level, as
+# a factor
+LOD_HYSTERESIS = 1.25
+
+# Model matrices of the shapes each object drew when it was last rendered
+# object name -> {shape group: (shapes, 4, 4) array}
+object_matrices = {}
+
+# Whether each object in the scene was visible when it was last rendered
+# object name -> bool
+object_visibility = {}
+
+# Objects drawing shapes in each group, the model matrices of all of their shapes, and the bounding sphere of each
+# shape
+# shape group -> set of object names
+group_objects = {}
+# shape group -> (shapes, 4, 4) array
+group_matrices = {}
+# shape group -> ((shapes, 3) array of centers, (shapes,) array of radii)
+group_bounds = {}
+
+# Batches drawn in each 3D view, with the model matrices and level of detail of each shape (-1 if left out) they were
+# built from
+# region pointer -> {shape group: (group matrices, (shapes,) levels, [GPUBatch or None for each level of detail])}
+view_batches = {}
+
+# Regions drawn since the last update that changed anything. Batches of views that weren't drawn in between two such
+# updates are dropped, so views that were closed don't keep theirs.
+drawn_regions = set()
+
+# Objects updated since the last redraw
+dirty_objects = set()
+
+# Whether the scene changed in a way that can affect any object (visibility, selection or scene settings) since the
+# last redraw
+scene_dirty = True
+
+# Whether the frame changed since the last redraw
+frame_dirty = False
+
+# Name of the scene the overlay was built from
+scene_name = None
+
+# Drops the whole overlay, so it's built again on the next redraw
+def clear():
+    global scene_dirty, frame_dirty, scene_name
+    object_matrices.clear()
+    object_visibility.clear()
+    group_objects.clear()
+    group_matrices.clear()
+    group_bounds.clear()
+    view_batches.clear()
+    drawn_regions.clear()
+    dirty_objects.clear()
+    scene_dirty = True
+    frame_dirty = False
+    scene_name = None
+
+# Returns whether an object can move when the frame changes
+def _is_animated(obj):
+    while obj is not None:
+        if obj.animation_data is not None or len(obj.constraints) > 0:
+            return True
+        obj = obj.parent
+    return False
+
+# Renders the shapes of an object, or the fallout plane grid if 'obj' is None, returning the model matrices of the
+# shapes of each shape group drawn in
+def _render(scene, obj):
+    if obj is None:
+        if scene.draw_falloutProp:
+            stage_object_drawing.draw_grid(-512, -512, 32, 32, 32, 32, scene.falloutProp, FALLOUT_COLOR)
+    else:
+        for desc in descriptors.get_descriptors(obj.name):
+            desc.render(obj)
+    shapes = stage_object_drawing.take_queued_shapes()
+    return {group: np.array(matrices, dtype=np.float32).reshape(-1, 4, 4) for (group, matrices) in shapes.items()}
+
+# Replaces the shapes an object drew, adding every shape group it draws or drew in to 'touched_groups'
+def _set_matrices(name, matrices, touched_groups):
+    old_matrices = object_matrices.pop(name, None)
+    if old_matrices is not None:
+        for group in old_matrices:
+            group_objects[group].discard(name)
+            touched_groups.add(group)
+
+    if len(matrices) > 0:
+        object_matrices[name] = matrices
+        for group in matrices:
+            group_objects.setdefault(group, set()).add(name)
+            touched_groups.add(group)
+
+# Renders every object that changed since the last redraw again, and gathers the shapes of the groups they draw in
+def update(scene):
+    global scene_dirty, frame_dirty, scene_name
+    if scene.name != scene_name:
+        clear()
+        scene_name = scene.name
+    if len(dirty_objects) == 0 and not scene_dirty and not frame_dirty:
+        return
+
+    for region in [region for region in view_batches if region not in drawn_regions]:
+        del view_batches[region]
+    drawn_regions.clear()
+
+    objects = {obj.name: obj for obj in scene.objects}
+    dirty = {name for name in dirty_objects if name in objects}
+
+    # Objects may have been added, shown or hidden, and item group grids depend on the selection and scene settings
+    if scene_dirty:
+        for (name, obj) in objects.items():
+            if "[IG]" in name or object_visibility.get(name) != obj.visible_get():
+                dirty.add(name)
+        dirty.add(FALLOUT_GRID)
+
+    # Item group grids are drawn where the item group is on the current frame
+    if frame_dirty:
+        dirty.update(name for (name, obj) in objects.items() if "[IG]" in name or _is_animated(obj))
+
+    dirty_objects.clear()
+    scene_dirty = False
+    frame_dirty = False
+
+    statics.hierarchy_index = hierarchy.HierarchyIndex(scene.objects)
+    touched_groups = set()
+    for name in dirty:
+        if name == FALLOUT_GRID:
+            _set_matrices(name, _render(scene, None), touched_groups)
+            continue
+
+        obj = objects[name]
+        visible = obj.visible_get()
+        object_visibility[name] = visible
+        _set_matrices(name, _render(scene, obj) if visible else {}, touched_groups)
+
+    # Objects that were deleted or renamed
+    for name in [name for name in object_visibility if name not in objects]:
+        del object_visibility[name]
+        _set_matrices(name, {}, touched_groups)
+
+    for group in touched_groups:
+        names = group_objects.get(group)
+        if names:
+            matrices = np.concatenate([object_matrices[name][group] for name in names])
+            group_matrices[group] = matrices
+            group_bounds[group] = primitives.transform_bounding_spheres(*stage_object_drawing.get_shape_bounds(group[0]), matrices)
+        else:
+            group_objects.pop(group, None)
+            group_matrices.pop(group, None)
+            group_bounds.pop(group, None)
+            for batches in view_batches.values():
+                batches.pop(group, None)
+
+# Returns the level of detail shapes are drawn at given their radii on screen, with the radius of each level scaled by
+# 'threshold_scale'. 'screen_radii' is None for groups whose shape only has one level.
+def _get_detail_levels(screen_radii, count, threshold_scale=1.0):
+    levels = np.zeros(count, dtype=np.int32)
+    if screen_radii is None:
+        return levels
+    for screen_radius in LOD_SCREEN_RADII[:stage_object_drawing.LOD_COUNT - 1]:
+        levels += screen_radii < screen_radius * threshold_scale
+    return levels
+
+# Returns whether batches built from 'built_levels' still draw every shape in view, each at a level of detail close
+# enough to the one it would be drawn at now
+def _are_batches_current(built_levels, in_view, screen_radii):
+    levels = built_levels[in_view]
+    if np.any(levels < 0):
+        return False
+    if screen_radii is None:
+        return True
+    screen_radii = screen_radii[in_view]
+    return bool(np.all((levels >= _get_detail_levels(screen_radii, len(levels), 1 / LOD_HYSTERESIS)) &
+                       (levels <= _get_detail_levels(screen_radii, len(levels), LOD_HYSTERESIS))))
+
+# Draws the overlay as of the last update in a 3D view, given its region and RegionView3D
+def draw(region, region_data):
+    drawn_regions.add(region.as_pointer())
+    batches = view_batches.setdefault(region.as_pointer(), {})
+    perspective_matrix = np.array(region_data.perspective_matrix, dtype=np.float32)
+    pixel_scale = region_data.window_matrix[1][1] * region.height / 2
+    # The view's frustum widened by the cull margin on every side
+    margin_scale = 1 / (1 + CULL_MARGIN)
+    margin_matrix = np.diag(np.array([margin_scale, margin_scale, 1, 1], dtype=np.float32)) @ perspective_matrix
+
+    drawn_batches = []
+    for (group, matrices) in group_matrices.items():
+        (centers, radii) = group_bounds[group]
+        in_view = primitives.cull_spheres(centers, radii, perspective_matrix)
+        screen_radii = None
+        if group[0] in stage_object_drawing.LOD_SHAPES:
+            screen_radii = primitives.get_screen_radii(centers, radii, perspective_matrix, pixel_scale)
+
+        cached = batches.get(group)
+        if cached is None or cached[0] is not matrices or not _are_batches_current(cached[1], in_view, screen_radii):
+            in_margin = primitives.cull_spheres(centers, radii, margin_matrix)
+            levels = np.where(in_margin, _get_detail_levels(screen_radii, len(radii)), -1)
+            lod_batches = []
+            for lod in range(stage_object_drawing.LOD_COUNT if screen_radii is not None else 1):
+                drawn = levels == lod
+                lod_batches.append(stage_object_drawing.build_group_batch(group, matrices[drawn], lod) if drawn.any() else None)
+            cached = (matrices, levels, lod_batches)
+            batches[group] = cached
+        drawn_batches.extend((group, batch) for batch in cached[2] if batch is not None)
+
+    stage_object_drawing.draw_group_batches(drawn_batches)
+
+@persistent
+def depsgraph_update_handler(scene, depsgraph):
+    global scene_dirty
+    for update in depsgraph.updates:
+        updated_id = update.id.original
+        if updated_id.id_type == 'OBJECT':
+            dirty_objects.add(updated_id.name)
+            # Item groups draw conveyor arrows at their children
+            if updated_id.parent is not None:
+                dirty_objects.add(updated_id.parent.name)
+        elif updated_id.id_type in ('SCENE', 'COLLECTION'):
+            scene_dirty = True
+
+@persistent
+def frame_change_handler(scene, depsgraph):
+    global frame_dirty
+    frame_dirty = True
+
+@persistent
+def undo_handler(dummy):
+    clear()
+
+@persistent
+def load_handler(dummy):
+    clear()
+
+def handle_register():
+    bpy.app.handlers.depsgraph_update_post.append(depsgraph_update_handler)
+    bpy.app.handlers.frame_change_post.append(frame_change_handler)
+    bpy.app.handlers.undo_post.append(undo_handler)
+    bpy.app.handlers.redo_post.append(undo_handler)
+    bpy.app.handlers.load_post.append(load_handler)
+
+def handle_unregister():
+    bpy.app.handlers.depsgraph_update_post.remove(depsgraph_update_handler)
+    bpy.app.handlers.frame_change_post.remove(frame_change_handler)
+    bpy.app.handlers.undo_post.remove(undo_handler)
+    bpy.app.handlers.redo_post.remove(undo_handler)
+    bpy.app.handlers.load_post.remove(load_handler)
+    clear()
+    stage_object_drawing.clear_shapes()
@@ -0,0 +1,176 @@
+import math
+import numpy as np
+
+# Line primitives the stage object overlay is built from, as NumPy arrays of vertices (one row each, every two rows
+# a line). Unit circles, cylinders, cones and sphere rings are built once per segment count and scaled and moved from
+# there. Only needs NumPy, so shapes can be built without Blender.
+
+ZERO_VEC = (0.0, 0.0, 0.0)
+
+# Rotations (XYZ euler in degrees) of the circles making up a sphere, and of the extra ones of a detailed sphere
+SPHERE_ROTATIONS = [(0, 0, 0), (90, 0, 0), (0, 90, 0)]
+DETAILED_SPHERE_ROTATIONS = [(45, 0, 0), (-45, 0, 0), (0, 45, 0), (0, -45, 0), (90, 45, 0), (90, -45, 0)]
+
+# Outline of a unit box centered on the origin
+BOX_POINTS = [[(-0.5, -0.5, -0.5), (-0.5, -0.5, +0.5), (-0.5, +0.5, +0.5), (-0.5, +0.5, -0.5),
+               (-0.5, -0.5, -0.5), (+0.5, -0.5, -0.5), (+0.5, -0.5, +0.5), (-0.5, -0.5, +0.5)],
+              [(+0.5, +0.5, +0.5), (+0.5, +0.5, -0.5), (+0.5, -0.5, -0.5), (+0.5, -0.5, +0.5),
+               (+0.5, +0.5, +0.5), (-0.5, +0.5, +0.5), (-0.5, +0.5, -0.5), (+0.5, +0.5, -0.5)]]
+
+# Points around unit circles on the XY plane, from angle 0 to the angle covered
+# (segments, radians) -> (segments + 1, 3) array
+circle_points = {}
+
+# Lines of unit cylinders (radius 1, from height 0 to 1) or cones (with their tip at height 1)
+# (segments, radians, cone) -> (vertices, 3) array
+unit_cylinders = {}
+
+# Lines of the circles of unit spheres, already rotated into place
+# (segments, detailed) -> (vertices, 3) array
+sphere_rings = {}
+
+# Returns the rotation matrix of an XYZ euler rotation in radians, as a 3x3 array
+def get_rotation_matrix(euler_rot):
+    (sin_x, sin_y, sin_z) = (math.sin(angle) for angle in euler_rot)
+    (cos_x, cos_y, cos_z) = (math.cos(angle) for angle in euler_rot)
+    x_rot = np.array([[1, 0, 0], [0, cos_x, -sin_x], [0, sin_x, cos_x]])
+    y_rot = np.array([[cos_y, 0, sin_y], [0, 1, 0], [-sin_y, 0, cos_y]])
+    z_rot = np.array([[cos_z, -sin_z, 0], [sin_z, cos_z, 0], [0, 0, 1]])
+    return x_rot @ y_rot @ z_rot
+
+# Returns a list of points as an array of vertices
+def as_points(points):
+    return np.asarray(points, dtype=np.float32).reshape(-1, 3)
+
+# Returns the lines of several shapes as one array
+def join_lines(*lines):
+    return np.concatenate([as_points(part) for part in lines])
+
+# Returns the line segments joining a strip of points
+def strip_lines(points):
+    points = as_points(points)
+    return np.stack([points[:-1], points[1:]], axis=1).reshape(-1, 3)
+
+# Returns line segments transformed by a 4x4 matrix
+def transform_lines(lines, matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return as_points(lines) @ matrix[:3, :3].T + matrix[:3, 3]
+
+# Returns line segments rotated about the origin by 'rot' (XYZ euler in radians)
+def rotate_lines(lines, rot):
+    if not any(rot):
+        return as_points(lines)
+    return (as_points(lines) @ get_rotation_matrix(rot).T).astype(np.float32)
+
+# Returns the vertices of a shape drawn with every one of a list of model matrices
+def transform_instances(coords, matrices):
+    matrices = np.array(matrices, dtype=np.float32).reshape(-1, 4, 4)
+    instances = coords @ matrices[:, :3, :3].transpose(0, 2, 1) + matrices[:, np.newaxis, :3, 3]
+    return instances.reshape(-1, 3)
+
+# Returns the points around a unit circle, building them the first time they're needed
+def get_circle_points(segments, radians=(2*math.pi)):
+    key = (segments, radians)
+    points = circle_points.get(key)
+    if points is None:
+        angles = np.arange(segments + 1) / segments * radians
+        points = np.zeros((segments + 1, 3), dtype=np.float32)
+        points[:, 0] = np.cos(angles)
+        points[:, 1] = np.sin(angles)
+        circle_points[key] = points
+    return points
+
+# Returns the line segments of a circle on the XY plane, rotated about the origin by 'rot' (XYZ euler in radians)
+def circle_lines(pos, rot, radius, segments, radians=(2*math.pi)):
+    points = get_circle_points(segments, radians) * (radius, radius, 0) + as_points(pos)
+    return rotate_lines(strip_lines(points), rot)
+
+# Returns the lines of a unit cylinder or cone, building them the first time they're needed: the bottom circle, the
+# top circle (cylinders only), then a line up the side from each point of the bottom circle
+def get_unit_cylinder(segments, radians=(2*math.pi), cone=False):
+    key = (segments, radians, cone)
+    lines = unit_cylinders.get(key)
+    if lines is None:
+        bottom = get_circle_points(segments, radians)
+        if cone:
+            top = np.zeros_like(bottom)
+            top[:, 2] = 1
+            lines = join_lines(strip_lines(bottom), np.stack([bottom, top], axis=1))
+        else:
+            top = bottom + (0, 0, 1)
+            lines = join_lines(strip_lines(bottom), strip_lines(top), np.stack([bottom, top], axis=1))
+        unit_cylinders[key] = lines
+    return lines
+
+# Returns the line segments of a cylindrical prism or a cone with a base having the number of sides provided by arg
+# 'segments'
+def cylinder_lines(pos, rot, radius, height, segments, *, cone=False, radians=(2*math.pi)):
+    lines = get_unit_cylinder(segments, radians, cone) * (radius, radius, height) + as_points(pos)
+    return rotate_lines(lines, rot)
+
+# Returns the line segments of a sphere at the specified position with the given radius.
+# A detailed sphere has more circles to outline the spherical shape.
+def sphere_lines(pos, radius, detailed=False, segments=32):
+    key = (segments, detailed)
+    rings = sphere_rings.get(key)
+    if rings is None:
+        rotations = SPHERE_ROTATIONS + (DETAILED_SPHERE_ROTATIONS if detailed else [])
+        rings = join_lines(*[circle_lines(ZERO_VEC, [math.radians(angle) for angle in rot], 1, segments)
+                             for rot in rotations])
+        sphere_rings[key] = rings
+    return rings * radius + as_points(pos)
+
+# Returns the line segments of a box at the specified position with the given size
+def box_lines(pos, scale):
+    return join_lines(*[strip_lines(points) for points in BOX_POINTS]) * as_points(scale) + as_points(pos)
+
+# Returns the line segments of a grid with the specified starting positions, square spacings, number of squares and
+# height
+def grid_lines(start_x, start_y, space_x, space_y, repeat_x, repeat_y, z):
+    xs = start_x + space_x * np.arange(repeat_x + 1)
+    ys = start_y + space_y * np.arange(repeat_y + 1)
+    end_x = start_x + space_x * repeat_x
+    end_y = start_y + space_y * repeat_y
+
+    columns = np.zeros((repeat_x + 1, 2, 3), dtype=np.float32)
+    columns[:, :, 0] = xs[:, np.newaxis]
+    columns[:, :, 1] = (start_y, end_y)
+    rows = np.zeros((repeat_y + 1, 2, 3), dtype=np.float32)
+    rows[:, :, 0] = (start_x, end_x)
+    rows[:, :, 1] = ys[:, np.newaxis]
+    return join_lines(columns, rows) + as_points((0, 0, z))
+
+# Returns the line segments of an arrow with the specified start and end position.
+# TODO: Allow proper rotation on the arrow
+def arrow_lines(start_pos, end_pos):
+    return as_points([start_pos, end_pos,
+                      end_pos, (end_pos[0] - 0.2, end_pos[1] - 0.2, end_pos[2]),
+                      end_pos, (end_pos[0] + 0.2, end_pos[1] - 0.2, end_pos[2])])
+
+# Returns the bounding sphere of a list of vertices, as its center and radius
+def get_bounding_sphere(coords):
+    center = (coords.min(axis=0) + coords.max(axis=0)) / 2
+    return center, float(np.linalg.norm(coords - center, axis=1).max())
+
+# Returns the bounding spheres of a shape drawn with each of a list of model matrices, from the shape's own bounding
+# sphere, as arrays of centers and radii
+def transform_bounding_spheres(center, radius, matrices):
+    centers = matrices[:, :3, :3] @ center + matrices[:, :3, 3]
+    # The largest singular value is the most the matrix stretches any direction, even if it shears
+    radii = radius * np.linalg.norm(matrices[:, :3, :3], ord=2, axis=(1, 2))
+    return centers, radii
+
+# Returns which of a list of bounding spheres are at least partly inside the view frustum of a perspective matrix
+# (projection @ view), as a boolean array
+def cull_spheres(centers, radii, perspective_matrix):
+    p = perspective_matrix
+    planes = np.array([p[3] + p[0], p[3] - p[0], p[3] + p[1], p[3] - p[1], p[3] + p[2], p[3] - p[2]])
+    planes /= np.linalg.norm(planes[:, :3], axis=1)[:, np.newaxis]
+    distances = centers @ planes[:, :3].T + planes[:, 3]
+    return np.all(distances >= -radii[:, np.newaxis], axis=1)
+
+# Returns the radii in pixels of a list of bounding spheres on screen. 'pixel_scale' is the projection's Y scale times
+# half the height of the view in pixels.
+def get_screen_radii(centers, radii, perspective_matrix, pixel_scale):
+    w = centers @ perspective_matrix[3, :3] + perspective_matrix[3, 3]
+    return radii * pixel_scale / np.maximum(w, 1e-6)
@@ -0,0 +1,230 @@
+# Compression of stagedefs into the LZ format Super Monkey Ball loads, so a .lz can be made from the .lz.raw Workshop 2
+# writes without running it again.
+#
+# The format is an 8 byte header (little endian compressed size including the header, then uncompressed size),
+# followed by LZSS data with a 4096 byte window: groups of 8 items, each preceded by a flag byte (least significant
+# bit first, set for a literal byte). A reference is 2 bytes holding a 12 bit window position and the match length
+# minus 3 (3 to 18 bytes).
+
+import os
+import struct
+import threading
+import numpy as np
+
+HEADER = struct.Struct("<II")
+
+# Window size, longest match and shortest match
+WINDOW_SIZE = 4096
+MAX_MATCH = 18
+MIN_MATCH = 3
+
+# Window positions are offset so the first byte of the data is at WINDOW_SIZE - MAX_MATCH, as in the decoder
+WINDOW_START = WINDOW_SIZE - MAX_MATCH
+
+# Furthest back a match can start. The decoder's window holds more, but this keeps matches clear of the bytes it's
+# about to overwrite.
+MAX_DISTANCE = WINDOW_SIZE - MAX_MATCH
+
+# Most earlier positions tried for each match. Higher values compress slightly better but slower.
+DEFAULT_MAX_CHAIN = 32
+
+# Returns the hash chains of the data: for every position (bar the last 2), the closest earlier position starting
+# with the same 3 bytes, or -1 if there isn't one. Built all at once by sorting positions by their 3 bytes, so the
+# compressor doesn't have to keep the chains up to date as it goes.
+def _get_chains(data):
+    if len(data) < MIN_MATCH:
+        return []
+    values = np.frombuffer(data, dtype=np.uint8).astype(np.int32)
+    keys = (values[:-2] << 16) | (values[1:-1] << 8) | values[2:]
+
+    # A stable sort keeps positions with the same key in order, so each one's predecessor is its previous position
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    sorted_prev = np.empty(len(order), dtype=np.int64)
+    sorted_prev[0] = -1
+    sorted_prev[1:] = np.where(sorted_keys[1:] == sorted_keys[:-1], order[:-1], -1)
+
+    prev = np.empty(len(order), dtype=np.int64)
+    prev[order] = sorted_prev
+    return prev.tolist()
+
+# Compresses data into the SMB LZ format, returning the compressed bytes including the header.
+# Matches are found greedily by following hash chains back through the window, trying at most 'max_chain' earlier
+# positions for each match.
+def compress(data, max_chain=DEFAULT_MAX_CHAIN):
+    data = bytes(data)
+    size = len(data)
+    prev = _get_chains(data)
+    chain_count = len(prev)
+
+    out = bytearray(HEADER.size)
+    flag_index = len(out)
+    out.append(0)
+    flag_bit = 1
+    pos = 0
+
+    while pos < size:
+        best_length = 0
+        best_pos = 0
+
+        candidate = prev[pos] if pos < chain_count else -1
+        if candidate >= 0 and pos - candidate <= MAX_DISTANCE:
+            max_length = size - pos if size - pos < MAX_MATCH else MAX_MATCH
+            target = data[pos:pos+max_length]
+            min_pos = pos - MAX_DISTANCE if pos > MAX_DISTANCE else 0
+            chain = max_chain
+
+            while candidate >= min_pos and chain > 0:
+                # Candidates are only compared byte by byte once they're known to beat the best match so far
+                if data[candidate:candidate+best_length+1] == target[:best_length+1]:
+                    length = best_length + 1
+                    while length < max_length and data[candidate+length] == target[length]:
+                        length += 1
+                    best_length = length
+                    best_pos = candidate
+                    if length == max_length:
+                        break
+                candidate = prev[candidate]
+                chain -= 1
+
+        if best_length >= MIN_MATCH:
+            window_pos = (best_pos + WINDOW_START) & (WINDOW_SIZE - 1)
+            out.append(window_pos & 0xFF)
+            out.append(((window_pos >> 4) & 0xF0) | (best_length - MIN_MATCH))
+            step = best_length
+        else:
+            out[flag_index] |= flag_bit
+            out.append(data[pos])
+            step = 1
+
+        pos += step
+
+        flag_bit <<= 1
+        if flag_bit == 0x100:
+            flag_index = len(out)
+            out.append(0)
+            flag_bit = 1
+
+    # Drop the flag byte of an empty last group
+    if flag_bit == 1:
+        del out[flag_index]
+
+    HEADER.pack_into(out, 0, len(out), size)
+    return bytes(out)
+
+# Decompresses SMB LZ data, returning the uncompressed bytes
+def decompress(data):
+    (_, size) = HEADER.unpack_from(data)
+    out = bytearray()
+    pos = HEADER.size
+
+    while len(out) < size:
+        flags = data[pos]
+        pos += 1
+        for bit in range(8):
+            if len(out) >= size:
+                break
+            if flags & (1 << bit):
+                out.append(data[pos])
+                pos += 1
+                continue
+
+            window_pos = data[pos] | ((data[pos+1] & 0xF0) << 4)
+            length = (data[pos+1] & 0x0F) + MIN_MATCH
+            pos += 2
+
+            # Bytes before the start of the data are the decoder's initial (zeroed) window
+            distance = ((len(out) + WINDOW_START - window_pos) & (WINDOW_SIZE - 1)) or WINDOW_SIZE
+            for _ in range(length):
+                source = len(out) - distance
+                out.append(out[source] if source >= 0 else 0)
+
+    return bytes(out)
+
+# Writes compressed data to a .lz file, replacing it in one step so it's never left half written
+def write_lz(lz_path, compressed):
+    temp_path = lz_path + ".tmp"
+    with open(temp_path, "wb") as lz_file:
+        lz_file.write(compressed)
+    os.replace(temp_path, lz_path)
+
+# Compresses a .lz.raw file into a .lz file
+def compress_file(raw_path, lz_path, max_chain=DEFAULT_MAX_CHAIN):
+    with open(raw_path, "rb") as raw_file:
+        data = raw_file.read()
+
+    compressed = compress(data, max_chain)
+    write_lz(lz_path, compressed)
+    return len(data), len(compressed)
+
+# A running tool writing an uncompressed stagedef, which is compressed into a LZ on a worker thread once the tool has
+# succeeded. Has the same interface as external_tools.ToolProcess, so compressing doesn't hold up Blender's UI.
+class CompressingProcess:
+    def __init__(self, tool, raw_path, lz_path, max_chain=DEFAULT_MAX_CHAIN):
+        self.tool = tool
+        self.raw_path = raw_path
+        self.lz_path = lz_path
+        self.max_chain = max_chain
+        # The tool's output, followed by the result of compressing
+        self.lines = tool.lines
+        self.read_count = 0
+        self.compressed = False
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def _run(self):
+        self.tool.wait()
+        if self.cancelled:
+            return
+        if not self.tool.succeeded():
+            self.lines.append(f"Error: {self.tool.tool_name} failed, so {self.lz_path} wasn't written")
+            return
+        if not os.path.isfile(self.raw_path):
+            self.lines.append(f"Error: {self.raw_path} wasn't written, so it couldn't be compressed")
+            return
+
+        try:
+            with open(self.raw_path, "rb") as raw_file:
+                data = raw_file.read()
+            compressed = compress(data, self.max_chain)
+
+            # Cancelling while compressing leaves the existing LZ alone
+            with self.lock:
+                if self.cancelled:
+                    return
+                write_lz(self.lz_path, compressed)
+        except OSError as e:
+            self.lines.append(f"Error: failed to compress {self.raw_path}: {e}")
+            return
+        self.lines.append(f"Compressed {len(data)} byte LZ.RAW into {len(compressed)} byte LZ: {self.lz_path}")
+        self.compressed = True
+
+    # Returns the lines printed since this was last called
+    def get_new_lines(self):
+        count = len(self.lines)
+        new_lines = self.lines[self.read_count:count]
+        self.read_count = count
+        return new_lines
+
+    def is_finished(self):
+        return not self.worker.is_alive()
+
+    def get_elapsed_seconds(self):
+        return self.tool.get_elapsed_seconds()
+
+    def succeeded(self):
+        return not self.cancelled and self.compressed
+
+    # Stops the tool. Compressing can't be interrupted, so if it's already started it's left to finish in the
+    # background, but its result is thrown away rather than written to the LZ.
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+        self.tool.cancel()
+
+    # Waits for the tool and compression to finish, returning all of the output
+    def wait(self):
+        self.worker.join()
+        return self.lines
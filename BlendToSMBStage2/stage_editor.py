@@ -1,18 +1,15 @@
 import itertools
-import stat
 import bpy
 import bmesh
 import os
 import copy
-import subprocess
 import sys
 import random
 import math
 import re
-import locale
 import gpu
 
-from . import statics, stage_object_drawing, generate_config, dimension_dict
+from . import statics, generate_config, dimension_dict, xml_writer, config_cache, hierarchy, external_tools, build_pipeline, export_profiler, mesh_cleanup, obj_writer, artifact_cache, smb_lz, gma_chunks, overlay_scene
 
 from .descriptors import descriptors, descriptor_item_group, descriptor_model_stage, descriptor_track_path, descriptor_model_bg, descriptor_model_fg
 from bpy.props import BoolProperty, PointerProperty, EnumProperty, FloatProperty, FloatVectorProperty, IntProperty
@@ -21,11 +18,6 @@ from mathutils import Vector, Matrix
 from bpy_extras import anim_utils
 
 import xml.etree.ElementTree as etree
-import xml.dom.minidom as minidom
-
-# To handle encoding shenanigans when we run GX/WS as subprocesses
-if platform == "win32":
-    from ctypes import windll
 
 # Operator for adding external background objects
 class OBJECT_OT_add_external_objects(bpy.types.Operator):
@@ -122,9 +114,9 @@ class OBJECT_OT_convert_selected(bpy.types.Operator):
             selected.data.name = new_name
 
         # Construct the newly converted object
-        for desc in descriptors.descriptors:
-            if selected.name.startswith(desc.get_object_name()): 
-                desc.construct(selected)
+        desc = descriptors.get_leading_descriptor(selected.name)
+        if desc is not None:
+            desc.construct(selected)
 
         updateUIProps(selected)
 
@@ -153,9 +145,8 @@ class OBJECT_OT_create_new_empty_and_select(bpy.types.Operator):
             bpy.context.object.select_set(False)
 
         # Set up custom Monkey Ball-related properties
-        for desc in descriptors.descriptors:
-            if desc.get_object_name() in newEmpty.name:
-                desc.construct(newEmpty)
+        for desc in descriptors.get_descriptors(newEmpty.name):
+            desc.construct(newEmpty)
 
         newEmpty.select_set(True)
         updateUIProps(newEmpty)
@@ -178,6 +169,9 @@ class OBJECT_OT_collision_grid_duplicate(bpy.types.Operator):
             obj["collisionStepCountX"] = active_ig["collisionStepCountX"]
             obj["collisionStepCountY"] = active_ig["collisionStepCountY"]
 
+            # Setting custom properties from Python doesn't notify the depsgraph, which the config cache relies on
+            obj.update_tag()
+
             # Update visual property preview TODO: Don't rely on this having to be implemented manually
             obj.item_group_properties.collisionStartX = obj["collisionStartX"]
             obj.item_group_properties.collisionStartY = obj["collisionStartY"]
@@ -291,6 +285,7 @@ class OBJECT_OT_collision_grid_fit(bpy.types.Operator):
         active_obj["collisionStartY"] = -1*(self.pos[1])   # Adjust for SMB coordinate system
         active_obj["collisionStepX"] = self.dimensions[0] / active_obj["collisionStepCountX"]
         active_obj["collisionStepY"] = self.dimensions[1] / active_obj["collisionStepCountY"]
+        active_obj.update_tag()
 
         updateUIProps(active_obj)
 
@@ -470,11 +465,10 @@ class VIEW3D_PT_3_active_object_panel(bpy.types.Panel):
             is_descriptor = False
             propertyGroup = []
 
-            for desc in descriptors.descriptors:
-                if desc.get_object_name() in obj.name:
-                    is_descriptor = True
-                    propertyGroup.append(desc.return_properties(obj))
-                    if "[MODEL]" not in obj.name: break
+            for desc in descriptors.get_descriptors(obj.name):
+                is_descriptor = True
+                propertyGroup.append(desc.return_properties(obj))
+                if "[MODEL]" not in obj.name: break
 
             for group in [group for group in propertyGroup if group is not None]:
                 for ui_prop in group.__annotations__.keys():
@@ -494,6 +488,19 @@ class VIEW3D_PT_4_export_panel(bpy.types.Panel):
         layout.prop(context.scene, "export_timestep")
         layout.prop(context.scene, "export_value_round")
         layout.prop(context.scene, "export_time_round")
+        layout.prop(context.scene, "export_keyframe_tolerance")
+        layout.prop(context.scene, "export_indent_xml")
+        layout.prop(context.scene, "export_use_fragment_cache")
+        layout.prop(context.scene, "export_skip_unchanged_obj")
+        layout.prop(context.scene, "export_use_artifact_cache")
+        layout.prop(context.scene, "export_preprocess_textures")
+        if context.scene.export_preprocess_textures:
+            layout.prop(context.scene, "export_max_texture_size")
+        layout.prop(context.scene, "export_experimental_gma_chunks")
+        if context.scene.export_experimental_gma_chunks:
+            layout.prop(context.scene, "export_gma_chunks")
+            if context.scene.export_gma_chunks > 1:
+                layout.prop(context.scene, "export_gma_chunk_mode")
         layout.label(text="Export Paths")
         layout.prop(context.scene, "export_config_path")
         layout.prop(context.scene, "export_model_path")
@@ -503,6 +510,7 @@ class VIEW3D_PT_4_export_panel(bpy.types.Panel):
         layout.prop(context.scene, "export_stagedef_path")
         layout.prop(context.scene, "export_background_path")
         layout.prop(context.scene, "gx_preset_path")
+        layout.prop(context.scene, "artifact_cache_path")
         layout.prop(context.scene, "auto_path_names")
         layout.label(text="Export Operators")
         layout.operator("object.generate_config", text="Generate Config")
@@ -512,7 +520,58 @@ class VIEW3D_PT_4_export_panel(bpy.types.Panel):
         export_lz_raw.compressed = False
         export_lz = layout.operator("object.export_stagedef", text="Export LZ")
         export_lz.compressed = True
+        export_both = layout.operator("object.export_stagedef", text="Export LZ + LZ.RAW")
+        export_both.write_both = True
         export_bg = layout.operator("object.export_background", text="Export Background")
+        layout.operator("object.build_stage", text="Build Stage")
+
+# UI sub-panel showing where the time went in the last export
+class VIEW3D_PT_4_export_timings_panel(bpy.types.Panel):
+    bl_idname = "VIEW3D_PT_4_export_timings_panel"
+    bl_label = "Export Timings"
+    bl_category = "Blend2SMB"
+    bl_space_type = "VIEW_3D"
+    bl_region_type = "UI"
+    bl_parent_id = "VIEW3D_PT_4_export_panel"
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(context.scene, "export_profile_log_path")
+
+        profile = export_profiler.last_profile
+        if profile is None:
+            layout.label(text="No exports run yet")
+            return
+
+        self.draw_profile(layout.column(align=True), profile, 0)
+
+    # Draws a profile and its phases, with any exports run during a phase indented under it
+    def draw_profile(self, layout, profile, depth):
+        indent = "    " * depth
+        memory_text = self.get_memory_change_text(profile.memory_change)
+        process_peak_memory = export_profiler.to_mb(profile.process_peak_memory)
+        if process_peak_memory is not None:
+            memory_text += f", process peak {process_peak_memory} MB"
+        layout.label(text=f"{indent}{profile.name}: {profile.seconds:.3f}s{memory_text}")
+
+        for phase in profile.phases:
+            counts_text = ", ".join(f"{count} {name}" for (name, count) in phase.counts.items())
+            if counts_text != "":
+                counts_text = f" ({counts_text})"
+            memory_text = self.get_memory_change_text(phase.memory_change)
+            peak_memory_change = export_profiler.to_mb(phase.peak_memory_change)
+            if peak_memory_change is not None:
+                memory_text += f", peak {peak_memory_change:+} MB"
+            layout.label(text=f"{indent}    {phase.name}: {phase.seconds:.3f}s{memory_text}{counts_text}")
+
+            for child in phase.children:
+                self.draw_profile(layout, child, depth + 2)
+
+    @staticmethod
+    def get_memory_change_text(memory_change):
+        memory_change = export_profiler.to_mb(memory_change)
+        return f", {memory_change:+} MB" if memory_change is not None else ""
 
 # UI panel for global scene/stage settings
 class VIEW3D_PT_5_settings(bpy.types.Panel):
@@ -548,22 +607,15 @@ class VIEW3D_OT_draw_stage_objects(bpy.types.Operator):
     bl_label = "Draw Stage Objects"
     bl_description = "Whether or not visual representations of stage objects should be drawn"
 
-    def modal(self, context, event):
-        context.area.tag_redraw()
-        return {'PASS_THROUGH'}
-
     def execute(self, context):
-        global draw_handlers
         if context.scene.draw_stage_objects and context.area.type == "VIEW_3D":
-            # Arguments passed to the callback
-            args = (self, context)
-            # Adds the region drawing callback
-            self._handle_3d = bpy.types.SpaceView3D.draw_handler_add(draw_callback_3d, args, "WINDOW", "POST_VIEW")
+            # Adds the region drawing callback. The viewport redraws by itself whenever the scene changes, so the
+            # overlay doesn't need to request redraws.
+            handle_3d = bpy.types.SpaceView3D.draw_handler_add(draw_callback_3d, (), "WINDOW", "POST_VIEW")
+            statics.active_draw_handlers.append(handle_3d)
+            context.area.tag_redraw()
 
-            statics.active_draw_handlers.append(self._handle_3d)
-            context.window_manager.modal_handler_add(self)
-
-            return {'RUNNING_MODAL'}
+            return {'FINISHED'}
         else:
             self.report({"WARNING"}, "View3D not found, or stage visibility toggled off.")
             return {'CANCELLED'}
@@ -745,22 +797,15 @@ class MATERIAL_OT_set_material_flags(bpy.types.Operator):
             mat.name = f"[{self.flag}_{self.name}] {mat.name}"
 
         return {'FINISHED'}
-# Callback function for drawing stage objects, as well as the fallout plane grid
-def draw_callback_3d(self, context):
+# Callback function for drawing stage objects, as well as the fallout plane grid. Only objects that changed since the
+# last redraw are rendered again, and only those in view are drawn (see overlay_scene).
+def draw_callback_3d():
     gpu.state.blend_set("ALPHA")
     gpu.state.depth_test_set("LESS_EQUAL")
 
-    if context.scene.draw_stage_objects:
-        # Draw objects
-        for obj in context.scene.objects:
-            if obj.visible_get():
-                for desc in descriptors.descriptors:
-                    if desc.get_object_name() in obj.name:
-                        desc.render(obj)
-        # Draw fallout plane
-        if bpy.context.scene.draw_falloutProp:
-            FALLOUT_COLOR = (0.96, 0.26, 0.21, 0.3)
-            stage_object_drawing.draw_grid(-512, -512, 32, 32, 32, 32, bpy.context.scene.falloutProp, FALLOUT_COLOR)
+    if bpy.context.scene.draw_stage_objects:
+        overlay_scene.update(bpy.context.scene)
+        overlay_scene.draw(bpy.context.region, bpy.context.region_data)
 
 # Function for automatically setting up path names
 def autoPathNames(self, context):
@@ -784,10 +829,9 @@ def autoUpdateUIProps():
 def updateUIProps(obj):
         propertyGroup = []
         # Append only one property group, unless the object has the '[MODEL]' tag
-        for desc in descriptors.descriptors:
-            if desc.get_object_name() in obj.name: 
-                propertyGroup.append(desc.return_properties(obj))
-                if "[MODEL]" not in obj.name: break
+        for desc in descriptors.get_descriptors(obj.name):
+            propertyGroup.append(desc.return_properties(obj))
+            if "[MODEL]" not in obj.name: break
         
         for group in [group for group in propertyGroup if group is not None]:
             for ui_prop in group.__annotations__.keys():
@@ -1014,406 +1058,443 @@ class OBJECT_OT_export_obj(bpy.types.Operator):
     bl_description = "Clean up model and export OBJ to the selected path"
     bl_options = {'UNDO'} 
 
+    # Writes the chunks the GMA/TPL is converted from (see gma_chunks) instead of the whole stage
+    gma_chunks: bpy.props.BoolProperty(default=False)
+
     def execute(self, context):
+        with export_profiler.profile("Export OBJ") as profile:
+            return self.export(context, profile)
+
+    def export(self, context, profile):
         origin_frame = context.scene.frame_start
 
         # Cleans up models to fix common crashes
         print("Cleaning up meshes...")
+        cleanup_phase = profile.start_phase("Mesh cleanup")
         if context.active_object is None:
             context.view_layer.objects.active = context.scene.objects[0]
 
         bpy.ops.object.mode_set(mode='OBJECT')
         bpy.ops.object.select_all(action='DESELECT')
-        for obj in [obj for obj in bpy.context.editable_objects if obj.type == 'MESH']:
-            print(str(obj))
-            bpy.context.view_layer.objects.active = obj
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.dissolve_degenerate()
-            bpy.ops.mesh.delete_loose()
-            bpy.ops.object.mode_set(mode='OBJECT')
+        cleanup_stats = mesh_cleanup.cleanup_objects(bpy.context.editable_objects)
+        cleanup_phase.count("meshes", cleanup_stats.meshes)
+        cleanup_phase.count("unchanged", cleanup_stats.skipped)
+        print(f"\tRemoved {cleanup_stats.degenerate} degenerate and {cleanup_stats.loose} loose element(s) from "
+              f"{cleanup_stats.meshes - cleanup_stats.skipped} mesh(es), {cleanup_stats.skipped} unchanged mesh(es) skipped")
+        if cleanup_stats.degenerate > 0 or cleanup_stats.loose > 0:
+            self.report({'INFO'}, f"Removed {cleanup_stats.degenerate} degenerate and {cleanup_stats.loose} loose mesh element(s)")
 
         # Sets frame to start
         context.scene.frame_set(origin_frame)
 
-        # BG and FG models need to be at the origin, so this saves their original world matrix and moves them
-        # Also clears and restores frame 0 animation data. Very jank - I hate everything about this
-        # If someone can find a smarter way to move things to the origin for export, and then move them back,
-        # while also preserving animation data, please let me know. I'm dumb
-        # (This is necessary since exporting as an OBJ will snap objects to their first keyframe position)
-
-        bg_fg_models = [obj for obj in bpy.context.scene.objects if (obj.name.startswith("[BG]") or obj.name.startswith("[FG]") and (obj.animation_data is not None and obj.animation_data.action is not None))]
-
-        orig_matrix_dict = {}
-        orig_pos_rot_scale = [{}, {}, {}]
+        # Meshes are written as they are on the first frame. Animated BG/FG models are written at the origin by the
+        # writer itself, so nothing in the scene needs to be moved or changed for the export.
+        print("Exporting OBJ...")
+        export_phase = profile.start_phase("OBJ writer")
+        texture_settings = None
+        if context.scene.export_preprocess_textures:
+            texture_settings = (get_texture_cache_dir(context.scene), int(context.scene.export_max_texture_size))
+
+        if self.gma_chunks:
+            return self.export_chunks(context, export_phase, texture_settings)
+
+        obj_stats = obj_writer.write_obj(context, bpy.path.abspath(context.scene.export_model_path),
+                                         context.scene.export_skip_unchanged_obj, texture_settings)
+        if obj_stats.skipped:
+            print("\tStage geometry and materials unchanged since the last export, OBJ not rewritten")
+            export_phase.name = "OBJ unchanged"
+        export_phase.count("objects", obj_stats.objects)
+        export_phase.count("vertices", obj_stats.vertices)
+        export_phase.count("triangles", obj_stats.triangles)
+        export_phase.count("materials", obj_stats.materials)
+        if texture_settings is not None and not obj_stats.skipped:
+            export_phase.count("textures processed", obj_stats.textures_processed)
+            export_phase.count("textures reused", obj_stats.textures_reused)
+            print(f"\tProcessed {obj_stats.textures_processed} texture(s), reused {obj_stats.textures_reused} unchanged texture(s)")
 
-        for obj in bg_fg_models:
-            if obj.animation_data is not None and obj.animation_data.action is not None:
-                orig_matrix_dict[obj.name] = copy.copy(obj.matrix_world)
-                print("\tMoving object " + obj.name + " to origin for export")
+        print("Finished exporting OBJ")
+        return {'FINISHED'}
 
-                action = obj.animation_data.action
-                action_slot = obj.animation_data.action_slot
-                channelbag = anim_utils.action_get_channelbag_for_slot(action, action_slot)
-                fcurves  = channelbag.fcurves
-
-                orig_pos = [None, None, None]
-                orig_rot = [None, None, None]
-                orig_scale = [None, None, None]
-
-                # Position keyframes
-                for index in [0, 1, 2]:
-                    # Find location fcurve for current channel (X, Y, Z position)
-                    fcurve = fcurves.find("location", index=index)
-                    if fcurve is not None:
-                        default_keyframe_point = -1
-                        # Look for a keyframe that exists on the currently selected frame
-                        for keyframe_index in range(len(fcurve.keyframe_points)):
-                            if fcurve.keyframe_points[keyframe_index].co[0] == float(origin_frame):
-                                default_keyframe_point = keyframe_index
-                                break
-
-                        # If a keyframe already exists on the currently selected frame, set its value to 0
-                        if default_keyframe_point != -1:
-                            orig_pos[index] = obj.location[index]
-                            fcurve.keyframe_points[default_keyframe_point].co[1] = 0
-
-                        # Otherwise, create a new keyframe and set its value to zero
-                        else:
-                            obj.location[index] = 0
-                            obj.keyframe_insert("location", index=index, frame=origin_frame)
-
-                orig_pos_rot_scale[0][obj.name] = orig_pos
-
-                # Rotation keyframes
-                for index in [0, 1, 2]:
-                    fcurve = fcurves.find("rotation_euler", index=index)
-                    if fcurve is not None:
-                        default_keyframe_point = -1
-                        # Look for a keyframe that exists on the currently selected frame
-                        for keyframe_index in range(len(fcurve.keyframe_points)):
-                            if fcurve.keyframe_points[keyframe_index].co[0] == float(origin_frame):
-                                default_keyframe_point = keyframe_index
-                                break
-
-                        # If a keyframe already exists on the currently selected frame, set its value to 0
-                        if default_keyframe_point != -1:
-                            orig_rot[index] = obj.rotation_euler[index]
-                            fcurve.keyframe_points[default_keyframe_point].co[1] = 0
+    def export_chunks(self, context, export_phase, texture_settings):
+        scene = context.scene
+        export_phase.name = "OBJ chunk writer"
+        (chunk_paths, chunk_stats) = gma_chunks.write_chunks(context, bpy.path.abspath(scene.export_model_path),
+                                                             bpy.path.abspath(scene.export_gma_path),
+                                                             bpy.path.abspath(scene.export_tpl_path),
+                                                             gma_chunks.get_chunk_count(scene), scene.export_gma_chunk_mode,
+                                                             scene.export_skip_unchanged_obj, texture_settings)
+        if len(chunk_paths) == 0:
+            self.report({'ERROR'}, "No objects to export")
+            return {'CANCELLED'}
 
-                        else:
-                            obj.rotation_euler[index] = 0
-                            obj.keyframe_insert("rotation_euler", index=index, frame=origin_frame)
-
-                orig_pos_rot_scale[1][obj.name] = orig_rot
-
-                # Scale keyframes
-                for index in [0, 1, 2]:
-                    fcurve = fcurves.find("scale", index=index)
-                    if fcurve is not None:
-                        default_keyframe_point = -1
-                        # Look for a keyframe that exists on the currently selected frame
-                        for keyframe_index in range(len(fcurve.keyframe_points)):
-                            if fcurve.keyframe_points[keyframe_index].co[0] == float(origin_frame):
-                                default_keyframe_point = keyframe_index
-                                break
-
-                        # If a keyframe already exists on the currently selected frame, set its value to 0
-                        if default_keyframe_point != -1:
-                            orig_scale[index] = obj.scale[index]
-                            fcurve.keyframe_points[default_keyframe_point].co[1] = 1
-                        else:
-                            obj.scale[index] = 1
-                            obj.keyframe_insert("scale", index=index)
+        unchanged_count = sum(1 for stats in chunk_stats if stats.skipped)
+        export_phase.count("chunks", len(chunk_paths))
+        export_phase.count("unchanged", unchanged_count)
+        export_phase.count("objects", sum(stats.objects for stats in chunk_stats))
+        export_phase.count("triangles", sum(stats.triangles for stats in chunk_stats))
+        print(f"\tWrote {len(chunk_paths) - unchanged_count} OBJ chunk(s), {unchanged_count} unchanged chunk(s) not rewritten")
 
-                orig_pos_rot_scale[2][obj.name] = orig_scale
+        print("Finished exporting OBJ chunks")
+        return {'FINISHED'}
 
-                # For non-animated channels
-                obj.location = (0,0,0)
-                obj.rotation_quaternion = (1, 0, 0, 0)
-                obj.scale = (1, 1, 1)
+# Base class for operators that export files, then run an external tool on them.
+# Run from the UI, the tool runs in the background so Blender stays usable. Its latest output and any warnings are
+# shown in the status bar, and Esc stops it. Run from a script, the operator waits for the tool to finish.
+#
+# Subclasses define:
+#   prepare(self, context, profile): exports the files the tool reads, returning the tool's command line
+#   get_errors(self, output_lines): returns the warning and error lines of the tool's output
+class ExternalToolOperator:
+    tool_name = ""
+    profile_name = ""
+    error_message = ""
+
+    # Returns the artifact cache entry of running the tool with the given command line, or None if the tool's outputs
+    # aren't cached
+    def get_artifacts(self, context, cache_dir, args):
+        return None
+
+    # Starts the tool with the given command line, returning the running external_tools.ToolProcess (or an object
+    # with the same interface)
+    def start_tool(self, context, args):
+        return external_tools.ToolProcess(args, self.tool_name)
+
+    # Puts the tool's outputs in place from the artifact cache if they're there. Returns the tool's output lines, or
+    # None if the tool needs to run.
+    def restore_artifacts(self, context, args, profile):
+        cache_dir = get_artifact_cache_dir(context.scene)
+        self.artifacts = self.get_artifacts(context, cache_dir, args) if cache_dir is not None else None
+        if self.artifacts is None:
+            return None
+
+        profile.start_phase("Artifact cache lookup")
+        output_lines = self.artifacts.restore()
+        if output_lines is not None:
+            print(f"{self.tool_name} inputs unchanged, outputs restored from cache")
+            profile.current_phase.name = f"{self.tool_name} (cached)"
+        else:
+            self.artifacts.prepare_outputs()
+        return output_lines
 
-        print("Exporting OBJ...")
+    # Stores the outputs of a successful run of the tool in the artifact cache
+    def store_artifacts(self, tool):
+        if self.artifacts is not None and tool.succeeded():
+            self.artifacts.store(tool.lines)
 
-        # Dumb hacky way to not export path curves since they screw everything up
-        bpy.ops.object.select_all(action='DESELECT')
-        for obj in context.scene.objects:
-            if '[PATH]' not in obj.name:
-                obj.select_set(True)
+    def execute(self, context):
+        profile = export_profiler.start_profile(self.profile_name)
+        try:
+            with export_profiler.activate(profile):
+                args = self.prepare(context, profile)
+
+            tool = None
+            output_lines = self.restore_artifacts(context, args, profile)
+            if output_lines is None:
+                profile.start_phase(self.tool_name)
+                tool = self.start_tool(context, args)
+                output_lines = tool.wait()
+                self.store_artifacts(tool)
+            print('\n'.join(output_lines))
+
+            errors = self.get_errors(output_lines)
+            if tool is not None:
+                self.check_succeeded(tool, errors)
+        except external_tools.ExternalToolError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        finally:
+            export_profiler.finish_profile(profile)
 
-        # Oh gosh, more hacky stuff... this lets the unshaded material preview work since only
-        # principled BSDF materials get exported by Blender's OBJ exporter
-        for mat in bpy.data.materials:
-            if mat.use_nodes and "[UNSHADED]" in mat.name:
-                nodes = mat.node_tree.nodes
-                links = mat.node_tree.links
-
-                material_output_node = None
-                image_texture_node = None
-                emission_node = None
-
-                for node in nodes:
-                    if node.type == 'BSDF_PRINCIPLED':
-                        continue
-                    elif node.type =='OUTPUT_MATERIAL':
-                        material_output_node = node
-                    elif node.type == 'TEX_IMAGE':
-                        image_texture_node = node
-                    elif node.type == 'EMISSION':
-                        emission_node = node
-
-                # Convert emission to principled BSDF
-                if emission_node is not None:
-                    print("Converting material " + mat.name + " from emission to principled BSDF")
-                    nodes.remove(emission_node)
-                    principled_node = nodes.new("ShaderNodeBsdfPrincipled")
-                    links.new(material_output_node.inputs['Surface'], principled_node.outputs['BSDF'])
-                    links.new(principled_node.inputs['Base Color'], image_texture_node.outputs['Color'])
-
-        bpy.ops.wm.obj_export(
-                filepath=bpy.path.abspath(context.scene.export_model_path),
-                export_triangulated_mesh=True,
-                export_selected_objects=True,
-                path_mode="RELATIVE",
-            )
+        return self.report_errors(errors)
 
-        bpy.ops.object.select_all(action='DESELECT')
+    def invoke(self, context, event):
+        self.profile = export_profiler.start_profile(self.profile_name)
+        try:
+            with export_profiler.activate(self.profile):
+                args = self.prepare(context, self.profile)
+
+            output_lines = self.restore_artifacts(context, args, self.profile)
+            if output_lines is not None:
+                print('\n'.join(output_lines))
+                errors = self.get_errors(output_lines)
+                export_profiler.finish_profile(self.profile)
+                return self.report_errors(errors)
+
+            self.tool_phase = self.profile.start_phase(self.tool_name)
+            self.tool = self.start_tool(context, args)
+        except external_tools.ExternalToolError as e:
+            export_profiler.finish_profile(self.profile)
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        except:
+            export_profiler.finish_profile(self.profile)
+            raise
 
-        # Undoes the hacky thing
-        for mat in bpy.data.materials:
-            if mat.use_nodes and '[UNSHADED]' in mat.name:
-                nodes = mat.node_tree.nodes
-                links = mat.node_tree.links
-
-                material_output_node = None
-                image_texture_node = None
-                principled_node = None
-
-                for node in nodes:
-                    if node.type == 'BSDF_PRINCIPLED':
-                        principled_node = node
-                    elif node.type =='OUTPUT_MATERIAL':
-                        material_output_node = node
-                    elif node.type == 'TEX_IMAGE':
-                        image_texture_node = node
-
-                # Convert Principled BSDF to Emission
-                if principled_node is not None:
-                    print("Converting material " + mat.name + " from principled BSDF to emission")
-                    nodes.remove(principled_node)
-                    emission_node = nodes.new("ShaderNodeEmission")
-                    links.new(material_output_node.inputs['Surface'], emission_node.outputs['Emission'])
-                    links.new(emission_node.inputs['Color'], image_texture_node.outputs['Color'])
-
-        # Restore original position and animation
-        for obj in bg_fg_models:
-            if obj.animation_data is not None and obj.animation_data.action is not None:
-                print("\tRestoring position and animation of " + obj.name)
+        self.errors = []
+        self.timer = context.window_manager.event_timer_add(0.1, window=context.window)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
 
-                action = obj.animation_data.action
-                action_slot = obj.animation_data.action_slot
-                channelbag = anim_utils.action_get_channelbag_for_slot(action, action_slot)
-                fcurves  = channelbag.fcurves
-
-                # Position keyframes
-                for index in [0, 1, 2]:
-                    fcurve = fcurves.find("location", index=index)
-                    if fcurve is not None:
-                        if orig_pos_rot_scale[0][obj.name][index] is not None:
-                            default_keyframe_point = -1
-                            # Look for a keyframe that exists on the currently selected frame
-                            for keyframe_index in range(len(fcurve.keyframe_points)):
-                                if fcurve.keyframe_points[keyframe_index].co[0] == float(origin_frame):
-                                    default_keyframe_point = keyframe_index
-                                    break
-                        # If a keyframe already exists on the currently selected frame, set its value to 0
-                            fcurve.keyframe_points[default_keyframe_point].co[1] = orig_pos_rot_scale[0][obj.name][index]
-                        else:
-                            obj.keyframe_delete("location", index=index, frame=origin_frame)
-
-                # Rotation keyframes
-                for index in [0, 1, 2]:
-                    fcurve = fcurves.find("rotation_euler", index=index)
-                    if fcurve is not None:
-                        if orig_pos_rot_scale[1][obj.name][index] is not None:
-                            default_keyframe_point = -1
-                            # Look for a keyframe that exists on the currently selected frame
-                            for keyframe_index in range(len(fcurve.keyframe_points)):
-                                if fcurve.keyframe_points[keyframe_index].co[0] == float(origin_frame):
-                                    default_keyframe_point = keyframe_index
-                                    break
-                        # If a keyframe already exists on the currently selected frame, set its value to 0
-                            fcurve.keyframe_points[default_keyframe_point].co[1] = orig_pos_rot_scale[1][obj.name][index]
-                        else:
-                            obj.keyframe_delete("rotation_euler", index=index, frame=origin_frame)
-
-                # Scale keyframes
-                for index in [0, 1, 2]:
-                    fcurve = fcurves.find("scale", index=index)
-                    if fcurve is not None:
-                        if orig_pos_rot_scale[2][obj.name][index] is not None:
-                            default_keyframe_point = -1
-                            # Look for a keyframe that exists on the currently selected frame
-                            for keyframe_index in range(len(fcurve.keyframe_points)):
-                                if fcurve.keyframe_points[keyframe_index].co[0] == float(origin_frame):
-                                    default_keyframe_point = keyframe_index
-                                    break
-                        # If a keyframe already exists on the currently selected frame, set its value to 0
-                            fcurve.keyframe_points[default_keyframe_point].co[1] = orig_pos_rot_scale[2][obj.name][index]
-                        else:
-                            obj.keyframe_delete("scale", index=index, frame=origin_frame)
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            self.tool.cancel()
+            self.tool_phase.name += " (cancelled)"
+            self.stop(context)
+            self.report({'WARNING'}, f"{self.tool_name} cancelled")
+            return {'CANCELLED'}
 
-                obj.matrix_world = orig_matrix_dict[obj.name]
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        self.read_output()
+
+        if self.tool.is_finished():
+            # Lines written between the read above and the tool finishing
+            self.read_output()
+            self.check_succeeded(self.tool, self.errors)
+            self.store_artifacts(self.tool)
+            self.stop(context)
+            return self.report_errors(self.errors)
+
+        status = f"{self.tool_name} running ({self.tool.get_elapsed_seconds():.0f}s)"
+        if len(self.errors) > 0:
+            status += f", {len(self.errors)} warning(s): {self.errors[-1]}"
+        elif len(self.tool.lines) > 0:
+            status += f": {self.tool.lines[-1]}"
+        context.workspace.status_text_set(status + " - Esc to cancel")
+        return {'PASS_THROUGH'}
 
-        print("Finished exporting OBJ")
+    # Prints the tool's output since the last call, adding its warnings and errors to the ones reported at the end
+    def read_output(self):
+        new_lines = self.tool.get_new_lines()
+        for line in new_lines:
+            print(line)
+        self.errors.extend(self.get_errors(new_lines))
+
+    # Adds an error if the tool failed without printing one, so a failed run is never reported as a success
+    def check_succeeded(self, tool, errors):
+        if not tool.succeeded() and len(errors) == 0:
+            errors.append(f"{self.tool_name} failed, see the console for its output")
+
+    # Cleans up once the tool has finished or been cancelled
+    def stop(self, context):
+        context.window_manager.event_timer_remove(self.timer)
+        context.workspace.status_text_set(None)
+        export_profiler.finish_profile(self.profile)
+
+    def report_errors(self, errors):
+        if len(errors) > 0:
+            self.report({'ERROR'}, self.error_message + "\n".join(errors))
         return {'FINISHED'}
 
 # Operator for calling GxModelViewer to export the stage model as a .GMA and .TPL file
-class OBJECT_OT_export_gmatpl(bpy.types.Operator):
+class OBJECT_OT_export_gmatpl(ExternalToolOperator, bpy.types.Operator):
     bl_idname = "object.export_gmatpl"
     bl_label = "Export OBJ"
     bl_description = "Export an OBJ, then call GxModelViewer to export a GMA/TPL to the specified path"
     bl_options = {'UNDO'} 
 
-    def execute(self, context):
-        bpy.ops.object.export_obj("INVOKE_DEFAULT")
-        obj_path = bpy.path.abspath(context.scene.export_model_path)
-        gma_path = bpy.path.abspath(context.scene.export_gma_path)
-        tpl_path = bpy.path.abspath(context.scene.export_tpl_path)
-
-        if platform == "linux" or platform == "linux2":
-            gx_path = bpy.utils.script_path_user() + "/addons/BlendToSMBStage2/GxUtils/GxModelViewer"
-        else:
-            gx_path = bpy.utils.script_path_user() + "/addons/BlendToSMBStage2/GxUtils/GxModelViewer.exe"
-
-        preset_path = bpy.path.abspath(context.scene.gx_preset_path)
-
-        args = []
-        args.append(gx_path)
-        args.append("-setPresetFolder")
-        args.append(preset_path)
-        args.append("-importObjMtl")
-        args.append(obj_path)
-        args.append("-removeUnusedTextures")
-
-        import_gma_path = bpy.path.abspath(context.scene.import_gma_path) 
-        import_tpl_path = bpy.path.abspath(context.scene.import_tpl_path)
-        if os.path.exists(import_gma_path) and os.path.exists(import_tpl_path):
-            args.append("-mergeGmaTpl")
-            args.append(import_gma_path + "," + import_tpl_path)
-
-        args.append("-exportGma")
-        args.append(gma_path)
-        args.append("-exportTpl")
-        args.append(tpl_path)
-
-        if not os.path.exists(gx_path):
-            self.report({'ERROR'}, "GxModelViewer not found. Ensure you have downloaded BlendToSMBStage2 from the 'Releases' section on GitHub, not from the 'Code' dropdown.")
-            return {'CANCELLED'}
-
-        try:
-            gx_result = subprocess.run(args, capture_output=True)
-        except PermissionError:
-            try:
-                os.chmod(gx_path, stat.S_IRWXU | stat.S_IROTH | stat.S_IRGRP)  # attempt to set execute permissions for the owner
-                gx_result = subprocess.run(args, capture_output=True)
-            except:
-                self.report({'ERROR'}, f"GxModelViewer does not have the correct permissions to run. \nPlease set executable permissions on:\n{gx_path}")
-                return {'CANCELLED'}
-        except:
-            self.report({'ERROR'}, f"GxModelViewer failed to run. See the console for more details.")
-            return {'CANCELLED'}
-
-        
-        gx_stdout_bytes = gx_result.stdout
-
-        try:
-            gx_stdout_str = gx_stdout_bytes.decode().split('\r\n')
-        except UnicodeDecodeError:
-            try:
-                if sys.platform == 'win32':
-                    codepage = f"cp{windll.kernel32.GetConsoleOutputCP()}"
-                    gx_stdout_str = gx_stdout_bytes.decode(encoding=codepage).split('\r\n')
-                else:
-                    gx_stdout_str = gx_stdout_bytes.decode(encoding=locale.getpreferredencoding(False)).split('\r\n')
-            except:
-                gx_stdout_str = gx_stdout_bytes.decode(errors="replace").split('\r\n')
-
-        errors = [error for error in gx_stdout_str if ("Import Warning" in error) or ("Error" in error)]
-        if len(errors) > 0:
-            self.report({'ERROR'}, "GxModelViewer warnings/errors occured: " + "\n".join(errors))
-        
-        print('\n'.join(gx_stdout_str))
-        
-        return {'FINISHED'}
-
-# Operator for calling Workshop 2 to export the stage config as a .LZ or .LZ.RAW file
-class OBJECT_OT_export_stagedef(bpy.types.Operator):
+    tool_name = "GxModelViewer"
+    profile_name = "Export GMA/TPL"
+    error_message = "GxModelViewer warnings/errors occured: "
+
+    def prepare(self, context, profile):
+        profile.start_phase("OBJ export")
+        chunked = gma_chunks.get_chunk_count(context.scene) > 1
+        bpy.ops.object.export_obj("INVOKE_DEFAULT", gma_chunks=chunked)
+        return external_tools.get_gx_args(context.scene)
+
+    def get_errors(self, output_lines):
+        return external_tools.get_gx_errors(output_lines)
+
+    def get_artifacts(self, context, cache_dir, args):
+        # Chunks are cached one by one as they're converted
+        if gma_chunks.get_chunk_count(context.scene) > 1:
+            return None
+        return artifact_cache.get_gx_artifacts(cache_dir, args)
+
+    def start_tool(self, context, args):
+        chunk_count = gma_chunks.get_chunk_count(context.scene)
+        if chunk_count <= 1:
+            return external_tools.ToolProcess(args, self.tool_name)
+
+        (chunk_args, merge_args) = gma_chunks.get_gx_args(args, chunk_count)
+        return gma_chunks.ChunkedGxProcess(chunk_args, merge_args, get_artifact_cache_dir(context.scene))
+
+# Operator for calling Workshop 2 to export the stage config as a .LZ or .LZ.RAW file.
+# With 'write_both', Workshop 2 writes the .LZ.RAW, which is then compressed into the .LZ in the background without
+# running it again.
+class OBJECT_OT_export_stagedef(ExternalToolOperator, bpy.types.Operator):
     bl_idname = "object.export_stagedef"
     bl_label = "Export OBJ"
     bl_description = "Export an OBJ, then call Workshop 2 to export a LZ/LZ.RAW to the specified path"
     bl_options = {'UNDO'} 
 
     compressed: bpy.props.BoolProperty(default=True)
+    write_both: bpy.props.BoolProperty(default=False)
 
-    def execute(self, context):
+    tool_name = "SMB Workshop 2"
+    profile_name = "Export LZ"
+    error_message = "Workshop 2 warnings/errors occurred: "
+
+    def prepare(self, context, profile):
+        profile.start_phase("OBJ export")
         bpy.ops.object.export_obj("INVOKE_DEFAULT")
+        profile.start_phase("Config export")
         bpy.ops.object.generate_config("INVOKE_DEFAULT")
-        config_path = bpy.path.abspath(context.scene.export_config_path)
-        stagedef_path = bpy.path.abspath(context.scene.export_stagedef_path)
-        raw_stagedef_path = bpy.path.abspath(context.scene.export_raw_stagedef_path)
+        return external_tools.get_ws_args(context.scene, self.compressed and not self.write_both)
+
+    def get_errors(self, output_lines):
+        return external_tools.get_ws_errors(output_lines)
+
+    def start_tool(self, context, args):
+        tool = external_tools.ToolProcess(args, self.tool_name)
+        if not self.write_both:
+            return tool
+        return smb_lz.CompressingProcess(tool, bpy.path.abspath(context.scene.export_raw_stagedef_path),
+                                         bpy.path.abspath(context.scene.export_stagedef_path))
+
+    def get_artifacts(self, context, cache_dir, args):
+        lz_path = bpy.path.abspath(context.scene.export_stagedef_path) if self.write_both else None
+        return artifact_cache.get_ws_artifacts(cache_dir, args, bpy.path.abspath(context.scene.export_model_path), lz_path)
+
+# Operator for exporting everything a stage needs in one go: the OBJ, config, GMA/TPL, LZ and background.
+# Each file is only written once, GxModelViewer and Workshop 2 run at the same time, and either tool is skipped if
+# the files it reads haven't changed since it last ran.
+class OBJECT_OT_build_stage(bpy.types.Operator):
+    bl_idname = "object.build_stage"
+    bl_label = "Build Stage"
+    bl_description = "Export the OBJ, config, GMA/TPL, LZ and background, skipping steps whose inputs haven't changed"
 
-        if platform == "linux" or platform == "linux2":
-            ws_path = bpy.utils.script_path_user() + "/addons/BlendToSMBStage2/ws2lzfrontend/bin/ws2lzfrontend"
-        else:
-            ws_path = bpy.utils.script_path_user() + "/addons/BlendToSMBStage2/ws2lzfrontend/ws2lzfrontend.exe"
+    compressed: bpy.props.BoolProperty(default=True)
 
-        if not os.path.exists(ws_path):
-            self.report({'ERROR'}, "SMB Workshop 2 executable not found. Ensure you have downloaded BlendToSMBStage2 from the 'Releases' section on GitHub, not from the 'Code' dropdown.")
-            return {'CANCELLED'}
+    def execute(self, context):
+        print("Building stage...")
+        scene = context.scene
 
-        command_args = [ws_path,
-                        "-c" + config_path]
+        steps = get_build_steps(scene, self.compressed)
+        results = build_pipeline.run_build(steps)
 
-        if self.compressed:
-            command_args.append("-s" + stagedef_path)
-        else:
-            command_args.append("-o" + raw_stagedef_path)
+        messages = []
+        for step in steps:
+            result = results[step.name]
+            messages.extend(result.warnings)
+            if result.error is not None:
+                messages.append(result.error)
 
-        try:
-            ws_result = subprocess.run(command_args, capture_output=True)
-        except PermissionError:
-            try:
-                os.chmod(ws_path, stat.S_IRWXU | stat.S_IROTH | stat.S_IRGRP)  # attempt to set execute permissions for the owner
-                ws_result = subprocess.run(command_args, capture_output=True)
-            except:
-                self.report({'ERROR'}, f"SMB Workshop 2 does not have the correct permissions to run. \nPlease set executable permissions on:\n{ws_path}")
-                return {'CANCELLED'}
-        except:
-            self.report({'ERROR'}, f"SMB Workshop 2 failed to run. See the console for more details.")
+        if len(messages) > 0:
+            self.report({'ERROR'}, "\n".join(messages))
+
+        if not all(result.succeeded() for result in results.values()):
             return {'CANCELLED'}
 
-        ws_stdout_bytes = ws_result.stdout
+        print("Finished building stage")
+        return {'FINISHED'}
 
+# Function for getting the steps of a full stage build (see OBJECT_OT_build_stage)
+def get_build_steps(scene, compressed):
+    # Tool command lines are put together up front, as the tools run on worker threads
+    gx_args = external_tools.get_gx_args(scene)
+    ws_args = external_tools.get_ws_args(scene, compressed)
+    obj_path = bpy.path.abspath(scene.export_model_path)
+    config_path = bpy.path.abspath(scene.export_config_path)
+    stagedef_path = bpy.path.abspath(scene.export_stagedef_path if compressed else scene.export_raw_stagedef_path)
+    cache_dir = get_artifact_cache_dir(scene)
+    get_gx_artifacts = (lambda: artifact_cache.get_gx_artifacts(cache_dir, gx_args)) if cache_dir is not None else None
+    get_ws_artifacts = (lambda: artifact_cache.get_ws_artifacts(cache_dir, ws_args, obj_path)) if cache_dir is not None else None
+
+    steps = [
+        build_pipeline.BuildStep("OBJ", lambda: run_build_operator(bpy.ops.object.export_obj, "OBJ export"),
+                                 outputs=[obj_path]),
+        build_pipeline.BuildStep("Config", lambda: run_build_operator(bpy.ops.object.generate_config, "Config export"),
+                                 outputs=[config_path]),
+        build_pipeline.BuildStep("GMA/TPL", lambda: run_build_tool(gx_args, "GxModelViewer", external_tools.get_gx_errors, get_gx_artifacts),
+                                 depends=["OBJ"],
+                                 inputs=lambda: external_tools.get_gx_inputs(gx_args),
+                                 outputs=[bpy.path.abspath(scene.export_gma_path), bpy.path.abspath(scene.export_tpl_path)],
+                                 key=gx_args, threaded=True),
+        build_pipeline.BuildStep("LZ", lambda: run_build_tool(ws_args, "SMB Workshop 2", external_tools.get_ws_errors, get_ws_artifacts),
+                                 depends=["OBJ", "Config"],
+                                 inputs=[config_path, obj_path],
+                                 outputs=[stagedef_path],
+                                 key=ws_args, threaded=True),
+    ]
+    # The GMA/TPL can be converted from chunks of the stage instead of the whole OBJ, which is still written for
+    # Workshop 2
+    chunk_count = gma_chunks.get_chunk_count(scene)
+    if chunk_count > 1:
+        steps[2] = build_pipeline.BuildStep("GMA/TPL", lambda: run_chunked_gx_build_tool(gx_args, chunk_count, cache_dir),
+                                            depends=["OBJ chunks"],
+                                            inputs=lambda: gma_chunks.get_gx_inputs(gx_args, gma_chunks.get_gx_args(gx_args, chunk_count)[0]),
+                                            outputs=steps[2].outputs,
+                                            key=(gx_args, chunk_count), threaded=True)
+        steps.insert(2, build_pipeline.BuildStep("OBJ chunks", lambda: run_build_operator(lambda: bpy.ops.object.export_obj(gma_chunks=True), "OBJ chunk export")))
+
+    if scene.export_background_path != "":
+        steps.append(build_pipeline.BuildStep("Background", lambda: run_build_operator(bpy.ops.object.export_background, "Background export"),
+                                              outputs=[bpy.path.abspath(scene.export_background_path)]))
+
+    return steps
+
+# Function for running an export operator as a build step
+def run_build_operator(operator, description):
+    if 'FINISHED' not in operator():
+        raise build_pipeline.BuildError(f"{description} failed. See the console for more details.")
+    return []
+
+# Function for converting the stage model to a GMA/TPL in chunks as a build step, on a worker thread (see gma_chunks)
+def run_chunked_gx_build_tool(gx_args, chunk_count, cache_dir):
+    (chunk_args, merge_args) = gma_chunks.get_gx_args(gx_args, chunk_count)
+    tool = gma_chunks.ChunkedGxProcess(chunk_args, merge_args, cache_dir)
+    output = tool.wait()
+    print('\n'.join(output))
+
+    errors = external_tools.get_gx_errors(output)
+    if not tool.succeeded():
+        raise build_pipeline.BuildError("GxModelViewer failed to convert the stage model chunks: " + "\n".join(errors))
+    if len(errors) > 0:
+        return ["GxModelViewer warnings/errors occurred: " + "\n".join(errors)]
+    return []
+
+# Function for getting the folder tool outputs are cached in, or None if they aren't cached
+def get_artifact_cache_dir(scene):
+    if not scene.export_use_artifact_cache:
+        return None
+    if scene.artifact_cache_path == "":
+        return artifact_cache.get_default_cache_dir()
+    return bpy.path.abspath(scene.artifact_cache_path)
+
+# Function for getting the folder preprocessed textures are kept in
+def get_texture_cache_dir(scene):
+    if scene.artifact_cache_path == "":
+        return os.path.join(artifact_cache.get_default_cache_dir(), "textures")
+    return os.path.join(bpy.path.abspath(scene.artifact_cache_path), "textures")
+
+# Function for running an external tool as a build step, on a worker thread. If 'get_artifacts' is given, the tool's
+# outputs are taken from the artifact cache when its inputs have been seen before.
+def run_build_tool(args, tool_name, get_errors, get_artifacts=None):
+    artifacts = get_artifacts() if get_artifacts is not None else None
+    output = artifacts.restore() if artifacts is not None else None
+
+    if output is not None:
+        print(f"{tool_name} inputs unchanged, outputs restored from cache")
+    else:
+        if artifacts is not None:
+            artifacts.prepare_outputs()
         try:
-            ws_stdout_str = ws_stdout_bytes.decode().split('\r\n')
-        except UnicodeDecodeError:
-            try:
-                if sys.platform == 'win32':
-                    codepage = f"cp{windll.kernel32.GetConsoleOutputCP()}"
-                    ws_stdout_str = ws_stdout_bytes.decode(encoding=codepage).split('\r\n')
-                else:
-                    ws_stdout_str = ws_stdout_bytes.decode(encoding=locale.getpreferredencoding(False)).split('\r\n')
-
-            except:
-                ws_stdout_str = ws_stdout_bytes.decode(errors="replace").split('\r\n')
+            tool = external_tools.ToolProcess(args, tool_name)
+            output = tool.wait()
+        except external_tools.ExternalToolError as e:
+            raise build_pipeline.BuildError(str(e))
+        if artifacts is not None and tool.succeeded():
+            artifacts.store(output)
 
-        errors = [error for error in ws_stdout_str if ("Critical" in error) or ("Error" in error) or ("Warning" in error)]
-        if len(errors) > 0:
-            self.report({'ERROR'}, "Workshop 2 warnings/errors occurred: " + "\n".join(errors))
-
-        print('\n'.join(ws_stdout_str))
+    print('\n'.join(output))
 
-        return {'FINISHED'}
+    errors = get_errors(output)
+    if len(errors) > 0:
+        return [f"{tool_name} warnings/errors occurred: " + "\n".join(errors)]
+    return []
 
 # Operator for importing a background from a .XML file
 class OBJECT_OT_import_background(bpy.types.Operator):
@@ -1500,26 +1581,19 @@ class OBJECT_OT_export_background(bpy.types.Operator):
     bl_idname ="object.export_background"
     bl_label = "Export Background"
     bl_description = "Export background to the specified .XML file."
-    bl_options = {'UNDO'}
     
     def execute(self, context):
         print("Generating background/foreground config...")
-        
-        root = etree.Element("superMonkeyBallBackground", version="1.3.0")
+
+        # Read the background to import up front, so a bad file cancels the export before anything is changed
+        obj_names = [obj.name for obj in context.scene.objects]
+        bg_root = read_imported_background(self, context)
+        if bg_root is False:
+            return {'CANCELLED'}
 
         begin_frame = bpy.context.scene.frame_start
         end_frame = bpy.context.scene.frame_end
-
-        # Curve types for f-curve iteration
-        curve_types = ["location", "rotation_euler", "scale"]
-
-        all_curve_types = []
-        for ct in curve_types:
-            for i in [0, 1, 2]:
-                all_curve_types.append((i, ct))
-
-        # Marks objects that don't have keyframes on frame 0, so they can be removed later
-        first_frame_added_objs = []
+        orig_frame = bpy.context.scene.frame_current
 
         class ObjExport:
             def __init__(self, obj):
@@ -1545,90 +1619,77 @@ class OBJECT_OT_export_background(bpy.types.Operator):
                 if obj.name.startswith(descriptor_model_bg.DescriptorBG.get_object_name()):
                     bg_export_datas.append(ObjExport(obj))
 
-        # Semi-hacky way to get the object's center of rotation to work properly
-        # B2SMB1 inadvertently fixed this by baking *all* keyframes
-        # This is fixed by adding an initial keyframe on every curve
-        # This also fixes weirdness with background and foreground objects
+        # Generate initial animation data based on fcurve keyframes, and the values of every channel on the first frame
+        context.scene.frame_set(begin_frame)
         for exp in itertools.chain(fg_export_datas, bg_export_datas):
-            if exp.obj.animation_data is not None and exp.obj.animation_data.action is not None:
-                channels_with_frame_zero_keyframes = []
-
-                action = exp.obj.animation_data.action
-                action_slot = exp.obj.animation_data.action_slot
-                channelbag = anim_utils.action_get_channelbag_for_slot(action, action_slot)
-                fcurves = channelbag.fcurves
+            generate_config.generate_keyframe_anim_data(exp.obj, exp.anim_data)
+            generate_config.generate_first_frame_anim_data(exp.obj, exp.anim_data)
 
-                # Find existing channels with frame 0 keyframes
-                for (index, curve_type) in all_curve_types:
-                    fcurve = fcurves.find(curve_type, index=index)
-                    if fcurve is not None:
-                        for keyframe_index in range(len(fcurve.keyframe_points)):
-                            if fcurve.keyframe_points[keyframe_index].co[0] == float(begin_frame):
-                                channels_with_frame_zero_keyframes.append((index, curve_type))
-                                # print(f"Added existing channel {curve_type}[{index}]")
-                                break
+        # Generate per-global-frame animation data
+        generate_config.sample_per_frame_anim_data([(exp.obj, exp.anim_data) for exp in itertools.chain(fg_export_datas, bg_export_datas)])
+        context.scene.frame_set(begin_frame)
 
-                # We need to add keyframes on frame 0 if not all channels have keyframes there
-                if len(channels_with_frame_zero_keyframes) != 9:
-                    first_frame_added_objs.append((exp.obj, channels_with_frame_zero_keyframes))
+        # Drop keyframes that linear interpolation reproduces within the error tolerance
+        reduce_export_keyframes(context, itertools.chain(fg_export_datas, bg_export_datas))
 
-                # Adds keyframes to needed channels
-                for (index, curve_type) in all_curve_types:
-                    if (index, curve_type) in channels_with_frame_zero_keyframes: continue
-                    exp.obj.keyframe_insert(curve_type, index=index, frame=begin_frame)
+        # The document is streamed to the file as it's generated. Each object's elements are built under a scratch
+        # root element, then written out and discarded.
+        bg_path = bpy.path.abspath(context.scene.export_background_path)
+        with xml_writer.open_document(bg_path, "superMonkeyBallBackground", {"version": "1.3.0"}, get_xml_indent(context)) as writer:
+            root = etree.Element("superMonkeyBallBackground")
 
-                print("\tInserted frame zero keyframe for background/foreground object " + exp.obj.name)
+            # Generate FG/BG XML
+            for fg_exp in fg_export_datas:
+                descriptor_model_fg.DescriptorFG.generate_xml_with_anim(root, fg_exp.obj, fg_exp.anim_data)
+                writer.write_children(root)
+            for bg_exp in bg_export_datas:
+                descriptor_model_bg.DescriptorBG.generate_xml_with_anim(root, bg_exp.obj, bg_exp.anim_data)
+                writer.write_children(root)
 
-        # Generate initial animation data based on fcurve keyframes
-        for exp in itertools.chain(fg_export_datas, bg_export_datas):
-            generate_config.generate_keyframe_anim_data(exp.obj, exp.anim_data)
-
-        # Generate per-global-frame animation data
-        for frame in range(begin_frame, end_frame + 1):
-            bpy.context.scene.frame_set(frame)
-            for exp in itertools.chain(fg_export_datas, bg_export_datas):
-                generate_config.generate_per_frame_anim_data(exp.obj, exp.anim_data)
-        context.scene.frame_set(begin_frame)
+            # Import background and foreground objects from a .XML file, if it exists
+            if bg_root is not None:
+                append_imported_bg_objects(self, context, bg_root, root, obj_names)
+                writer.write_children(root)
 
-        # Generate FG/BG XML
-        for fg_exp in fg_export_datas:
-            descriptor_model_fg.DescriptorFG.generate_xml_with_anim(root, fg_exp.obj, fg_exp.anim_data)
-        for bg_exp in bg_export_datas:
-            descriptor_model_bg.DescriptorBG.generate_xml_with_anim(root, bg_exp.obj, bg_exp.anim_data)
+        # Restore frame user was on before exporting
+        bpy.context.scene.frame_set(orig_frame)
 
-        # Import background and foreground objects from a .XML file, if it exists
-        obj_names = [obj.name for obj in context.scene.objects]
-        bg_path = bpy.path.abspath(context.scene.background_import_path)
-        if os.path.exists(bg_path):
-            bg = etree.parse(bg_path)
-            bg_root = bg.getroot()
+        print("Finished generating config")
 
-            if bg_root.tag != 'superMonkeyBallBackground':
-                self.report({'ERROR'}, "Imported background XML not an exported background XML")
-                return {'CANCELLED'}
+        return {'FINISHED'}
 
-            append_imported_bg_objects(self, context, bg_root, root, obj_names)
+# Function for reading the background .XML file to import into exports, if one is set.
+# Returns the root element, None if there's no file to import, or False if the file isn't a background XML.
+def read_imported_background(self, context):
+    bg_path = bpy.path.abspath(context.scene.background_import_path)
+    if not os.path.exists(bg_path):
+        return None
 
-        print("Completed, saving...")
+    bg_root = etree.parse(bg_path).getroot()
+    if bg_root.tag != 'superMonkeyBallBackground':
+        self.report({'ERROR'}, "Imported background XML not an exported background XML")
+        return False
 
-        config_string = etree.tostring(root, encoding="unicode")
-        config_dom = minidom.parseString(config_string)
-        config_string_pretty = config_dom.toprettyxml()
+    return bg_root
 
-        config_file = open(bpy.path.abspath(context.scene.export_background_path), "w")
-        config_file.write(config_string_pretty)
-        config_file.close()
+# Function for getting the indentation used for exported XML files
+def get_xml_indent(context):
+    return "\t" if context.scene.export_indent_xml else None
 
-        print("Finished generating config")
+# Function for running keyframe reduction over the animation data of exported objects
+def reduce_export_keyframes(context, exports):
+    tolerance = context.scene.export_keyframe_tolerance
+    if not context.scene.optimize_keyframes or tolerance <= 0.0:
+        return
 
-        # Remove the beginning keyframe channel if it didn't exist prior to it being added
-        for (obj, obj_existing_channels) in first_frame_added_objs:
-            for (idx, curve_type) in all_curve_types:
-                if (idx, curve_type) in obj_existing_channels: continue
-                print(f"Deleted frame zero channel {curve_type}[{idx}] for item group {obj.name}")
-                obj.keyframe_delete(curve_type, index=idx, frame=begin_frame)
+    total_before = 0
+    total_after = 0
+    for exp in exports:
+        before, after = generate_config.reduce_anim_data(exp.anim_data, tolerance)
+        total_before += before
+        total_after += after
 
-        return {'FINISHED'}
+    print(f"\tReduced animation keyframes from {total_before} to {total_after} (tolerance {tolerance})")
 
 # Function for appending all imported background objects in an XML to a config root
 def append_imported_bg_objects(self, context, imported_xml_root, destination_root, obj_names):
@@ -1789,13 +1850,24 @@ class OBJECT_OT_generate_config(bpy.types.Operator):
     bl_idname = "object.generate_config"
     bl_label = "Generate Config"
     bl_description = "Generate .XML file for config export"
-    bl_options = {'UNDO'} 
 
     def execute(self, context):
+        with export_profiler.profile("Generate Config") as profile:
+            return self.export(context, profile)
+
+    def export(self, context, profile):
         print("Generating config...")
+        profile.start_phase("Header")
+
+        # Read the background to import up front, so a bad file cancels the export before anything is changed
+        obj_names = [obj.name for obj in context.scene.objects]
+        bg_root = read_imported_background(self, context)
+        if bg_root is False:
+            return {'CANCELLED'}
+
+        # Header elements are generated under a scratch root element, then written out once the document is opened
+        root = etree.Element("superMonkeyBallStage")
 
-        root = etree.Element("superMonkeyBallStage", version="1.3.0")
-        
         # OBJ file path
         modelImport = etree.SubElement(root, "modelImport")
         if context.scene.export_model_path.startswith("//"):
@@ -1861,21 +1933,13 @@ class OBJECT_OT_generate_config(bpy.types.Operator):
         orig_frame = bpy.context.scene.frame_current
         context.scene.frame_set(begin_frame)
 
-        # Marks objects that don't have keyframes on frame 0, so they can be removed later
-        first_frame_added_objs = []
-
-        # Curve types for f-curve iteration
-        curve_types = ["location", "rotation_euler", "scale"]
-
-        all_curve_types = []
-        for ct in curve_types:
-            for i in [0, 1, 2]:
-                all_curve_types.append((i, ct))
-
         class ObjExport:
             def __init__(self, obj):
                 self.obj = obj
                 self.anim_data = generate_config.AnimData()
+                self.children = []
+                self.cache_key = None
+                self.fragment = None
     
         # Build ObjExport lists
         ig_export_datas: list[ObjExport] = []
@@ -1905,120 +1969,114 @@ class OBJECT_OT_generate_config(bpy.types.Operator):
             else:
                 other_export_datas.append(ObjExport(obj))
 
-        # Semi-hacky way to get the object's center of rotation to work properly
-        # B2SMB1 inadvertently fixed this by baking *all* keyframes
-        # This is fixed by adding an initial keyframe on every curve
-        # This also fixes weirdness with background and foreground objects
-        for exp in itertools.chain(ig_export_datas, fg_export_datas, bg_export_datas):
-            if exp.obj.animation_data is not None and exp.obj.animation_data.action is not None:
-                channels_with_frame_zero_keyframes = []
+        # Look up objects that haven't changed since the last export, their XML is reused instead of being regenerated
+        lookup_phase = profile.start_phase("Cache lookup")
+        indent = get_xml_indent(context)
+        use_cache = context.scene.export_use_fragment_cache
+        if use_cache:
+            config_cache.begin_export(context, indent)
+        else:
+            config_cache.clear()
 
-                action = exp.obj.animation_data.action
-                action_slot = exp.obj.animation_data.action_slot
-                channelbag = anim_utils.action_get_channelbag_for_slot(action, action_slot)
-                fcurves = channelbag.fcurves
+        hierarchy_index = hierarchy.HierarchyIndex(bpy.context.scene.objects)
+        for ig_exp in ig_export_datas:
+            ig_exp.children = hierarchy_index.get_children(ig_exp.obj)
 
-                # Find existing channels with frame 0 keyframes
-                for (index, curve_type) in all_curve_types:
-                    fcurve = fcurves.find(curve_type, index=index)
-                    if fcurve is not None:
-                        for keyframe_index in range(len(fcurve.keyframe_points)):
-                            if fcurve.keyframe_points[keyframe_index].co[0] == float(begin_frame):
-                                channels_with_frame_zero_keyframes.append((index, curve_type))
-                                # print(f"Added existing channel {curve_type}[{index}]")
-                                break
-
-                # We need to add keyframes on frame 0 if not all channels have keyframes there
-                if len(channels_with_frame_zero_keyframes) != 9:
-                    first_frame_added_objs.append((exp.obj, channels_with_frame_zero_keyframes))
-
-                # Adds keyframes to needed channels
-                for (index, curve_type) in all_curve_types:
-                    if (index, curve_type) in channels_with_frame_zero_keyframes: continue
-                    exp.obj.keyframe_insert(curve_type, index=index, frame=begin_frame)
-
-                print("\tInserted frame zero keyframe for item group " + exp.obj.name)
-
-        # Generate initial animation data based on fcurve keyframes
-        for exp in itertools.chain(ig_export_datas, fg_export_datas, bg_export_datas):
+        if use_cache:
+            for exp in itertools.chain(ig_export_datas, fg_export_datas, bg_export_datas):
+                exp.cache_key, exp.fragment = config_cache.lookup_fragment(exp.obj, exp.children, animated=True)
+            for exp in other_export_datas:
+                exp.cache_key, exp.fragment = config_cache.lookup_fragment(exp.obj)
+            config_cache.end_lookups()
+
+        # Only objects without a cached fragment need their animation sampled
+        sampled_exports = [exp for exp in itertools.chain(ig_export_datas, fg_export_datas, bg_export_datas) if exp.fragment is None]
+        cached_count = sum(exp.fragment is not None for exp in itertools.chain(ig_export_datas, fg_export_datas, bg_export_datas, other_export_datas))
+        if cached_count > 0:
+            print(f"\tReusing cached XML for {cached_count} object(s)")
+        export_count = len(ig_export_datas) + len(fg_export_datas) + len(bg_export_datas) + len(other_export_datas)
+        lookup_phase.count("objects", export_count)
+        lookup_phase.count("cached", cached_count)
+
+        # Generate initial animation data based on fcurve keyframes, and the values of every channel on the first frame
+        profile.start_phase("Keyframes", objects=len(sampled_exports))
+        for exp in sampled_exports:
             generate_config.generate_keyframe_anim_data(exp.obj, exp.anim_data)
+            generate_config.generate_first_frame_anim_data(exp.obj, exp.anim_data)
 
         # Generate per-global-frame animation data
-        for frame in range(begin_frame, end_frame + 1):
-            bpy.context.scene.frame_set(frame)
-            for exp in itertools.chain(ig_export_datas, fg_export_datas, bg_export_datas):
-                generate_config.generate_per_frame_anim_data(exp.obj, exp.anim_data)
+        sampling_phase = profile.start_phase("Sampling", objects=len(sampled_exports))
+        generate_config.sample_per_frame_anim_data([(exp.obj, exp.anim_data) for exp in sampled_exports])
         context.scene.frame_set(begin_frame)
+        sampling_phase.count("keyframes", sum(generate_config.count_keyframes(exp.anim_data) for exp in sampled_exports))
 
-        # Generate FG/BG XML
-        for fg_exp in fg_export_datas:
-            descriptor_model_fg.DescriptorFG.generate_xml_with_anim(root, fg_exp.obj, fg_exp.anim_data)
-        for bg_exp in bg_export_datas:
-            descriptor_model_bg.DescriptorBG.generate_xml_with_anim(root, bg_exp.obj, bg_exp.anim_data)
+        # Drop keyframes that linear interpolation reproduces within the error tolerance
+        reduction_phase = profile.start_phase("Keyframe reduction")
+        reduce_export_keyframes(context, sampled_exports)
+        reduction_phase.count("keyframes", sum(generate_config.count_keyframes(exp.anim_data) for exp in sampled_exports))
 
-        # Generate other object XML
-        for other_exp in other_export_datas:
-            for desc in descriptors.descriptors_root:
-                if other_exp.obj.name.startswith(desc.get_object_name()): 
+        # The document is streamed to the file as it's generated. Each object's elements are built under the scratch
+        # root element, then written out and discarded.
+        profile.start_phase("XML", objects=export_count-cached_count, cached=cached_count)
+        config_path = bpy.path.abspath(context.scene.export_config_path)
+        with xml_writer.open_document(config_path, "superMonkeyBallStage", {"version": "1.3.0"}, indent) as writer:
+            writer.write_children(root)
+
+            # Writes the XML of an exported object, only generating it if there's no cached copy
+            def write_export_xml(exp, generate_xml):
+                if exp.fragment is None:
+                    generate_xml(exp)
+                    exp.fragment = writer.serialize_children(root)
+                    config_cache.store_fragment(exp.obj, exp.cache_key, exp.fragment, exp.children)
+                writer.write(exp.fragment)
+
+            # Generates the XML of an item group and its children
+            def generate_ig_xml(ig_exp):
+                ig_xml = descriptor_item_group.DescriptorIG.generate_xml_with_anim(root, ig_exp.obj, ig_exp.anim_data)
+
+                # Children of item groups
+                for child in itertools.chain(ig_exp.children, [ig_exp.obj]):
+                    child_descriptors = descriptors.get_descriptors(child.name)
+
+                    # Generate elements for listed descriptors (except IGs)
+                    if len(child_descriptors) > 0 and "[IG]" not in child.name:
+                        child_descriptors[0].generate_xml(ig_xml, child)
+                    
+                    # Object is not a listed descriptor
+                    elif child.data is not None:
+                        descriptor_model_stage.DescriptorModel.generate_xml(ig_xml, child)
+
+            # Generates the XML of an object that isn't part of an item group
+            def generate_other_xml(other_exp):
+                desc = descriptors.get_leading_descriptor(other_exp.obj.name)
+                if desc in descriptors.descriptors_root:
                     desc.generate_xml(root, other_exp.obj)
 
-        # Generate itemgroup XML
-        for ig_exp in ig_export_datas:
-            ig_xml = descriptor_item_group.DescriptorIG.generate_xml_with_anim(root, ig_exp.obj, ig_exp.anim_data)
+            # Generate FG/BG XML
+            for fg_exp in fg_export_datas:
+                write_export_xml(fg_exp, lambda exp: descriptor_model_fg.DescriptorFG.generate_xml_with_anim(root, exp.obj, exp.anim_data))
+            for bg_exp in bg_export_datas:
+                write_export_xml(bg_exp, lambda exp: descriptor_model_bg.DescriptorBG.generate_xml_with_anim(root, exp.obj, exp.anim_data))
 
-            # Children list
-            ig_children = [obj for obj in bpy.context.scene.objects if obj.parent == ig_exp.obj]
-            ig_children.append(ig_exp.obj)
+            # Generate other object XML
+            for other_exp in other_export_datas:
+                write_export_xml(other_exp, generate_other_xml)
 
-            # Children of item groups
-            for child in ig_children:
-                match_descriptor = False
+            # Generate itemgroup XML
+            for ig_exp in ig_export_datas:
+                write_export_xml(ig_exp, generate_ig_xml)
 
-                # Generate elements for listed descriptors (except IGs)
-                for desc in descriptors.descriptors:
-                    if desc.get_object_name() in child.name and "[IG]" not in child.name:
-                        match_descriptor = True
-                        desc.generate_xml(ig_xml, child)
-                        break
-                
-                # Object is not a listed descriptor
-                if not match_descriptor and child.data is not None:
-                    descriptor_model_stage.DescriptorModel.generate_xml(ig_xml, child)
+            # Restore frame user was on before exporting
+            bpy.context.scene.frame_set(orig_frame)
 
-        # Restore frame user was on before exporting
-        bpy.context.scene.frame_set(orig_frame)
-
-        # Import background and foreground objects from a .XML file, if it exists
-        bg_path = bpy.path.abspath(context.scene.background_import_path)
-        obj_names = [obj.name for obj in context.scene.objects]
-        if os.path.exists(bg_path):
-            bg = etree.parse(bg_path)
-            bg_root = bg.getroot()
-
-            if bg_root.tag != 'superMonkeyBallBackground':
-                self.report({'ERROR'}, "Imported background XML not an exported background XML")
-                return {'CANCELLED'}
+            # Import background and foreground objects from a .XML file, if it exists
+            if bg_root is not None:
+                profile.start_phase("Imported background")
+                append_imported_bg_objects(self, context, bg_root, root, obj_names)
+                writer.write_children(root)
 
-            append_imported_bg_objects(self, context, bg_root, root, obj_names)
-
-        print("Completed, saving...")
-
-        config_string = etree.tostring(root, encoding="unicode")
-        config_dom = minidom.parseString(config_string)
-        config_string_pretty = config_dom.toprettyxml()
-
-        config_file = open(bpy.path.abspath(context.scene.export_config_path), "w")
-        config_file.write(config_string_pretty)
-        config_file.close()
         print("Finished generating config")
 
-        # Remove the beginning keyframe channel if it didn't exist prior to it being added
-        for (obj, obj_existing_channels) in first_frame_added_objs:
-            for (idx, curve_type) in all_curve_types:
-                if (idx, curve_type) in obj_existing_channels: continue 
-                print(f"Deleted frame zero channel {curve_type}[{idx}] for item group {obj.name}")
-                obj.keyframe_delete(curve_type, index=idx, frame=begin_frame)
-
         return {'FINISHED'}
 
 # Function for updating the properties of an active object
@@ -2039,6 +2097,8 @@ def update_prop(self, context, prop):
             elif "[WH]" in context.active_object.name:
                 context.active_object["linkedId"] = prop_value["whId"] 
 
+        # Setting custom properties from Python doesn't notify the depsgraph, which the config cache relies on
+        context.active_object.update_tag()
         updateUIProps(context.active_object)
 
 # Function for getting a list of collision triangle types depending on the game mode
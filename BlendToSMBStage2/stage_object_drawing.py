@@ -6,6 +6,8 @@ from gpu_extras.batch import batch_for_shader
 from mathutils import Matrix, Vector, Euler
 from bpy_extras import anim_utils
 
+from . import primitives
+
 COLOR_BLACK = (0.0, 0.0, 0.0, 0.8)
 COLOR_BLUE = (0.13, 0.59, 0.95, 0.8)
 COLOR_RED = (0.96, 0.26, 0.21, 0.8)
@@ -16,322 +18,246 @@ COLOR_GREEN_FAINT = (0.18, 0.83, 0.11, 0.5)
 COLOR_PURPLE = (0.40, 0.23, 0.72, 0.8)
 ZERO_VEC = (0.0, 0.0, 0.0)
 
-def norm(vec):
-    return [float(i) / sum(vec) for i in vec]
-
-def rotate_gl(euler_rot):
-    x_rot = Matrix.Rotation(euler_rot[0], 4, 'X')
-    y_rot = Matrix.Rotation(euler_rot[1], 4, 'Y')
-    z_rot = Matrix.Rotation(euler_rot[2], 4, 'Z')
-    final_rot = x_rot @ y_rot @ z_rot
-    gpu.matrix.multiply_matrix(final_rot)
-
-def draw_batch(coord, color, primitive_type):
-    shader = gpu.shader.from_builtin("UNIFORM_COLOR")
-    batch = batch_for_shader(shader, primitive_type, {"pos": coord})
-    shader.bind()
-    shader.uniform_float("color", color)
-    batch.draw(shader)
-    coord.clear()
-
-# Draws a circle on the XY plane. 'rot' is a XYZ Vector in degrees.
-# Probably a smarter way to do this, like drawing it orthagonal to a unit vector
-def draw_circle(pos, rot, radius, color, segments, radians=(2*math.pi)):
-    gpu.matrix.push()
-
-    coord = []
-    for i in range(0, segments+1):
-        segment = (i / segments)*radians
-
-        x = pos[0] + radius * math.cos(segment)
-        y = pos[1] + radius * math.sin(segment)
-        coord.append((x, y, pos[2]))
-
-    rotate_gl(rot)
-    draw_batch(coord, color, 'LINE_STRIP')
-
-    gpu.matrix.pop()
-
-# Draw a sphere at the specified position with the given radius/color.
-# A detailed sphere has more circles to outline the spherical shape, but could cause performance issues
-def draw_sphere(pos, radius, color, detailed=False):
-    detailed_rotations = [
-            Vector((45,0,0)),
-            Vector((-45,0,0)),
-            Vector((0,45,0)),
-            Vector((0,-45,0)),
-            Vector((90,45,0)),
-            Vector((90,-45,0))
-    ]
-
-    sphere_rotations = [
-            Vector((0,0,0)),
-            Vector((90,0,0)),
-            Vector((0,90,0)),
-    ]
-
-    if detailed: sphere_rotations.extend(detailed_rotations)
-
-    for rot in sphere_rotations:
-        rot_radian = ((math.radians(rot[0]), math.radians(rot[1]), math.radians(rot[2])))
-        draw_circle(pos, rot_radian, radius, color, 32)
-
-# Draw a scaled box at the specified position with the given size/color.
-def draw_box_scaled(pos, scale, color):
-    gpu.matrix.push()
-    gpu.matrix.translate(pos)
-    gpu.matrix.scale(scale)
-
-    coord1 = []
-
-    coord1.append((-0.5, -0.5, -0.5))
-    coord1.append((-0.5, -0.5, +0.5))
-    coord1.append((-0.5, +0.5, +0.5))
-    coord1.append((-0.5, +0.5, -0.5))
-    coord1.append((-0.5, -0.5, -0.5))
-
-    coord1.append((+0.5, -0.5, -0.5))
-    coord1.append((+0.5, -0.5, +0.5))
-    coord1.append((-0.5, -0.5, +0.5))
-
-    coord2 = []
-    coord2.append((+0.5, +0.5, +0.5))
-    coord2.append((+0.5, +0.5, -0.5))
-    coord2.append((+0.5, -0.5, -0.5))
-    coord2.append((+0.5, -0.5, +0.5))
-    coord2.append((+0.5, +0.5, +0.5))
-
-    coord2.append((-0.5, +0.5, +0.5))
-    coord2.append((-0.5, +0.5, -0.5))
-    coord2.append((+0.5, +0.5, -0.5))
-
-    draw_batch(coord1, color, "LINE_STRIP")
-    draw_batch(coord2, color, "LINE_STRIP")
-    gpu.matrix.pop()
-    
-# Draw cylindrical prism or a cone with a base having the number of sides provided by arg 'segments'.
-def draw_cylinder(pos, rot, radius, height, segments, color, *, cone=False, radians=(2*math.pi)):
-    gpu.matrix.push()
-    top_origin = Vector((pos[0], pos[1], pos[2]+height))
-
-    draw_circle(pos, rot, radius, color, segments, radians)
-    if not cone: draw_circle(top_origin, rot, radius, color, segments, radians)
-
-    coord = []
-    for i in range(0, segments+1):
-        segment = (i / segments)*radians
-
-        x = pos[0] + radius * math.cos(segment)
-        y = pos[1] + radius * math.sin(segment)
-        coord.append((x, y, pos[2]))
-        if cone:
-            coord.append(top_origin)
-        else:
-            coord.append((x, y, top_origin.z)) 
-        
-    rotate_gl(rot)
-    draw_batch(coord, color, 'LINES')
-    
-    gpu.matrix.pop()
+# Line widths of the black outline drawn behind a shape, and of the shape itself
+OUTLINE_WIDTHS = (6, 2)
 
-# Draw a grid with the specified starting positions, square spacings, number of squares, height, and color.
-def draw_grid(start_x, start_y, space_x, space_y, repeat_x, repeat_y, z, color):
-    coord = []
-    for i in range(0, repeat_x + 1):
-        coord.append((start_x + space_x * i, start_y, z))
-        coord.append((start_x + space_x * i, start_y + space_y * repeat_y, z))
+# Levels of detail of shapes in LOD_SHAPES. Each level halves the segments of the one before, down to MIN_SEGMENTS.
+LOD_COUNT = 3
+MIN_SEGMENTS = 4
 
-    draw_batch(coord, color, 'LINES')
-    coord.clear()
+# Shader every overlay is drawn with, created on first use
+shader = None
 
-    for i in range(0, repeat_y + 1):
-        coord.append((start_x, start_y + space_y * i, z))
-        coord.append((start_x + space_x * repeat_x, start_y + space_y * i, z))
+# Vertices of shapes that have been drawn, so they're only built once
+# shape key, or (shape key, level of detail) for coarser levels -> (vertices, 3) array
+shape_coords = {}
 
-    draw_batch(coord, color, 'LINES')
+# Bounding spheres of shapes that have been drawn, at full detail
+# shape key -> (center, radius)
+shape_bounds = {}
 
-# Draw an arrow with the specified start and end position.
-# TODO: Allow proper rotation on the arrow
-def draw_arrow(start_pos, end_pos, color):
-    gpu.matrix.push()
-    coord = []
+# Shapes queued since they were last taken, grouped by how they're drawn. Every group is transformed at once and drawn
+# as a single batch, however many objects it has.
+# (shape key, color, outline, line widths) -> list of model matrices
+queued_shapes = {}
 
-    coord.append(start_pos)
-    coord.append(end_pos)
+def norm(vec):
+    return [float(i) / sum(vec) for i in vec]
 
-    coord.append(end_pos)
-    coord.append((end_pos[0] - 0.2, end_pos[1] - 0.2, end_pos[2]))
+def get_shader():
+    global shader
+    if shader is None:
+        shader = gpu.shader.from_builtin("UNIFORM_COLOR")
+    return shader
+
+# Returns an object's world matrix without its scale, for shapes that are drawn at a fixed size
+def get_unscaled_matrix(obj):
+    if 0 in obj.scale:
+        return obj.matrix_world
+    return obj.matrix_world @ Matrix.Diagonal((1/obj.scale.x, 1/obj.scale.y, 1/obj.scale.z, 1.0))
+
+def start_lines():
+    return primitives.join_lines(primitives.sphere_lines(ZERO_VEC, 0.5), primitives.arrow_lines(ZERO_VEC, (0.0, 1.5, 0.0)))
+
+def goal_lines():
+    return primitives.join_lines(
+            # Goal ring
+            primitives.cylinder_lines((-2.95,1.22,-0.1), ((math.pi*1/2),0,-(math.pi*3/8)), 2.35, 0.2, 16, radians=((7/4)*math.pi)),
+            primitives.cylinder_lines((-2.95,1.22,-0.1), ((math.pi*1/2),0,-(math.pi*3/8)), 2.15, 0.2, 16, radians=((7/4)*math.pi)),
+            # Goal posts
+            primitives.box_lines((-1.11,0,0.6), (0.5,0.2,1.2)),
+            primitives.box_lines((1.11,0,0.6), (0.5,0.2,1.2)),
+            primitives.arrow_lines((0,0,0.6), (0.0, 1.5, 0.6)),
+            # Party ball box
+            primitives.box_lines((-1.2,0,2.2), (0,0.2,1.6)),
+            primitives.box_lines((1.2,0,2.2), (0,0.2,1.6)),
+            primitives.box_lines((0,0,3),(2.4,0.2,0)),
+            # Timer display
+            primitives.box_lines((-0.3,0,4.1), (2.2, 0.2, 1.2)),
+            primitives.box_lines((1.25,0,3.9), (0.9, 0.2, 0.8)))
+
+def bumper_lines():
+    return primitives.join_lines(primitives.cylinder_lines(ZERO_VEC, ZERO_VEC, 0.25, 0.7, 8),
+                                 primitives.cylinder_lines((0, 0, 0.28), ZERO_VEC, 0.4, 0.14, 8))
+
+def jamabar_lines():
+    return primitives.join_lines(primitives.box_lines((0, 0, 0.5), (1, 1.35, 0.4)),
+                                 primitives.box_lines((0, -1.21, 0.5), (1, 1.075, 1)),
+                                 primitives.box_lines((0, 1.21, 0.5), (1, 1.075, 1)),
+                                 primitives.arrow_lines((0, 1.75, 0.5), (0, 4, 0.5)))
+
+# Extra box to show jamabar range, drawn without an outline
+def jamabar_range_lines():
+    return primitives.box_lines((0, 3, 0.5), (1, 2.5, 1))
+
+def switch_lines():
+    rotation_rad = (0,0,math.radians(22.5))
+    return primitives.join_lines(primitives.cylinder_lines(ZERO_VEC, rotation_rad, 0.925, 0.15, 8),
+                                 primitives.cylinder_lines(ZERO_VEC, rotation_rad, 0.725, 0.15, 8),
+                                 primitives.arrow_lines(ZERO_VEC, (0.0, 1.5, 0.0)))
+
+def wh_lines():
+    wh_frame = [(2.15, 0,0),
+                (1.15, 0, 4.23),
+                (0.87929, 0, 4.55),
+                (-0.87929, 0, 4.55),
+                (-1.15, 0, 4.3),
+                (-2.15, 0, 0),
+                (2.15, 0, 0)]
+    arrow_matrix = Matrix.Rotation(math.radians(180), 4, 'Z') @ Matrix.Translation(Vector((0,-0.75,1)))
+    return primitives.join_lines(primitives.strip_lines(wh_frame),
+                                 primitives.transform_lines(primitives.arrow_lines(ZERO_VEC, (0.0, 1.5, 0.0)), arrow_matrix))
+
+def booster_lines():
+    return primitives.join_lines(primitives.box_lines(ZERO_VEC, (2,1.0,0)), primitives.arrow_lines((0, 0.1, 0), (0, 0.1, 0)))
+
+# Line segments of every fixed shape, by name. Shapes with parameters (grids) are built by get_shape_coords.
+SHAPES = {
+    "start": start_lines,
+    "goal": goal_lines,
+    "bumper": bumper_lines,
+    "jamabar": jamabar_lines,
+    "jamabar_range": jamabar_range_lines,
+    "box": lambda: primitives.box_lines(ZERO_VEC, (1,1,1)),
+    "switch": switch_lines,
+    "wormhole": wh_lines,
+    "booster": booster_lines,
+    "axis": lambda: [(0.0, 0.5, 0.0), (0.0, -0.5, 0.0)],
+    "line": lambda: [ZERO_VEC, (1.0, 1.0, 1.0)],
+}
+
+# Returns the segment count of a circle at a level of detail, from its count at full detail
+def get_lod_segments(segments, lod):
+    return max(segments >> lod, MIN_SEGMENTS)
+
+# Line segments of shapes made of circles, by name, built at a level of detail (0 being full detail). They're drawn
+# with fewer segments when they're small on screen.
+LOD_SHAPES = {
+    "cone_col": lambda lod: primitives.cylinder_lines(ZERO_VEC, ZERO_VEC, 1, 1, get_lod_segments(16, lod), cone=True),
+    "sphere_col": lambda lod: primitives.sphere_lines(ZERO_VEC, 1, detailed=True, segments=get_lod_segments(32, lod)),
+    "cylinder_col": lambda lod: primitives.cylinder_lines((0,0,-0.5), ZERO_VEC, 1, 1, get_lod_segments(16, lod)),
+    "sphere": lambda lod: primitives.sphere_lines(ZERO_VEC, 1, segments=get_lod_segments(32, lod)),
+    "golf_hole": lambda lod: primitives.cylinder_lines(ZERO_VEC, ZERO_VEC, 1, 0, get_lod_segments(12, lod)),
+}
+
+# Returns the line segments of a shape, building them the first time it's drawn. 'key' is the name of a shape in
+# SHAPES or LOD_SHAPES, or ("grid", squares x, squares y) for a grid of unit squares. 'lod' is only used by shapes in
+# LOD_SHAPES.
+def get_shape_coords(key, lod=0):
+    if lod > 0 and key in LOD_SHAPES:
+        cache_key = (key, lod)
+    else:
+        cache_key = key
+        lod = 0
+
+    coords = shape_coords.get(cache_key)
+    if coords is None:
+        if isinstance(key, tuple) and key[0] == "grid":
+            coords = primitives.grid_lines(0, 0, 1, 1, key[1], key[2], 0)
+        elif key in LOD_SHAPES:
+            coords = primitives.as_points(LOD_SHAPES[key](lod))
+        else:
+            coords = primitives.as_points(SHAPES[key]())
+        shape_coords[cache_key] = coords
+    return coords
+
+# Returns the bounding sphere of a shape, as its center and radius
+def get_shape_bounds(key):
+    bounds = shape_bounds.get(key)
+    if bounds is None:
+        bounds = primitives.get_bounding_sphere(get_shape_coords(key))
+        shape_bounds[key] = bounds
+    return bounds
+
+# Drops every built shape, so they're built again on the next redraw
+def clear_shapes():
+    global shader
+    shape_coords.clear()
+    shape_bounds.clear()
+    queued_shapes.clear()
+    shader = None
+
+# Queues a shape to be drawn with the given model matrix. With 'outline' set, a black outline is drawn behind it.
+def draw_shape(key, matrix, color, outline=True, widths=OUTLINE_WIDTHS):
+    queued_shapes.setdefault((key, tuple(color), outline, widths), []).append(matrix)
+
+# Returns the shapes queued since this was last called, and empties the queue
+def take_queued_shapes():
+    global queued_shapes
+    shapes = queued_shapes
+    queued_shapes = {}
+    return shapes
+
+# Returns a batch drawing a shape of a group with every one of a list of model matrices, at a level of detail
+def build_group_batch(group, matrices, lod=0):
+    vertices = primitives.transform_instances(get_shape_coords(group[0], lod), matrices)
+    return batch_for_shader(get_shader(), 'LINES', {"pos": vertices})
+
+# Draws a batch for each group of shapes, given as a list of (shape group, batch). Outlines are drawn first, so they're
+# behind every shape.
+def draw_group_batches(group_batches):
+    shader = get_shader()
+    shader.bind()
 
-    coord.append(end_pos)
-    coord.append((end_pos[0] + 0.2, end_pos[1] - 0.2, end_pos[2]))
+    for ((key, color, outline, widths), batch) in group_batches:
+        if outline:
+            gpu.state.line_width_set(widths[0])
+            shader.uniform_float("color", COLOR_BLACK)
+            batch.draw(shader)
+    for ((key, color, outline, widths), batch) in group_batches:
+        gpu.state.line_width_set(widths[1])
+        shader.uniform_float("color", color)
+        batch.draw(shader)
 
-    draw_batch(coord, color, "LINES")
-    gpu.matrix.pop()
+# Draw a grid with the specified starting positions, square spacings, number of squares, height, and color.
+# 'parent_matrix' is applied on top, for grids that move with an object.
+def draw_grid(start_x, start_y, space_x, space_y, repeat_x, repeat_y, z, color, parent_matrix=None):
+    matrix = Matrix.Translation((start_x, start_y, z)) @ Matrix.Diagonal((space_x, space_y, 1.0, 1.0))
+    if parent_matrix is not None:
+        matrix = parent_matrix @ matrix
+    draw_shape(("grid", repeat_x, repeat_y), matrix, color, outline=False)
 
 def draw_start(obj):
-    gpu.matrix.push()
-    gpu.matrix.multiply_matrix(obj.matrix_world)
-    if 0 not in obj.scale:
-        gpu.matrix.scale((1 / obj.scale.x, 1 / obj.scale.y, 1 / obj.scale.z))  # No scaling
-
-    lineWidth = [(6, COLOR_BLACK), (2, COLOR_BLUE)]
-    for width, color in lineWidth:
-        gpu.state.line_width_set(width)
-        draw_sphere(ZERO_VEC, 0.5, color)
-        draw_arrow(ZERO_VEC, (0.0, 1.5, 0.0), color)
-
-    gpu.matrix.pop()
+    draw_shape("start", get_unscaled_matrix(obj), COLOR_BLUE)
 
 def draw_goal(obj, goal_color):
-    gpu.matrix.push()
-    gpu.matrix.multiply_matrix(obj.matrix_world)
-    if 0 not in obj.scale:
-        gpu.matrix.scale((1/obj.scale.x, 1/obj.scale.y, 1/obj.scale.z)) # No scaling
-
-    lineWidth = [(6, COLOR_BLACK), (2, goal_color)]
-    for width, color in lineWidth:
-        gpu.state.line_width_set(width)
-        # Goal ring
-        draw_cylinder((-2.95,1.22,-0.1), ((math.pi*1/2),0,-(math.pi*3/8)), 2.35, 0.2, 16, color, radians=((7/4)*math.pi))
-        draw_cylinder((-2.95,1.22,-0.1), ((math.pi*1/2),0,-(math.pi*3/8)), 2.15, 0.2, 16, color, radians=((7/4)*math.pi))
-        # Goal posts
-        draw_box_scaled((-1.11,0,0.6), (0.5,0.2,1.2), color)
-        draw_box_scaled((1.11,0,0.6), (0.5,0.2,1.2), color)
-        draw_arrow((0,0,0.6), (0.0, 1.5, 0.6), color)
-        # Party ball box
-        draw_box_scaled((-1.2,0,2.2), (0,0.2,1.6), color)
-        draw_box_scaled((1.2,0,2.2), (0,0.2,1.6), color)
-        draw_box_scaled((0,0,3),(2.4,0.2,0), color)
-        # Timer display
-        draw_box_scaled((-0.3,0,4.1), (2.2, 0.2, 1.2), color)
-        draw_box_scaled((1.25,0,3.9), (0.9, 0.2, 0.8), color)
-
-    gpu.matrix.pop()   
+    draw_shape("goal", get_unscaled_matrix(obj), goal_color)
 
 def draw_bumper(obj):
-    gpu.matrix.push()
-    gpu.matrix.multiply_matrix(obj.matrix_world)
-
-    lineWidth = [(6, COLOR_BLACK), (2, COLOR_BLUE)]
-    for width, color in lineWidth:
-        gpu.state.line_width_set(width)
-        draw_cylinder(ZERO_VEC, ZERO_VEC, 0.25, 0.7, 8, color)
-        draw_cylinder((0, 0, 0.28), ZERO_VEC, 0.4, 0.14, 8, color)
-
-    gpu.matrix.pop()
+    draw_shape("bumper", obj.matrix_world, COLOR_BLUE)
 
 def draw_jamabar(obj):
-    gpu.matrix.push()
-    gpu.matrix.multiply_matrix(obj.matrix_world)
-
-    gpu.state.line_width_set(6)
-    draw_box_scaled((0, 0, 0.5), (1, 1.35, 0.4), COLOR_BLACK)
-    draw_box_scaled((0, -1.21, 0.5), (1, 1.075, 1), COLOR_BLACK)
-    draw_box_scaled((0, 1.21, 0.5), (1, 1.075, 1), COLOR_BLACK)
-    draw_arrow((0, 1.75, 0.5), (0, 4, 0.5), COLOR_BLACK)
-
-    gpu.state.line_width_set(2)
-    draw_box_scaled((0, 0, 0.5), (1, 1.35, 0.4), COLOR_BLUE)
-    draw_box_scaled((0, 3, 0.5), (1, 2.5, 1), COLOR_BLUE) # Extra box to show jamabar range
-    draw_box_scaled((0, -1.21, 0.5), (1, 1.075, 1), COLOR_BLUE)
-    draw_box_scaled((0, 1.21, 0.5), (1, 1.075, 1), COLOR_BLUE)
-    draw_arrow((0, 1.75, 0.5), (0, 4.0, 0.5), COLOR_BLUE)
-
-    gpu.matrix.pop()
+    draw_shape("jamabar", obj.matrix_world, COLOR_BLUE)
+    draw_shape("jamabar_range", obj.matrix_world, COLOR_BLUE, outline=False)
 
 def draw_cone_col(obj):
-    gpu.matrix.push()
-    gpu.matrix.multiply_matrix(obj.matrix_world)
+    matrix = obj.matrix_world
     if obj.scale.y != 0:
-        gpu.matrix.scale((1, obj.scale.x/obj.scale.y, 1)) # No Y scaling
-
-    lineWidth = [(6, COLOR_BLACK), (2, COLOR_PURPLE)]
-    for width, color in lineWidth:
-        gpu.state.line_width_set(width)
-        draw_cylinder(ZERO_VEC, ZERO_VEC, 1, 1, 16, color, cone=True)
-
-    gpu.matrix.pop()
+        matrix = matrix @ Matrix.Diagonal((1, obj.scale.x/obj.scale.y, 1, 1)) # No Y scaling
+    draw_shape("cone_col", matrix, COLOR_PURPLE)
 
 def draw_sphere_col(obj):
-    gpu.matrix.push()
-    gpu.matrix.multiply_matrix(obj.matrix_world)
+    matrix = obj.matrix_world
     if 0 not in [obj.scale.z, obj.scale.y]:
-        gpu.matrix.scale((1, obj.scale.x/obj.scale.y, obj.scale.x/obj.scale.z)) # No Y/Z scaling
-
-    lineWidth = [(6, COLOR_BLACK), (2, COLOR_PURPLE)]
-    for width, color in lineWidth:
-        gpu.state.line_width_set(width)
-        draw_sphere(ZERO_VEC, 1, color, detailed=True)
-
-    gpu.matrix.pop()
+        matrix = matrix @ Matrix.Diagonal((1, obj.scale.x/obj.scale.y, obj.scale.x/obj.scale.z, 1)) # No Y/Z scaling
+    draw_shape("sphere_col", matrix, COLOR_PURPLE)
 
 def draw_cylinder_col(obj):
-    gpu.matrix.push()
-    gpu.matrix.multiply_matrix(obj.matrix_world)
+    matrix = obj.matrix_world
     if obj.scale.y != 0:
-        gpu.matrix.scale((1, obj.scale.x/obj.scale.y, 1)) # No Y scaling
-
-    lineWidth = [(6, COLOR_BLACK), (2, COLOR_PURPLE)]
-    for width, color in lineWidth:
-        gpu.state.line_width_set(width)
-        draw_cylinder((0,0,-0.5), ZERO_VEC, 1, 1, 16, color)
-
-    gpu.matrix.pop()
+        matrix = matrix @ Matrix.Diagonal((1, obj.scale.x/obj.scale.y, 1, 1)) # No Y scaling
+    draw_shape("cylinder_col", matrix, COLOR_PURPLE)
 
 def draw_fallout_volume(obj):
-    gpu.matrix.push()
-    gpu.matrix.multiply_matrix(obj.matrix_world)
-
-    lineWidth = [(6, COLOR_BLACK), (2, COLOR_RED_FAINT)]
-    for width, color in lineWidth:
-        gpu.state.line_width_set(width)
-        draw_box_scaled(ZERO_VEC, (1,1,1), color)
-
-    gpu.matrix.pop()
+    draw_shape("box", obj.matrix_world, COLOR_RED_FAINT)
 
 def draw_switch(obj):
-    gpu.matrix.push()
-    gpu.matrix.multiply_matrix(obj.matrix_world)
-    if 0 not in obj.scale:
-        gpu.matrix.scale((1/obj.scale.x, 1/obj.scale.y, 1/obj.scale.z)) # No scaling
-
-    rotation_rad = (0,0,math.radians(22.5))
-
-    lineWidth = [(6, COLOR_BLACK), (2, COLOR_BLUE)]
-    for width, color in lineWidth:
-        gpu.state.line_width_set(width)
-        draw_cylinder(ZERO_VEC, rotation_rad, 0.925, 0.15, 8, color)
-        draw_cylinder(ZERO_VEC, rotation_rad, 0.725, 0.15, 8, color)
-        draw_arrow(ZERO_VEC, (0.0, 1.5, 0.0), color)
-
-    gpu.matrix.pop()
+    draw_shape("switch", get_unscaled_matrix(obj), COLOR_BLUE)
 
 def draw_wh(obj):
-    gpu.matrix.push()
-    gpu.matrix.multiply_matrix(obj.matrix_world)
-    if 0 not in obj.scale:
-        gpu.matrix.scale((1/obj.scale.x, 1/obj.scale.y, 1/obj.scale.z)) # No scaling
-
-    lineWidth = [(6, COLOR_BLACK), (2, COLOR_BLUE)]
-    for width, color in lineWidth:
-        wh_frame = [(2.15, 0,0),
-                    (1.15, 0, 4.23),
-                    (0.87929, 0, 4.55),
-                    (-0.87929, 0, 4.55),
-                    (-1.15, 0, 4.3),
-                    (-2.15, 0, 0),
-                    (2.15, 0, 0)]
-        gpu.state.line_width_set(width)
-        draw_batch(wh_frame, color, "LINE_STRIP")
-        gpu.matrix.push()
-        gpu.matrix.multiply_matrix(Matrix.Rotation(math.radians(180), 4, 'Z'))
-        gpu.matrix.multiply_matrix(Matrix.Translation(Vector((0,-0.75,1))))
-        draw_arrow(ZERO_VEC, (0.0, 1.5, 0.0), color)
-        gpu.matrix.pop()
-
-    gpu.matrix.pop()
-
-def draw_ig(obj, draw_collision_grid):
+    draw_shape("wormhole", get_unscaled_matrix(obj), COLOR_BLUE)
+
+def draw_ig(obj, draw_collision_grid, children):
     if "collisionStartX" not in obj.keys():
         return
 
@@ -346,7 +272,7 @@ def draw_ig(obj, draw_collision_grid):
 
     # Draw collision grid
     if draw_collision_grid:
-        gpu.matrix.push()
+        grid_mtx = None
 
         if obj.animation_data is not None and obj.animation_data.action is not None:
             action = obj.animation_data.action
@@ -373,89 +299,31 @@ def draw_ig(obj, draw_collision_grid):
             grid_mtx_pos = Matrix.Translation(pos_delta)
             grid_mtx = grid_mtx_pos @ grid_mtx_rot
 
-            gpu.matrix.multiply_matrix(grid_mtx)
-
-        gpu.state.line_width_set(2)
-        draw_grid(startX, startY, stepX, stepY, stepCountX, stepCountY, 0, COLOR_GREEN_FAINT)
-
-        gpu.matrix.pop()
+        draw_grid(startX, startY, stepX, stepY, stepCountX, stepCountY, 0, COLOR_GREEN_FAINT, grid_mtx)
 
     # Draw conveyor arrow
-    conveyorObjects = [child for child in obj.children if child.data is not None]
+    conveyorObjects = [child for child in children if child.data is not None]
     if obj.data is not None: conveyorObjects.append(obj)
 
     for conveyorObject in conveyorObjects:
-        gpu.matrix.push()
-
         # Conveyors vectors are absolute, so we don't apply the entire IG transform to them
-        gpu.matrix.translate(conveyorObject.matrix_world.to_translation())
+        matrix = Matrix.Translation(conveyorObject.matrix_world.to_translation())
 
         if 0 not in conveyorObject.scale:
-            gpu.matrix.scale((1/conveyorObject.scale.x, 1/conveyorObject.scale.y, 1/conveyorObject.scale.z)) # No scaling
+            matrix = matrix @ Matrix.Diagonal((1/conveyorObject.scale.x, 1/conveyorObject.scale.y, 1/conveyorObject.scale.z, 1.0)) # No scaling
 
-        lineWidth = [(6, COLOR_BLACK), (2, COLOR_GREEN)]
-        for (width, color) in lineWidth:
-            coords = [ZERO_VEC, conveyorEndPos]
-            gpu.state.line_width_set(width)
-            draw_batch(coords, color, 'LINES')
-        gpu.matrix.pop()
+        draw_shape("line", matrix @ Matrix.Diagonal((*conveyorEndPos, 1.0)), COLOR_GREEN)
 
 def draw_generic_sphere(obj, radius, color):
-    gpu.matrix.push()
-    gpu.matrix.multiply_matrix(obj.matrix_world)
-    if 0 not in obj.scale:
-        gpu.matrix.scale((1/obj.scale.x, 1/obj.scale.y, 1/obj.scale.z)) # No scaling
-
-    lineWidth = [(6, COLOR_BLACK), (2, color)]
-    for width, color in lineWidth:
-        gpu.state.line_width_set(width)
-        draw_sphere(ZERO_VEC, radius, color)
-
-    gpu.matrix.pop()
+    draw_shape("sphere", get_unscaled_matrix(obj) @ Matrix.Scale(radius, 4), color)
 
 def draw_booster(obj):
-    gpu.matrix.push()
-    gpu.matrix.multiply_matrix(obj.matrix_world)
-    if 0 not in obj.scale:
-        gpu.matrix.scale((1/obj.scale.x, 1/obj.scale.y, 1/obj.scale.z)) # No scaling
-
-    lineWidth = [(6, COLOR_BLACK), (2, COLOR_RED)]
-    for width, color in lineWidth:
-        gpu.state.line_width_set(width)
-        draw_box_scaled(ZERO_VEC, (2,1.0,0), color)
-        draw_arrow((0, 0.1, 0), (0, 0.1, 0), color)
-
-    gpu.matrix.pop()
+    draw_shape("booster", get_unscaled_matrix(obj), COLOR_RED)
 
 def draw_golf_hole(obj):
-    gpu.matrix.push()
-    gpu.matrix.multiply_matrix(obj.matrix_world)
-    if 0 not in obj.scale:
-        gpu.matrix.scale((1/obj.scale.x, 1/obj.scale.y, 1/obj.scale.z)) # No scaling
-
-    lineWidth = [(6, COLOR_BLACK), (2, COLOR_BLUE)]
-    for width, color in lineWidth:
-        gpu.state.line_width_set(width)
-        draw_cylinder(ZERO_VEC, ZERO_VEC, 1, 0, 12, color)
-
-    gpu.matrix.pop()
+    draw_shape("golf_hole", get_unscaled_matrix(obj), COLOR_BLUE)
 
 def draw_seesaw_axis(obj):
-    gpu.matrix.push()
-    gpu.matrix.multiply_matrix(obj.matrix_world)
-    if 0 not in obj.scale:
-        gpu.matrix.scale((1/obj.scale.x, 1/obj.scale.y, 1/obj.scale.z)) # No scaling
-    
-    lineWidth = [(8, COLOR_BLACK), (4, COLOR_PURPLE)]
-    for width, color in lineWidth:
-        gpu.state.line_width_set(width)
-
-        dim = obj.dimensions
-        scale = 1.25
-
-        points = [Vector((0.0, dim[1]*scale*0.5, 0.0)),
-                  Vector((0.0, dim[1]*scale*-0.5, 0.0))]
-
-        draw_batch(points, color, 'LINES')
-
-    gpu.matrix.pop()
+    scale = 1.25
+    matrix = get_unscaled_matrix(obj) @ Matrix.Diagonal((1, obj.dimensions[1]*scale, 1, 1))
+    draw_shape("axis", matrix, COLOR_PURPLE, widths=(8, 4))
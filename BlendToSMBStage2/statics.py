@@ -1,3 +1,6 @@
 active_draw_handlers = []
 anim_id_list = []
 imported_bg = None
+
+# Hierarchy of the scene currently being drawn, rebuilt whenever objects of the overlay are rendered again
+hierarchy_index = None
@@ -0,0 +1,141 @@
+import bpy
+import os
+import struct
+import zlib
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+
+from . import build_pipeline
+
+# Changed whenever processing changes, so textures processed by an older version aren't reused
+PREPROCESS_VERSION = 2
+
+# Hashes of source texture files, so they're only read again when they change (see build_pipeline.hash_file_cached)
+source_hashes = {}
+
+# PNG color types by number of channels
+PNG_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+# Outcome of preprocessing the textures of an export
+class PreprocessResult:
+    def __init__(self):
+        # image name -> path of the processed texture
+        self.paths = {}
+        self.processed = 0
+        self.reused = 0
+
+# Returns the power of two closest to a size, no larger than 'max_size'
+def _get_power_of_two(size, max_size):
+    return min(1 << max(0, round(np.log2(max(size, 1)))), max_size)
+
+# Returns the size a texture is processed to
+def get_target_size(width, height, max_size):
+    return (_get_power_of_two(width, max_size), _get_power_of_two(height, max_size))
+
+# Resizes an image (rows, columns, channels). Halved with a 2x2 box filter while it's at least twice the target
+# size, then resampled bilinearly to the exact size.
+def _resize(pixels, width, height):
+    while pixels.shape[0] >= height*2 and pixels.shape[0] >= 2:
+        rows = pixels.shape[0] // 2 * 2
+        pixels = (pixels[0:rows:2] + pixels[1:rows:2]) * 0.5
+    while pixels.shape[1] >= width*2 and pixels.shape[1] >= 2:
+        columns = pixels.shape[1] // 2 * 2
+        pixels = (pixels[:, 0:columns:2] + pixels[:, 1:columns:2]) * 0.5
+
+    if pixels.shape[0] == height and pixels.shape[1] == width:
+        return pixels
+
+    # Sample at pixel centers
+    y = np.clip((np.arange(height) + 0.5) * (pixels.shape[0] / height) - 0.5, 0, pixels.shape[0] - 1)
+    x = np.clip((np.arange(width) + 0.5) * (pixels.shape[1] / width) - 0.5, 0, pixels.shape[1] - 1)
+    y0 = np.floor(y).astype(np.int64)
+    x0 = np.floor(x).astype(np.int64)
+    y1 = np.minimum(y0 + 1, pixels.shape[0] - 1)
+    x1 = np.minimum(x0 + 1, pixels.shape[1] - 1)
+    fy = (y - y0)[:, None, None]
+    fx = (x - x0)[None, :, None]
+
+    top = pixels[y0][:, x0] * (1 - fx) + pixels[y0][:, x1] * fx
+    bottom = pixels[y1][:, x0] * (1 - fx) + pixels[y1][:, x1] * fx
+    return top * (1 - fy) + bottom * fy
+
+# Converts linear color channels (0 to 1) to sRGB, leaving alpha as it is
+def _linear_to_srgb(pixels):
+    pixels = np.clip(pixels, 0.0, 1.0)
+    color = pixels[..., :3]
+    pixels[..., :3] = np.where(color <= 0.0031308, color * 12.92, 1.055 * np.power(color, 1 / 2.4) - 0.055)
+    return pixels
+
+# Encodes 8 bit pixels (rows, columns, channels), top row first, as a PNG
+def _encode_png(pixels):
+    height, width, channels = pixels.shape
+    rows = np.zeros((height, width*channels + 1), dtype=np.uint8)
+    rows[:, 1:] = pixels.reshape(height, -1)
+
+    def chunk(chunk_type, data):
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, PNG_COLOR_TYPES[channels], 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows.tobytes(), 6))
+            + chunk(b"IEND", b""))
+
+# Resizes and writes a texture. Doesn't touch any Blender data, so it's run on a worker thread.
+# Pixels of float images are linear, so they're resized as they are and then converted to sRGB like 8 bit images are
+# stored.
+def _process_texture(pixels, width, height, path, linear):
+    resized = _resize(pixels, width, height)
+    if linear and resized.shape[2] >= 3:
+        resized = _linear_to_srgb(resized)
+    # Blender stores the bottom row first
+    data = _encode_png(np.round(np.clip(resized[::-1], 0.0, 1.0) * 255).astype(np.uint8))
+
+    temp_path = path + f".{os.getpid()}.tmp"
+    with open(temp_path, "wb") as texture_file:
+        texture_file.write(data)
+    os.replace(temp_path, path)
+
+# Converts the textures of the given images to power-of-two sizes no larger than 'max_size', storing them in
+# 'cache_dir' under a hash of their source file. Textures already in the cache are reused without being loaded.
+# Pixels are read from Blender on the main thread, and resized and encoded on a pool of worker threads.
+def preprocess_images(images, cache_dir, max_size, max_workers=None):
+    result = PreprocessResult()
+    os.makedirs(cache_dir, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for image in images:
+            # Packed and generated images don't have a file GxModelViewer could read either way
+            if image.packed_file is not None or image.source != 'FILE':
+                continue
+
+            source_hash = build_pipeline.hash_file_cached(bpy.path.abspath(image.filepath_raw, library=image.library), source_hashes)
+            if source_hash is None:
+                continue
+
+            path = os.path.join(cache_dir, f"{source_hash}_{max_size}_{PREPROCESS_VERSION}.png")
+            result.paths[image.name] = path
+            if os.path.exists(path):
+                result.reused += 1
+                continue
+
+            (image_width, image_height) = image.size
+            channels = image.channels
+            if image_width == 0 or image_height == 0 or channels not in PNG_COLOR_TYPES:
+                del result.paths[image.name]
+                continue
+
+            pixels = np.empty(image_width*image_height*channels, dtype=np.float32)
+            image.pixels.foreach_get(pixels)
+            pixels = pixels.reshape(image_height, image_width, channels)
+
+            (width, height) = get_target_size(image_width, image_height, max_size)
+            # Float images are read as scene linear unless they hold non-color data
+            linear = image.is_float and image.colorspace_settings.name != 'Non-Color'
+            futures.append(executor.submit(_process_texture, pixels, width, height, path, linear))
+            result.processed += 1
+
+        for future in futures:
+            future.result()
+
+    return result
@@ -0,0 +1,103 @@
+import os
+
+from contextlib import contextmanager
+from xml.sax.saxutils import escape
+
+# Characters escaped on top of &, < and >, matching minidom
+EXTRA_ENTITIES = {'"': "&quot;"}
+
+# Writes an XML document to a file as it's generated, instead of building the whole tree in memory first.
+# Elements are written as finished ElementTree subtrees, so descriptors can keep building their elements with
+# etree.SubElement under a scratch parent, which is then flushed with write_children().
+# With an indent, the output is laid out the same way as minidom's toprettyxml().
+class StreamingXMLWriter:
+    def __init__(self, file, indent="\t"):
+        self.file = file
+        self.indent = indent
+        self.newline = "\n" if indent is not None else ""
+        self.open_tags = []
+
+    def start_document(self):
+        self.file.write('<?xml version="1.0" ?>' + self.newline)
+
+    # Opens an element, which stays open until end() is called
+    def start(self, tag, attrib=None):
+        self.file.write(self._get_indent(len(self.open_tags)) + "<" + tag + self._format_attrib(attrib) + ">" + self.newline)
+        self.open_tags.append(tag)
+
+    # Closes the most recently opened element
+    def end(self):
+        tag = self.open_tags.pop()
+        self.file.write(self._get_indent(len(self.open_tags)) + "</" + tag + ">" + self.newline)
+
+    # Writes a finished element and all of its children
+    def element(self, elem):
+        chunks = []
+        self._serialize(elem, len(self.open_tags), chunks)
+        self.file.write("".join(chunks))
+
+    # Writes all children of an element, then removes them from it so they can be freed
+    def write_children(self, parent):
+        self.file.write(self.serialize_children(parent))
+
+    # Serializes all children of an element at the current depth without writing them, then removes them from it.
+    # The returned string can be written later with write().
+    def serialize_children(self, parent):
+        chunks = []
+        for child in parent:
+            self._serialize(child, len(self.open_tags), chunks)
+        del parent[:]
+        return "".join(chunks)
+
+    # Writes already serialized XML
+    def write(self, text):
+        self.file.write(text)
+
+    def _get_indent(self, depth):
+        return self.indent*depth if self.indent is not None else ""
+
+    def _format_attrib(self, attrib):
+        if not attrib:
+            return ""
+        return "".join(f' {key}="{escape(str(value), EXTRA_ENTITIES)}"' for key, value in attrib.items())
+
+    def _serialize(self, elem, depth, chunks):
+        indent = self._get_indent(depth)
+        start_tag = "<" + elem.tag + self._format_attrib(elem.attrib)
+        text = elem.text
+
+        if len(elem) == 0:
+            if not text:
+                chunks.append(indent + start_tag + "/>" + self.newline)
+            else:
+                chunks.append(indent + start_tag + ">" + escape(text, EXTRA_ENTITIES) + "</" + elem.tag + ">" + self.newline)
+            return
+
+        # Whitespace between child elements (e.g. from a parsed, already indented file) is dropped
+        chunks.append(indent + start_tag + ">" + self.newline)
+        if text is not None and text.strip() != "":
+            chunks.append(self._get_indent(depth+1) + escape(text, EXTRA_ENTITIES) + self.newline)
+        for child in elem:
+            self._serialize(child, depth+1, chunks)
+        chunks.append(indent + "</" + elem.tag + ">" + self.newline)
+
+# Opens a streamed XML document with the given root element, closing the root element when done.
+# The document is written to a temporary file that only replaces 'path' once it has been completely written,
+# so an export that fails halfway leaves the previous file untouched.
+@contextmanager
+def open_document(path, root_tag, attrib=None, indent="\t"):
+    temp_path = path + ".tmp"
+
+    try:
+        with open(temp_path, "w") as file:
+            writer = StreamingXMLWriter(file, indent)
+            writer.start_document()
+            writer.start(root_tag, attrib)
+            yield writer
+            writer.end()
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    os.replace(temp_path, path)
@@ -6,7 +6,7 @@ import pdb
 import re
 
 from . import developer_utils
-from .BlendToSMBStage2 import stage_editor, statics, menus
+from .BlendToSMBStage2 import stage_editor, statics, menus, config_cache, material_cache, overlay_scene
 from bpy.app.handlers import persistent
 
 bl_info = {
@@ -228,6 +228,34 @@ def register():
             default=3,
             soft_min=0
     )
+    bpy.types.Scene.export_keyframe_tolerance = bpy.props.FloatProperty(
+            name="Keyframe Error Tolerance",
+            description="Maximum error allowed when removing keyframes that linear interpolation can reproduce. Only used when optimizing keyframes. 0 disables the reduction",
+            default=0.0,
+            min=0.0,
+            soft_max=1.0,
+            precision=4
+    )
+    bpy.types.Scene.export_indent_xml = bpy.props.BoolProperty(
+            name="Indent Exported XML",
+            description="Whether or not exported config and background files are indented for readability",
+            default=True
+    )
+    bpy.types.Scene.export_use_fragment_cache = bpy.props.BoolProperty(
+            name="Reuse Unchanged Object XML",
+            description="Reuse the generated XML of objects that haven't changed since the last config export, instead of regenerating it",
+            default=True
+    )
+    bpy.types.Scene.export_skip_unchanged_obj = bpy.props.BoolProperty(
+            name="Skip Unchanged OBJ",
+            description="Don't rewrite the OBJ if nothing it contains has changed since it was last exported, so GMA/TPL export can be skipped too",
+            default=True
+    )
+    bpy.types.Scene.export_use_artifact_cache = bpy.props.BoolProperty(
+            name="Cache Tool Outputs",
+            description="Reuse GMA/TPL and LZ files from earlier exports with identical inputs, instead of running GxModelViewer or Workshop 2 again",
+            default=True
+    )
     bpy.types.Scene.export_config_path = bpy.props.StringProperty(
             name="Config Export Path",
             description="The path to export the config to",
@@ -298,6 +326,50 @@ def register():
             options={'PATH_SUPPORTS_BLEND_RELATIVE'},
             default="//"
     )
+    bpy.types.Scene.export_preprocess_textures = bpy.props.BoolProperty(
+            name="Preprocess Textures",
+            description="Resize textures to power-of-two sizes no larger than the maximum texture size before GxModelViewer reads them. Processed textures are cached in the tool output cache folder",
+            default=False
+    )
+    bpy.types.Scene.export_max_texture_size = bpy.props.EnumProperty(
+            name="Max Texture Size",
+            description="The largest width or height of preprocessed textures",
+            items=[(str(size), str(size), "") for size in [64, 128, 256, 512, 1024]],
+            default='1024'
+    )
+    bpy.types.Scene.export_experimental_gma_chunks = bpy.props.BoolProperty(
+            name="Chunked GMA/TPL (Experimental)",
+            description="Convert the stage model to GMA/TPL in parallel chunks and merge them. The merge relies on GxModelViewer command line options that haven't been checked against a released build, so the merged GMA/TPL may be missing models",
+            default=False
+    )
+    bpy.types.Scene.export_gma_chunks = bpy.props.IntProperty(
+            name="GMA Chunks",
+            description="Split the stage model into this many parts, converted to GMA/TPL at the same time and merged. Parts that haven't changed are reused from the tool output cache. 1 converts the whole model at once",
+            default=1,
+            min=1,
+            max=16
+    )
+    bpy.types.Scene.export_gma_chunk_mode = bpy.props.EnumProperty(
+            name="Split By",
+            description="How the stage model is split into GMA chunks",
+            items=[('TEXTURE', "Texture", "Keep models using the same textures together, so each texture is only converted and stored once"),
+                   ('ITEM_GROUP', "Item Group", "Keep the models of each item group together. Textures used by several item groups are converted and stored in each of their chunks")],
+            default='TEXTURE'
+    )
+    bpy.types.Scene.artifact_cache_path = bpy.props.StringProperty(
+            name="Tool Output Cache Folder",
+            description="The folder GMA/TPL and LZ files are cached in. Can be shared between stages. Leave empty to use a folder in the system's temporary directory",
+            subtype='DIR_PATH',
+            options={'PATH_SUPPORTS_BLEND_RELATIVE'},
+            default=""
+    )
+    bpy.types.Scene.export_profile_log_path = bpy.props.StringProperty(
+            name="Timing Log Path",
+            description="A file to append the timings of every export to, one JSON line per export. Leave empty to not log timings",
+            subtype='FILE_PATH',
+            options={'PATH_SUPPORTS_BLEND_RELATIVE'},
+            default=""
+    )
     bpy.types.Scene.falloutProp = bpy.props.IntProperty(
             name="Fallout Plane",
             description="Height of the fallout plane",
@@ -409,6 +481,9 @@ def register():
     bpy.types.Material.mesh_preset = bpy.props.StringProperty(name="Mesh Preset",
                                         update=lambda s,c: update_preset(s, c, "mesh_preset", "MESH"))
     menus.handle_register()
+    config_cache.handle_register()
+    material_cache.handle_register()
+    overlay_scene.handle_register()
 
     bpy.app.handlers.load_post.append(load_handler)
     print("Successfully registered {} with {} modules".format(bl_info["name"], len(modules)))
@@ -418,10 +493,18 @@ def register():
 # Unregister
 def unregister():
     menus.handle_unregister()
+    config_cache.handle_unregister()
+    material_cache.handle_unregister()
+    overlay_scene.handle_unregister()
 
     del bpy.types.Scene.export_timestep
     del bpy.types.Scene.export_value_round
     del bpy.types.Scene.export_time_round
+    del bpy.types.Scene.export_keyframe_tolerance
+    del bpy.types.Scene.export_indent_xml
+    del bpy.types.Scene.export_use_fragment_cache
+    del bpy.types.Scene.export_skip_unchanged_obj
+    del bpy.types.Scene.export_use_artifact_cache
     del bpy.types.Scene.export_config_path
     del bpy.types.Scene.export_model_path
     del bpy.types.Scene.export_gma_path
@@ -432,6 +515,13 @@ def unregister():
     del bpy.types.Scene.import_gma_path
     del bpy.types.Scene.import_tpl_path
     del bpy.types.Scene.gx_preset_path
+    del bpy.types.Scene.export_preprocess_textures
+    del bpy.types.Scene.export_max_texture_size
+    del bpy.types.Scene.export_experimental_gma_chunks
+    del bpy.types.Scene.export_gma_chunks
+    del bpy.types.Scene.export_gma_chunk_mode
+    del bpy.types.Scene.artifact_cache_path
+    del bpy.types.Scene.export_profile_log_path
     del bpy.types.Scene.draw_falloutProp
     del bpy.types.Scene.draw_stage_objects
     del bpy.types.Scene.draw_collision_grid
@@ -0,0 +1,126 @@
+# Benchmark of the add-on's stagedef LZ compressor (BlendToSMBStage2/smb_lz.py).
+#
+# Usage: python benchmarks/lz_benchmark.py [--max-chain N] [--reference stage.lz ...] [stage.lz.raw ...]
+#
+# Compresses each .lz.raw given (or a generated stagedef-like file if none are), checks the result decompresses to
+# the original data, and prints the compressed size and throughput. Only needs NumPy, not Blender.
+#
+# Each --reference is a .lz written by Workshop 2 itself, checking the format against the real thing: it must
+# decompress to the .lz.raw given in the same position (if there is one), and its decompressed data is compressed and
+# decompressed again like any other input.
+
+import argparse
+import importlib.util
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+# Loads smb_lz.py on its own, as importing the add-on package needs Blender
+def load_smb_lz():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "BlendToSMBStage2", "smb_lz.py")
+    spec = importlib.util.spec_from_file_location("smb_lz", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# Returns data resembling a large uncompressed stagedef: big endian headers and offsets, float vertex and triangle
+# data with repeated values, and zero padding
+def generate_stagedef(size):
+    rng = np.random.default_rng(0)
+    parts = []
+    total = 0
+    while total < size:
+        kind = rng.integers(4)
+        if kind == 0:
+            # Collision triangles: positions on a grid, normals and angles from a small set
+            count = int(rng.integers(64, 512))
+            values = np.round(rng.normal(0, 50, (count, 16)), 1).astype(">f4")
+            values[:, 3:6] = rng.choice([0.0, 1.0, -1.0, 0.70710677], (count, 3))
+            part = values.tobytes()
+        elif kind == 1:
+            # Keyframes: time, value and tangents
+            count = int(rng.integers(16, 256))
+            times = np.arange(count, dtype=">f4") * np.float32(1 / 60)
+            values = np.cumsum(rng.normal(0, 0.1, count)).astype(">f4")
+            part = np.stack([np.ones(count, ">u4").view(">f4"), times, values, np.zeros(count, ">f4"),
+                             np.zeros(count, ">f4")], axis=1).astype(">f4").tobytes()
+        elif kind == 2:
+            # Headers of structs: counts and offsets
+            count = int(rng.integers(8, 64))
+            part = b"".join(struct.pack(">IIhhI", int(rng.integers(0, 32)), int(0x1000 + total + i * 16), 0, -1,
+                                        int(rng.integers(0, 3))) for i in range(count))
+        else:
+            # Padding
+            part = bytes(int(rng.integers(4, 128)))
+        parts.append(part)
+        total += len(part)
+    return b"".join(parts)[:size]
+
+def run(smb_lz, name, data, max_chain):
+    start = time.perf_counter()
+    compressed = smb_lz.compress(data, max_chain)
+    compress_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decompressed = smb_lz.decompress(compressed)
+    decompress_seconds = time.perf_counter() - start
+
+    if decompressed != data:
+        print(f"{name}: round trip FAILED")
+        return False
+
+    size_mb = len(data) / (1024 * 1024)
+    print(f"{name}: {len(data)} -> {len(compressed)} bytes ({len(compressed) / max(len(data), 1):.1%}), "
+          f"compress {compress_seconds:.2f}s ({size_mb / compress_seconds:.2f} MB/s), "
+          f"decompress {decompress_seconds:.2f}s ({size_mb / decompress_seconds:.2f} MB/s)")
+    return True
+
+# Returns the data of a .lz written by Workshop 2, checking it against the matching .lz.raw if there is one
+def read_reference(smb_lz, path, raw_data):
+    with open(path, "rb") as lz_file:
+        reference = lz_file.read()
+
+    name = os.path.basename(path)
+    data = smb_lz.decompress(reference)
+    if raw_data is not None and data != raw_data:
+        print(f"{name}: doesn't decompress to the matching .lz.raw")
+        return None
+
+    print(f"{name}: Workshop 2 compressed {len(data)} -> {len(reference)} bytes ({len(reference) / max(len(data), 1):.1%})")
+    return data
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stagedef LZ compressor")
+    parser.add_argument("paths", nargs="*", help="Uncompressed stagedefs (.lz.raw) to compress")
+    parser.add_argument("--reference", action="append", default=[], help="LZ written by Workshop 2 to check against")
+    parser.add_argument("--max-chain", type=int, default=None, help="Most match candidates tried per position")
+    parser.add_argument("--size", type=int, default=2 * 1024 * 1024, help="Size of the generated stagedef in bytes")
+    args = parser.parse_args()
+
+    smb_lz = load_smb_lz()
+    max_chain = args.max_chain if args.max_chain is not None else smb_lz.DEFAULT_MAX_CHAIN
+
+    inputs = []
+    for path in args.paths:
+        with open(path, "rb") as raw_file:
+            inputs.append((os.path.basename(path), raw_file.read()))
+
+    for (index, path) in enumerate(args.reference):
+        raw_data = inputs[index][1] if index < len(args.paths) else None
+        data = read_reference(smb_lz, path, raw_data)
+        if data is None:
+            sys.exit(1)
+        if raw_data is None:
+            inputs.append((os.path.basename(path), data))
+
+    if len(inputs) == 0:
+        inputs = [("generated", generate_stagedef(args.size))]
+
+    succeeded = all([run(smb_lz, name, data, max_chain) for (name, data) in inputs])
+    sys.exit(0 if succeeded else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# Benchmark of building the vertices of stage object overlays (BlendToSMBStage2/primitives.py).
+#
+# Usage: python benchmarks/overlay_benchmark.py [--objects N] [--frames N]
+#
+# Compares the cost per frame of building the collision shape overlays (detailed spheres, cylinders and cones) of
+# every object the way they used to be drawn, computing each circle point by point with math.cos/math.sin and three
+# rotation matrices per circle, against scaling the unit primitive tables and transforming every object's copy at
+# once. Also checks both give the same lines. Only needs NumPy, not Blender.
+#
+# The old path builds its matrices with mathutils when it can be imported (running with Blender's Python, or with the
+# mathutils package from PyPI installed). Otherwise plain Python matrices stand in for it, which are slower than
+# mathutils, so the speedups printed are an upper bound. In both cases the old path rotates its points on the CPU,
+# where the add-on rotated them with gpu.matrix, and neither path includes creating GPU batches, so the numbers compare
+# the cost of building vertices only.
+
+import argparse
+import importlib.util
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+try:
+    from mathutils import Matrix, Vector
+except ImportError:
+    Matrix = None
+
+# Loads primitives.py on its own, as importing the add-on package needs Blender
+def load_primitives():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "BlendToSMBStage2", "primitives.py")
+    spec = importlib.util.spec_from_file_location("primitives", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# The shapes as they used to be built on every redraw, with plain Python matrices standing in for mathutils if it
+# isn't available
+
+def legacy_rotation_matrix(euler_rot):
+    (x, y, z) = euler_rot
+    if Matrix is not None:
+        return Matrix.Rotation(x, 3, 'X') @ Matrix.Rotation(y, 3, 'Y') @ Matrix.Rotation(z, 3, 'Z')
+    x_rot = [[1, 0, 0], [0, math.cos(x), -math.sin(x)], [0, math.sin(x), math.cos(x)]]
+    y_rot = [[math.cos(y), 0, math.sin(y)], [0, 1, 0], [-math.sin(y), 0, math.cos(y)]]
+    z_rot = [[math.cos(z), -math.sin(z), 0], [math.sin(z), math.cos(z), 0], [0, 0, 1]]
+    multiply = lambda a, b: [[sum(a[i][k] * b[k][j] for k in range(3)) for j in range(3)] for i in range(3)]
+    return multiply(multiply(x_rot, y_rot), z_rot)
+
+def legacy_transform_lines(lines, matrix):
+    if Matrix is not None:
+        return [tuple(matrix @ Vector(co)) for co in lines]
+    return [tuple(sum(matrix[i][k] * co[k] for k in range(3)) for i in range(3)) for co in lines]
+
+def legacy_strip_lines(points):
+    lines = []
+    for (start, end) in zip(points, points[1:]):
+        lines.append(start)
+        lines.append(end)
+    return lines
+
+def legacy_circle_lines(pos, rot, radius, segments, radians=(2*math.pi)):
+    points = []
+    for i in range(0, segments+1):
+        segment = (i / segments)*radians
+        x = pos[0] + radius * math.cos(segment)
+        y = pos[1] + radius * math.sin(segment)
+        points.append((x, y, pos[2]))
+    return legacy_transform_lines(legacy_strip_lines(points), legacy_rotation_matrix(rot))
+
+def legacy_sphere_lines(pos, radius, detailed=False):
+    sphere_rotations = [(0,0,0), (90,0,0), (0,90,0)]
+    if detailed:
+        sphere_rotations.extend([(45,0,0), (-45,0,0), (0,45,0), (0,-45,0), (90,45,0), (90,-45,0)])
+
+    lines = []
+    for rot in sphere_rotations:
+        rot_radian = ((math.radians(rot[0]), math.radians(rot[1]), math.radians(rot[2])))
+        lines.extend(legacy_circle_lines(pos, rot_radian, radius, 32))
+    return lines
+
+def legacy_cylinder_lines(pos, rot, radius, height, segments, *, cone=False, radians=(2*math.pi)):
+    top_origin = (pos[0], pos[1], pos[2]+height)
+
+    lines = legacy_circle_lines(pos, rot, radius, segments, radians)
+    if not cone: lines.extend(legacy_circle_lines(top_origin, rot, radius, segments, radians))
+
+    coord = []
+    for i in range(0, segments+1):
+        segment = (i / segments)*radians
+        x = pos[0] + radius * math.cos(segment)
+        y = pos[1] + radius * math.sin(segment)
+        coord.append((x, y, pos[2]))
+        if cone:
+            coord.append(top_origin)
+        else:
+            coord.append((x, y, top_origin[2]))
+
+    lines.extend(legacy_transform_lines(coord, legacy_rotation_matrix(rot)))
+    return lines
+
+# Collision shapes as drawn by draw_sphere_col, draw_cylinder_col and draw_cone_col
+def get_shapes(primitives):
+    return [
+        ("sphere_col", lambda: legacy_sphere_lines((0, 0, 0), 1, detailed=True),
+                       lambda: primitives.sphere_lines((0, 0, 0), 1, detailed=True)),
+        ("cylinder_col", lambda: legacy_cylinder_lines((0, 0, -0.5), (0, 0, 0), 1, 1, 16),
+                         lambda: primitives.cylinder_lines((0, 0, -0.5), (0, 0, 0), 1, 1, 16)),
+        ("cone_col", lambda: legacy_cylinder_lines((0, 0, 0), (0, 0, 0), 1, 1, 16, cone=True),
+                     lambda: primitives.cylinder_lines((0, 0, 0), (0, 0, 0), 1, 1, 16, cone=True)),
+    ]
+
+# Returns random model matrices (rotation, scale and translation) for 'count' objects
+def generate_matrices(count):
+    rng = np.random.default_rng(0)
+    matrices = np.zeros((count, 4, 4))
+    for (i, (angles, scale, pos)) in enumerate(zip(rng.uniform(-math.pi, math.pi, (count, 3)),
+                                                   rng.uniform(0.5, 4, (count, 3)),
+                                                   rng.uniform(-200, 200, (count, 3)))):
+        matrices[i, :3, :3] = np.array(legacy_rotation_matrix(angles)) * scale
+        matrices[i, :3, 3] = pos
+        matrices[i, 3, 3] = 1
+    return matrices
+
+def run(primitives, name, build_legacy, build_table, matrices, frames):
+    legacy = np.array(build_legacy(), dtype=np.float32)
+    table = build_table()
+    if legacy.shape != table.shape or not np.allclose(legacy, table, atol=1e-5):
+        print(f"{name}: tables don't match the old shapes")
+        return False
+
+    # Before: every object's shape was built again on every frame
+    start = time.perf_counter()
+    for _ in range(frames):
+        for _ in range(len(matrices)):
+            build_legacy()
+    legacy_seconds = (time.perf_counter() - start) / frames
+
+    # After: the shape comes from the tables, and every object's copy is transformed at once
+    start = time.perf_counter()
+    for _ in range(frames):
+        primitives.transform_instances(build_table(), matrices)
+    table_seconds = (time.perf_counter() - start) / frames
+
+    print(f"{name}: {len(table)} vertices x {len(matrices)} objects, "
+          f"before {legacy_seconds * 1000:.2f} ms/frame, after {table_seconds * 1000:.2f} ms/frame "
+          f"({legacy_seconds / table_seconds:.0f}x)")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark building the vertices of stage object overlays")
+    parser.add_argument("--objects", type=int, default=500, help="Objects of each shape drawn per frame")
+    parser.add_argument("--frames", type=int, default=5, help="Frames to time")
+    args = parser.parse_args()
+
+    primitives = load_primitives()
+    if Matrix is None:
+        print("mathutils not found, the old path uses plain Python matrices: speedups are an upper bound")
+    matrices = generate_matrices(args.objects)
+
+    succeeded = all([run(primitives, name, build_legacy, build_table, matrices, args.frames)
+                     for (name, build_legacy, build_table) in get_shapes(primitives)])
+    sys.exit(0 if succeeded else 1)
+
+if __name__ == "__main__":
+    main()